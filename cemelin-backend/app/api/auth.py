@@ -1,28 +1,54 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.deps import get_db, create_access_token, get_current_user
+from app.deps import (
+    get_db, get_async_db, create_access_token, get_current_principal, get_current_user,
+    get_password_hasher, get_principal_cache
+)
 from app.models.user import User
 from app.schemas.user import (
     UserCreate, User as UserSchema, Token, PasswordReset,
-    EmailVerify, ChangePassword
+    EmailVerify, ChangePassword, Principal
 )
-from passlib.context import CryptContext
+from app.services.cache import LRUCache
+from app.services.passwords import PasswordHasher, PasswordHasherBusy
 import secrets
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+def _busy(e: PasswordHasherBusy) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many authentication requests, please retry shortly",
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+async def get_password_hash(hasher: PasswordHasher, password: str) -> str:
+    try:
+        return await hasher.hash(password)
+    except PasswordHasherBusy as e:
+        raise _busy(e)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(hasher: PasswordHasher, plain_password: str, hashed_password: str) -> bool:
+    try:
+        return await hasher.verify(plain_password, hashed_password)
+    except PasswordHasherBusy as e:
+        raise _busy(e)
+
+async def verify_and_update_password(
+    hasher: PasswordHasher, plain_password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    try:
+        return await hasher.verify_and_update(plain_password, hashed_password)
+    except PasswordHasherBusy as e:
+        raise _busy(e)
 
 def generate_token() -> str:
     return secrets.token_urlsafe(32)
@@ -42,13 +68,14 @@ def send_password_reset_email(email: str, token: str):
     logger.info(f"Password reset email would be sent to {email} with token {token}")
 
 @router.post("/register", response_model=UserSchema)
-def register(
+async def register(
     *,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
+    hasher: PasswordHasher = Depends(get_password_hasher),
     user_in: UserCreate,
     background_tasks: BackgroundTasks
 ):
-    user = db.query(User).filter(User.email == user_in.email).first()
+    user = await db.scalar(select(User).where(User.email == user_in.email))
     if user:
         raise HTTPException(
             status_code=400,
@@ -59,14 +86,14 @@ def register(
     user = User(
         email=user_in.email,
         username=user_in.username,
-        hashed_password=get_password_hash(user_in.password),
+        hashed_password=await get_password_hash(hasher, user_in.password),
         full_name=user_in.full_name,
         verification_token=verification_token,
         is_active=False  # User starts as inactive until email is verified
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     
     # Send verification email in background
     background_tasks.add_task(send_verification_email, user.email, verification_token)
@@ -74,13 +101,17 @@ def register(
     return user
 
 @router.post("/login", response_model=Token)
-def login(
+async def login(
     *,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
+    hasher: PasswordHasher = Depends(get_password_hasher),
     form_data: OAuth2PasswordRequestForm = Depends()
 ):
-    user = db.query(User).filter(User.email == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    user = await db.scalar(select(User).where(User.email == form_data.username))
+    verified, new_hash = False, None
+    if user:
+        verified, new_hash = await verify_and_update_password(hasher, form_data.password, user.hashed_password)
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -94,7 +125,10 @@ def login(
     
     # Update last login timestamp
     user.last_login = datetime.utcnow()
-    db.commit()
+    if new_hash:
+        # Stored with an outdated scheme or cost; upgrade while we have the password
+        user.hashed_password = new_hash
+    await db.commit()
     
     return {
         "access_token": create_access_token(user.id),
@@ -144,11 +178,17 @@ def forgot_password(
     return {"message": "If the email exists, a password reset link will be sent"}
 
 @router.post("/reset-password")
-def reset_password(*, db: Session = Depends(get_db), reset_data: PasswordReset):
-    user = db.query(User).filter(
+async def reset_password(
+    *,
+    db: AsyncSession = Depends(get_async_db),
+    hasher: PasswordHasher = Depends(get_password_hasher),
+    principals: LRUCache = Depends(get_principal_cache),
+    reset_data: PasswordReset
+):
+    user = await db.scalar(select(User).where(
         User.email == reset_data.email,
         User.reset_token == reset_data.token
-    ).first()
+    ))
     
     if not user or not user.reset_token_expires or user.reset_token_expires < datetime.utcnow():
         raise HTTPException(
@@ -156,11 +196,13 @@ def reset_password(*, db: Session = Depends(get_db), reset_data: PasswordReset):
             detail="Invalid or expired reset token",
         )
     
-    user.hashed_password = get_password_hash(reset_data.new_password)
+    user.hashed_password = await get_password_hash(hasher, reset_data.new_password)
     user.reset_token = None
     user.reset_token_expires = None
     user.password_changed_at = datetime.utcnow()
-    db.commit()
+    await db.commit()
+    # Tokens issued before the reset stop working on this worker right away
+    principals.delete(user.id)
     
     return {"message": "Password reset successfully"}
 
@@ -169,20 +211,24 @@ def get_current_user_info(current_user: User = Depends(get_current_user)):
     return current_user
 
 @router.post("/change-password")
-def change_password(
+async def change_password(
     *,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
+    hasher: PasswordHasher = Depends(get_password_hasher),
+    principals: LRUCache = Depends(get_principal_cache),
     password_data: ChangePassword,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
-    if not verify_password(password_data.current_password, current_user.hashed_password):
+    user = await db.get(User, current_user.id)
+    if not await verify_password(hasher, password_data.current_password, user.hashed_password):
         raise HTTPException(
             status_code=400,
             detail="Incorrect password",
         )
     
-    current_user.hashed_password = get_password_hash(password_data.new_password)
-    current_user.password_changed_at = datetime.utcnow()
-    db.commit()
+    user.hashed_password = await get_password_hash(hasher, password_data.new_password)
+    user.password_changed_at = datetime.utcnow()
+    await db.commit()
+    principals.delete(user.id)
     
     return {"message": "Password changed successfully"}
@@ -14,7 +14,7 @@ class ContactMessage(BaseModel):
     email: EmailStr
     subject: constr(min_length=3, max_length=200)
     message: constr(min_length=10, max_length=2000)
-    phone: Optional[constr(regex=r'^\+?[1-9]\d{1,14}$')] = None
+    phone: Optional[constr(pattern=r'^\+?[1-9]\d{1,14}$')] = None
     locale: str = "en"  # Default to English
 
 class ContactResponse(BaseModel):
@@ -1,26 +1,44 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List, Optional
-import googlemaps
-from app.deps import get_db, get_current_user
+import asyncio
+from app.database import async_session
+from app.deps import (
+    get_db, get_async_db, get_cluster_index, get_current_principal, get_places_client, get_read_counter, get_single_flight
+)
 from app.models.destination import Destination
-from app.models.user import User
+from app.schemas.user import Principal
 from app.schemas.destination import (
     DestinationCreate,
     Destination as DestinationSchema,
+    DestinationNearby,
     DestinationSearch,
     PlaceDetails,
     Activity
 )
+from app.services import geo
+from app.services.clustering import ClusterIndexCache
+from app.services.governor import UpstreamUnavailable
+from app.services.photos import photo_proxy_paths, photo_proxy_urls, photo_refs
+from app.services.places import PlacesClient
+from app.services.refresh import ReadCounter, all_groups_refreshed, next_refresh_time
+from app.services.singleflight import SingleFlight
 from app.config import settings
 
 router = APIRouter()
-gmaps = googlemaps.Client(key=settings.GOOGLE_MAPS_API_KEY)
+
+SEARCH_DETAIL_FIELDS = ["name", "formatted_address", "geometry", "rating", "photos",
+                        "opening_hours", "price_level", "website", "formatted_phone_number"]
+DESTINATION_DETAIL_FIELDS = SEARCH_DETAIL_FIELDS + ["reviews", "address_components"]
 
 @router.get("/search", response_model=List[PlaceDetails])
 async def search_destinations(
     *,
     db: Session = Depends(get_db),
+    places: PlacesClient = Depends(get_places_client),
     query: str = Query(..., min_length=1),
     latitude: Optional[float] = None,
     longitude: Optional[float] = None,
@@ -30,7 +48,7 @@ async def search_destinations(
     try:
         # Search using Google Places API
         location = None if latitude is None or longitude is None else {"lat": latitude, "lng": longitude}
-        places_result = gmaps.places(
+        places_result = await places.text_search(
             query,
             location=location,
             radius=radius,
@@ -38,117 +56,162 @@ async def search_destinations(
             type="tourist_attraction"
         )
 
-        results = []
-        for place in places_result.get("results", [])[:limit]:
-            # Get detailed place information
-            place_details = gmaps.place(
-                place["place_id"],
-                fields=["name", "formatted_address", "geometry", "rating", "photos",
-                       "opening_hours", "price_level", "website", "formatted_phone_number"]
-            )["result"]
-
-            # Get photo URLs if available
-            photos = []
-            if "photos" in place_details:
-                for photo in place_details["photos"][:5]:  # Limit to 5 photos
-                    try:
-                        photo_url = gmaps.places_photo(
-                            photo["photo_reference"],
-                            max_width=800
-                        )
-                        photos.append(photo_url)
-                    except Exception:
-                        continue
-
-            result = PlaceDetails(
+        async def enrich(place: dict) -> PlaceDetails:
+            # Details for every result are fetched concurrently; photos are served through /photos
+            place_details = await places.place_details(place["place_id"], fields=SEARCH_DETAIL_FIELDS)
+            photos = photo_proxy_urls(place_details.get("photos", []))
+            return PlaceDetails(
                 place_id=place["place_id"],
                 name=place["name"],
                 formatted_address=place["formatted_address"],
-                geometry=place["geometry"],
+                geometry={"location": place["geometry"]["location"]},
                 rating=place_details.get("rating"),
                 photos=photos,
+                photo_refs=photo_refs(place_details.get("photos", [])),
                 opening_hours=place_details.get("opening_hours"),
                 price_level=place_details.get("price_level"),
                 website=place_details.get("website"),
                 formatted_phone_number=place_details.get("formatted_phone_number")
             )
-            results.append(result)
 
-        return results
+        return await asyncio.gather(*(enrich(place) for place in places_result[:limit]))
+    except UpstreamUnavailable:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _fetch_and_store_destination(places: PlacesClient, place_id: str) -> int:
+    """Fetch a place from Google and insert it, returning the destination id"""
+    # Get place details from Google Places API
+    place_details = await places.place_details(place_id, fields=DESTINATION_DETAIL_FIELDS)
+    # Stored relative; responses make them absolute
+    photos = photo_proxy_paths(place_details.get("photos", []))
+
+    # Extract country and city from address components
+    country = ""
+    city = ""
+    for component in place_details.get("address_components", []):
+        if "country" in component["types"]:
+            country = component["long_name"]
+        elif "locality" in component["types"]:
+            city = component["long_name"]
+
+    # Create new destination
+    refreshed = all_groups_refreshed()
+    destination = Destination(
+        name=place_details["name"],
+        description="",  # To be filled by admin
+        short_description="",  # To be filled by admin
+        place_id=place_id,
+        formatted_address=place_details["formatted_address"],
+        latitude=place_details["geometry"]["location"]["lat"],
+        longitude=place_details["geometry"]["location"]["lng"],
+        country=country,
+        city=city,
+        rating=place_details.get("rating"),
+        reviews_count=len(place_details.get("reviews", [])),
+        price_level=place_details.get("price_level"),
+        website=place_details.get("website"),
+        phone_number=place_details.get("formatted_phone_number"),
+        opening_hours=place_details.get("opening_hours"),
+        activities=[],  # To be filled by admin
+        refreshed_at=refreshed,
+        next_refresh_at=next_refresh_time(refreshed)
+    )
+
+    # Get photos
+    if photos:
+        destination.images = photos
+        destination.image_url = photos[0]
+
+    # The flight outlives any single request, so it uses its own session
+    async with async_session() as session:
+        session.add(destination)
+        try:
+            await session.commit()
+        except IntegrityError:
+            # Another worker inserted the same place_id first
+            await session.rollback()
+            return await session.scalar(
+                select(Destination.id).where(Destination.place_id == place_id)
+            )
+        return destination.id
+
+@router.get("/nearby", response_model=List[DestinationNearby])
+def get_nearby_destinations(
+    *,
+    db: Session = Depends(get_db),
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius: float = Query(5000, gt=0, le=100000, description="Radius in meters"),
+    limit: int = Query(50, ge=1, le=200)
+):
+    """Stored destinations within `radius` meters of a point, nearest first"""
+    candidates = db.scalars(
+        select(Destination).where(geo.cells_clause(Destination.geohash, geo.covering_cells(
+            geo.bbox_around(lat, lng, radius)
+        )))
+    )
+    return [
+        DestinationNearby(**DestinationSchema.model_validate(destination).model_dump(), distance=distance)
+        for destination, distance in geo.filter_nearby(candidates, lat, lng, radius, limit)
+    ]
+
+@router.get("/within", response_model=List[DestinationSchema])
+def get_destinations_within(
+    *,
+    db: Session = Depends(get_db),
+    south: float = Query(..., ge=-90, le=90),
+    west: float = Query(..., ge=-180, le=180),
+    north: float = Query(..., ge=-90, le=90),
+    east: float = Query(..., ge=-180, le=180),
+    limit: int = Query(100, ge=1, le=500)
+):
+    """Stored destinations inside a bounding box; west > east crosses the antimeridian"""
+    if north < south:
+        raise HTTPException(status_code=400, detail="north must not be below south")
+    bbox = (south, west, north, east)
+    candidates = db.scalars(
+        select(Destination).where(geo.cells_clause(Destination.geohash, geo.covering_cells(bbox)))
+    )
+    return geo.filter_within(candidates, bbox, limit)
+
 @router.get("/{place_id}", response_model=DestinationSchema)
 async def get_destination(
     *,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
+    places: PlacesClient = Depends(get_places_client),
+    flights: SingleFlight = Depends(get_single_flight),
+    reads: ReadCounter = Depends(get_read_counter),
+    clusters: ClusterIndexCache = Depends(get_cluster_index),
     place_id: str
 ):
+    """
+    Destinations are always read from the database. A missing place is
+    fetched once; stored ones are kept fresh by the background refresher.
+    """
     # First check if destination exists in database
-    destination = db.query(Destination).filter(Destination.place_id == place_id).first()
+    destination = await db.scalar(select(Destination).where(Destination.place_id == place_id))
     
     if not destination:
+        # Hand the connection back to the pool while waiting on Google
+        await db.rollback()
         try:
-            # Get place details from Google Places API
-            place_details = gmaps.place(
-                place_id,
-                fields=["name", "formatted_address", "geometry", "rating", "photos",
-                       "opening_hours", "price_level", "website", "formatted_phone_number",
-                       "reviews", "address_components"]
-            )["result"]
-
-            # Extract country and city from address components
-            country = ""
-            city = ""
-            for component in place_details.get("address_components", []):
-                if "country" in component["types"]:
-                    country = component["long_name"]
-                elif "locality" in component["types"]:
-                    city = component["long_name"]
-
-            # Create new destination
-            destination = Destination(
-                name=place_details["name"],
-                description="",  # To be filled by admin
-                short_description="",  # To be filled by admin
-                place_id=place_id,
-                formatted_address=place_details["formatted_address"],
-                latitude=place_details["geometry"]["location"]["lat"],
-                longitude=place_details["geometry"]["location"]["lng"],
-                country=country,
-                city=city,
-                rating=place_details.get("rating"),
-                reviews_count=len(place_details.get("reviews", [])),
-                price_level=place_details.get("price_level"),
-                website=place_details.get("website"),
-                phone_number=place_details.get("formatted_phone_number"),
-                opening_hours=place_details.get("opening_hours"),
-                activities=[]  # To be filled by admin
+            # Concurrent requests for the same place share one fetch and one insert
+            destination_id = await flights.do(
+                f"destination:{place_id}",
+                lambda: _fetch_and_store_destination(places, place_id)
             )
-
-            # Get photos
-            if "photos" in place_details:
-                photos = []
-                for photo in place_details["photos"][:5]:
-                    try:
-                        photo_url = gmaps.places_photo(
-                            photo["photo_reference"],
-                            max_width=800
-                        )
-                        photos.append(photo_url)
-                    except Exception:
-                        continue
-                destination.images = photos
-                if photos:
-                    destination.image_url = photos[0]
-
-            db.add(destination)
-            db.commit()
-            db.refresh(destination)
-
+            destination = await db.get(Destination, destination_id)
+            # Clustered markers include it from the next request on
+            clusters.invalidate()
+        except UpstreamUnavailable:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
+    # Frequently read destinations are refreshed first
+    reads.hit(destination.id)
     return destination
 
 @router.get("/{destination_id}", response_model=DestinationSchema)
@@ -163,12 +226,14 @@ def create_destination(
     *,
     db: Session = Depends(get_db),
     destination_in: DestinationCreate,
-    current_user: User = Depends(get_current_user)
+    clusters: ClusterIndexCache = Depends(get_cluster_index),
+    current_user: Principal = Depends(get_current_principal)
 ):
     if not current_user.is_superuser:
         raise HTTPException(status_code=403, detail="Not enough permissions")
     destination = Destination(**destination_in.model_dump())
     db.add(destination)
     db.commit()
+    clusters.invalidate()
     db.refresh(destination)
     return destination
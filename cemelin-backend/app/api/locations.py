@@ -1,20 +1,50 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+import asyncio
 import httpx
-from app.deps import get_db, get_settings
+from app.deps import get_db, get_settings, get_places_client, get_autocomplete_cache
 from app.schemas.location import LocationSearch, LocationSearchResult, LocationDetails, Coordinates
+from app.services.autocomplete import AutocompleteCache
+from app.services.photos import photo_proxy_urls, photo_refs
+from app.services.governor import UpstreamUnavailable, is_degraded
+from app.services.places import PlacesClient, PlacesError
 from datetime import datetime
 import logging
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+SEARCH_DETAIL_FIELDS = ["name", "formatted_address", "geometry", "type", "photos",
+                        "rating", "user_ratings_total"]
+
+async def _search_result(places: PlacesClient, place_id: str, language: str) -> Optional[LocationSearchResult]:
+    try:
+        place = await places.place_details(place_id, fields=SEARCH_DETAIL_FIELDS, language=language)
+    except PlacesError:
+        return None
+
+    return LocationSearchResult(
+        place_id=place_id,
+        name=place["name"],
+        formatted_address=place["formatted_address"],
+        coordinates=Coordinates(
+            lat=place["geometry"]["location"]["lat"],
+            lng=place["geometry"]["location"]["lng"]
+        ),
+        types=place.get("types", []),
+        photo_reference=place.get("photos", [{}])[0].get("photo_reference"),
+        rating=place.get("rating"),
+        user_ratings_total=place.get("user_ratings_total")
+    )
+
 @router.get("/search", response_model=List[LocationSearchResult])
 async def search_locations(
     *,
     db: Session = Depends(get_db),
     settings = Depends(get_settings),
+    places: PlacesClient = Depends(get_places_client),
+    autocomplete_cache: AutocompleteCache = Depends(get_autocomplete_cache),
     query: str = Query(..., min_length=2),
     language: str = Query("en", regex="^(en|id)$")  # Only allow English and Indonesian
 ):
@@ -22,67 +52,41 @@ async def search_locations(
     Search for locations using Google Places API with autocomplete support.
     """
     try:
-        if not settings.google_places_api_key:
+        if not settings.GOOGLE_PLACES_API_KEY:
             raise HTTPException(
                 status_code=500,
                 detail="Google Places API key not configured"
             )
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://maps.googleapis.com/maps/api/place/autocomplete/json",
-                params={
-                    "input": query,
-                    "key": settings.google_places_api_key,
-                    "language": language,
-                    "types": "(cities)"  # Focus on cities for travel destinations
-                }
-            )
-            response.raise_for_status()
-            data = response.json()
-
-            if data["status"] != "OK":
-                logger.error(f"Google Places API error: {data['status']}")
-                raise HTTPException(
-                    status_code=500,
-                    detail="Error fetching location suggestions"
+        # Repeated and extended prefixes are answered from the autocomplete cache
+        predictions = autocomplete_cache.get(query, language, types="(cities)")
+        if predictions is None:
+            try:
+                predictions = await places.autocomplete(
+                    query,
+                    language=language,
+                    types="(cities)"  # Focus on cities for travel destinations
                 )
+                autocomplete_cache.set(query, language, predictions, types="(cities)")
+            except Exception as e:
+                predictions = autocomplete_cache.get_stale(query, language, types="(cities)") if is_degraded(e) else None
+                if predictions is None:
+                    raise
 
-            # Get details for each place
-            results = []
-            for prediction in data["predictions"]:
-                place_id = prediction["place_id"]
-                details_response = await client.get(
-                    "https://maps.googleapis.com/maps/api/place/details/json",
-                    params={
-                        "place_id": place_id,
-                        "key": settings.google_places_api_key,
-                        "language": language,
-                        "fields": "name,formatted_address,geometry,type,photos,rating,user_ratings_total"
-                    }
-                )
-                details_response.raise_for_status()
-                place_data = details_response.json()
-
-                if place_data["status"] == "OK":
-                    place = place_data["result"]
-                    results.append(LocationSearchResult(
-                        place_id=place_id,
-                        name=place["name"],
-                        formatted_address=place["formatted_address"],
-                        coordinates=Coordinates(
-                            lat=place["geometry"]["location"]["lat"],
-                            lng=place["geometry"]["location"]["lng"]
-                        ),
-                        types=place.get("types", []),
-                        photo_reference=place.get("photos", [{}])[0].get("photo_reference"),
-                        rating=place.get("rating"),
-                        user_ratings_total=place.get("user_ratings_total")
-                    ))
-
-            return results
+        # Details come from the Place Details cache when possible, fetched concurrently otherwise
+        results = await asyncio.gather(
+            *(_search_result(places, prediction["place_id"], language) for prediction in predictions)
+        )
+        return [result for result in results if result is not None]
 
-    except httpx.RequestError as e:
+    except (HTTPException, UpstreamUnavailable):
+        raise
+    except PlacesError:
+        raise HTTPException(
+            status_code=500,
+            detail="Error fetching location suggestions"
+        )
+    except httpx.HTTPError as e:
         logger.error(f"Error making request to Google Places API: {str(e)}")
         raise HTTPException(
             status_code=500,
@@ -100,6 +104,7 @@ async def get_location_details(
     *,
     db: Session = Depends(get_db),
     settings = Depends(get_settings),
+    places: PlacesClient = Depends(get_places_client),
     place_id: str,
     language: str = Query("en", regex="^(en|id)$")
 ):
@@ -107,68 +112,51 @@ async def get_location_details(
     Get detailed information about a specific location.
     """
     try:
-        if not settings.google_places_api_key:
+        if not settings.GOOGLE_PLACES_API_KEY:
             raise HTTPException(
                 status_code=500,
                 detail="Google Places API key not configured"
             )
 
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://maps.googleapis.com/maps/api/place/details/json",
-                params={
-                    "place_id": place_id,
-                    "key": settings.google_places_api_key,
-                    "language": language,
-                    "fields": "name,formatted_address,geometry,type,photos,rating,user_ratings_total,website,formatted_phone_number,opening_hours,price_level"
-                }
-            )
-            response.raise_for_status()
-            data = response.json()
-
-            if data["status"] != "OK":
-                logger.error(f"Google Places API error: {data['status']}")
-                raise HTTPException(
-                    status_code=404 if data["status"] == "ZERO_RESULTS" else 500,
-                    detail="Location not found" if data["status"] == "ZERO_RESULTS" else "Error fetching location details"
-                )
-
-            place = data["result"]
-            photos = []
-            if "photos" in place:
-                for photo in place["photos"][:5]:  # Limit to 5 photos
-                    photo_response = await client.get(
-                        "https://maps.googleapis.com/maps/api/place/photo",
-                        params={
-                            "maxwidth": 800,
-                            "photo_reference": photo["photo_reference"],
-                            "key": settings.google_places_api_key
-                        }
-                    )
-                    if photo_response.status_code == 200:
-                        photos.append(photo_response.url)
+        place = await places.place_details(
+            place_id,
+            fields=["name", "formatted_address", "geometry", "type", "photos", "rating",
+                    "user_ratings_total", "website", "formatted_phone_number",
+                    "opening_hours", "price_level"],
+            language=language
+        )
+        # Served through /photos, so nothing is fetched from Google here
+        photos = photo_proxy_urls(place.get("photos", []))
 
-            return LocationDetails(
-                place_id=place_id,
-                name=place["name"],
-                formatted_address=place["formatted_address"],
-                coordinates=Coordinates(
-                    lat=place["geometry"]["location"]["lat"],
-                    lng=place["geometry"]["location"]["lng"]
-                ),
-                types=place.get("types", []),
-                photos=photos,
-                rating=place.get("rating"),
-                user_ratings_total=place.get("user_ratings_total"),
-                website=place.get("website"),
-                formatted_phone_number=place.get("formatted_phone_number"),
-                opening_hours=place.get("opening_hours", {}).get("weekday_text", []),
-                price_level=place.get("price_level"),
-                created_at=datetime.utcnow(),
-                updated_at=datetime.utcnow()
-            )
+        return LocationDetails(
+            place_id=place_id,
+            name=place["name"],
+            formatted_address=place["formatted_address"],
+            coordinates=Coordinates(
+                lat=place["geometry"]["location"]["lat"],
+                lng=place["geometry"]["location"]["lng"]
+            ),
+            types=place.get("types", []),
+            photos=photos,
+            photo_refs=photo_refs(place.get("photos", [])),
+            rating=place.get("rating"),
+            user_ratings_total=place.get("user_ratings_total"),
+            website=place.get("website"),
+            formatted_phone_number=place.get("formatted_phone_number"),
+            opening_hours=place.get("opening_hours", {}).get("weekday_text", []),
+            price_level=place.get("price_level"),
+            created_at=datetime.utcnow(),
+            updated_at=datetime.utcnow()
+        )
 
-    except httpx.RequestError as e:
+    except (HTTPException, UpstreamUnavailable):
+        raise
+    except PlacesError as e:
+        raise HTTPException(
+            status_code=404 if e.status in ("ZERO_RESULTS", "NOT_FOUND") else 500,
+            detail="Location not found" if e.status in ("ZERO_RESULTS", "NOT_FOUND") else "Error fetching location details"
+        )
+    except httpx.HTTPError as e:
         logger.error(f"Error making request to Google Places API: {str(e)}")
         raise HTTPException(
             status_code=500,
@@ -1,116 +1,245 @@
 from fastapi import APIRouter, HTTPException, Depends
-from typing import List, Optional
-from app.schemas.location import Coordinates, MapMarker, MapBounds
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Optional, Tuple, Union
+from app.deps import get_async_db, get_cluster_index, get_marker_tile_cache, get_places_client
+from app.models.destination import Destination
+from app.schemas.location import Coordinates, MapMarker, MapBounds, MarkerCluster, StaticMapBatch
+from app.services import geo
+from app.services.clustering import ClusterIndexCache, cluster_markers
+from app.services.governor import UpstreamUnavailable
+from app.services.places import PlacesClient, PlacesError
+from app.services.tiles import MarkerTileCache, zoom_for_bbox
 from app.config import settings
+import asyncio
 import httpx
 
 router = APIRouter()
 
-@router.post("/markers", response_model=List[MapMarker])
-async def get_location_markers(bounds: MapBounds):
+# Without an explicit zoom, assume a viewport about two tiles across
+DEFAULT_VIEW_TILES = 4
+
+async def _local_markers(db: AsyncSession, bounds: MapBounds) -> List[MapMarker]:
+    """Markers for stored destinations inside the bounds, nearest first"""
+    lat, lng = bounds.center.lat, bounds.center.lng
+    candidates = await db.scalars(
+        select(Destination).where(geo.cells_clause(Destination.geohash, geo.covering_cells(
+            geo.bbox_around(lat, lng, bounds.radius)
+        )))
+    )
+    return [
+        MapMarker(
+            lat=destination.latitude,
+            lng=destination.longitude,
+            title=destination.name,
+            place_id=destination.place_id,
+            rating=destination.rating
+        )
+        for destination, _ in geo.filter_nearby(
+            candidates, lat, lng, bounds.radius, settings.markers_local_limit
+        )
+    ]
+
+async def _stored_markers(db: AsyncSession) -> List[MapMarker]:
+    """Every stored destination with coordinates, for the cluster index"""
+    rows = await db.execute(
+        select(
+            Destination.latitude, Destination.longitude, Destination.name,
+            Destination.place_id, Destination.rating
+        ).where(Destination.latitude.is_not(None), Destination.longitude.is_not(None))
+    )
+    return [
+        MapMarker(lat=lat, lng=lng, title=name, place_id=place_id, rating=rating)
+        for lat, lng, name, place_id, rating in rows
+    ]
+
+@router.post("/markers", response_model=List[Union[MapMarker, MarkerCluster]])
+async def get_location_markers(
+    bounds: MapBounds,
+    db: AsyncSession = Depends(get_async_db),
+    places: PlacesClient = Depends(get_places_client),
+    tiles: MarkerTileCache = Depends(get_marker_tile_cache),
+    clusters: ClusterIndexCache = Depends(get_cluster_index)
+):
     """
     Get location markers within the specified map bounds.
     This endpoint is used for displaying pins on the map interface.
+
+    Areas we already cover with stored destinations are answered locally;
+    Nearby Search is only used for sparsely covered areas, one cached call
+    per map tile under the requested circle.
+
+    With `cluster` set, markers sharing a grid cell at the requested zoom
+    come back as one MarkerCluster with their centroid and count.
     """
-    if not settings.google_places_api_key:
+    bbox = geo.bbox_around(bounds.center.lat, bounds.center.lng, bounds.radius)
+    zoom = bounds.zoom if bounds.zoom is not None else zoom_for_bbox(bbox, DEFAULT_VIEW_TILES)
+
+    if bounds.cluster:
+        index = await clusters.get(lambda: _stored_markers(db))
+        items = index.query(bbox, zoom)
+        stored = sum(item.count if isinstance(item, MarkerCluster) else 1 for item in items)
+        if stored >= settings.markers_local_min_results:
+            return items
+
+    local = await _local_markers(db, bounds)
+    if not bounds.cluster and len(local) >= settings.markers_local_min_results:
+        return local
+    # Hand the connection back to the pool while waiting on Google
+    await db.rollback()
+
+    if not settings.GOOGLE_PLACES_API_KEY:
         raise HTTPException(
             status_code=500,
             detail="Google Places API key not configured"
         )
-    
+
     try:
-        async with httpx.AsyncClient() as client:
-            # Use the Places API to search for places within the bounds
-            url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
-            params = {
-                "key": settings.google_places_api_key,
-                "location": f"{bounds.center.lat},{bounds.center.lng}",
-                "radius": bounds.radius,  # in meters
-                "type": "tourist_attraction"
-            }
-            
-            response = await client.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            if data.get("status") != "OK":
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Google Places API error: {data.get('status')}"
-                )
-            
-            markers = []
-            for result in data.get("results", []):
-                location = result.get("geometry", {}).get("location", {})
-                markers.append(MapMarker(
-                    lat=location.get("lat"),
-                    lng=location.get("lng"),
-                    title=result.get("name"),
-                    place_id=result.get("place_id"),
-                    rating=result.get("rating"),
-                    icon=result.get("icon")
-                ))
-            
-            return markers
-            
-    except httpx.RequestError as e:
+        # Use the Places API, through the tile cache, to search within the bounds
+        results = await tiles.search(
+            places,
+            bounds.center.lat,
+            bounds.center.lng,
+            bounds.radius  # in meters
+        )
+
+        markers = []
+        for result in results:
+            location = result.get("geometry", {}).get("location", {})
+            markers.append(MapMarker(
+                lat=location.get("lat"),
+                lng=location.get("lng"),
+                title=result.get("name"),
+                place_id=result.get("place_id"),
+                rating=result.get("rating"),
+                icon=result.get("icon")
+            ))
+
+        # Keep stored destinations Google did not return
+        seen = {marker.place_id for marker in markers}
+        markers.extend(marker for marker in local if marker.place_id not in seen)
+        if bounds.cluster:
+            return cluster_markers(markers, bbox, zoom)
+        return markers
+
+    except PlacesError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        )
+    except httpx.HTTPError as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error fetching location markers: {str(e)}"
         )
 
+def _static_map_url(lat: float, lng: float, width: int, height: int, zoom: int) -> str:
+    return (
+        f"https://maps.googleapis.com/maps/api/staticmap?"
+        f"center={lat},{lng}&"
+        f"zoom={zoom}&size={width}x{height}&"
+        f"markers=color:red%7C{lat},{lng}&"
+        f"key={settings.GOOGLE_PLACES_API_KEY}"
+    )
+
+async def _known_coordinates(
+    db: AsyncSession,
+    places: PlacesClient,
+    place_ids: List[str]
+) -> Dict[str, Tuple[float, float]]:
+    """Coordinates from stored destinations, then from the place cache"""
+    rows = await db.execute(
+        select(Destination.place_id, Destination.latitude, Destination.longitude).where(
+            Destination.place_id.in_(place_ids),
+            Destination.latitude.is_not(None),
+            Destination.longitude.is_not(None)
+        )
+    )
+    found = {place_id: (lat, lng) for place_id, lat, lng in rows}
+    # Hand the connection back to the pool before any upstream call
+    await db.rollback()
+
+    missing = [place_id for place_id in place_ids if place_id not in found]
+    cached = await asyncio.gather(*(places.cached_coordinates(place_id) for place_id in missing))
+    found.update(
+        (place_id, coordinates) for place_id, coordinates in zip(missing, cached)
+        if coordinates is not None
+    )
+    return found
+
 @router.get("/static-map/{place_id}", response_model=str)
-async def get_static_map_url(place_id: str, width: int = 600, height: int = 400, zoom: int = 15):
+async def get_static_map_url(
+    place_id: str,
+    width: int = 600,
+    height: int = 400,
+    zoom: int = 15,
+    db: AsyncSession = Depends(get_async_db),
+    places: PlacesClient = Depends(get_places_client)
+):
     """
     Generate a static map URL for a specific location.
     This is useful for generating map previews in the UI.
+
+    Coordinates come from the stored destination or the place cache when
+    available; Place Details is only called for unknown places.
     """
-    if not settings.google_places_api_key:
+    if not settings.GOOGLE_PLACES_API_KEY:
         raise HTTPException(
             status_code=500,
             detail="Google Places API key not configured"
         )
-    
+
     try:
-        async with httpx.AsyncClient() as client:
-            # First, get the place details to get coordinates
-            details_url = "https://maps.googleapis.com/maps/api/place/details/json"
-            params = {
-                "key": settings.google_places_api_key,
-                "place_id": place_id,
-                "fields": "geometry"
-            }
-            
-            response = await client.get(details_url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            
-            if data.get("status") != "OK":
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Google Places API error: {data.get('status')}"
-                )
-            
-            location = data.get("result", {}).get("geometry", {}).get("location", {})
-            if not location:
-                raise HTTPException(
-                    status_code=404,
-                    detail="Location not found"
-                )
-            
-            # Generate static map URL
-            static_map_url = (
-                f"https://maps.googleapis.com/maps/api/staticmap?"
-                f"center={location.get('lat')},{location.get('lng')}&"
-                f"zoom={zoom}&size={width}x{height}&"
-                f"markers=color:red%7C{location.get('lat')},{location.get('lng')}&"
-                f"key={settings.google_places_api_key}"
+        location = (await _known_coordinates(db, places, [place_id])).get(place_id)
+        if location is None:
+            location = await places.place_coordinates(place_id)
+        if location is None:
+            raise HTTPException(
+                status_code=404,
+                detail="Location not found"
             )
-            
-            return static_map_url
-            
-    except httpx.RequestError as e:
+        return _static_map_url(*location, width, height, zoom)
+
+    except PlacesError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        )
+    except httpx.HTTPError as e:
         raise HTTPException(
             status_code=500,
             detail=f"Error generating static map: {str(e)}"
         )
+
+@router.post("/static-maps", response_model=Dict[str, Optional[str]])
+async def get_static_map_urls(
+    request: StaticMapBatch,
+    db: AsyncSession = Depends(get_async_db),
+    places: PlacesClient = Depends(get_places_client)
+):
+    """
+    Static map URLs for many places at once, keyed by place_id. Places whose
+    coordinates cannot be found map to null.
+    """
+    if not settings.GOOGLE_PLACES_API_KEY:
+        raise HTTPException(
+            status_code=500,
+            detail="Google Places API key not configured"
+        )
+
+    place_ids = list(dict.fromkeys(request.place_ids))
+    found = await _known_coordinates(db, places, place_ids)
+
+    async def lookup(place_id: str) -> Optional[Tuple[float, float]]:
+        try:
+            return await places.place_coordinates(place_id)
+        except (PlacesError, UpstreamUnavailable, httpx.HTTPError):
+            return None
+
+    unknown = [place_id for place_id in place_ids if place_id not in found]
+    found.update(zip(unknown, await asyncio.gather(*(lookup(place_id) for place_id in unknown))))
+    return {
+        place_id: None if found.get(place_id) is None
+        else _static_map_url(*found[place_id], request.width, request.height, request.zoom)
+        for place_id in place_ids
+    }
@@ -0,0 +1,96 @@
+import asyncio
+from typing import Dict, List
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse
+from app.deps import get_photo_store, get_places_client, get_single_flight
+from app.schemas.photo import PhotoBatch
+from app.services.governor import UpstreamUnavailable
+from app.services.photos import DEFAULT_PHOTO_WIDTH, PhotoStore, StoredPhoto, photo_proxy_url
+from app.services.places import PlacesClient
+from app.services.singleflight import SingleFlight
+import httpx
+import logging
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Photos never change for a given content hash
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+async def _stored_photo(
+    store: PhotoStore,
+    places: PlacesClient,
+    flights: SingleFlight,
+    photo_reference: str,
+    max_width: int
+) -> StoredPhoto:
+    """The cached photo, downloading it from Google on the first request"""
+    photo = await asyncio.to_thread(store.get, photo_reference, max_width)
+    if photo is not None:
+        return photo
+
+    async def fetch() -> StoredPhoto:
+        content, content_type = await places.photo(photo_reference, max_width)
+        return await asyncio.to_thread(store.put, photo_reference, max_width, content, content_type)
+
+    return await flights.do(f"photo:{photo_reference}:{max_width}", fetch)
+
+async def _warm(
+    store: PhotoStore,
+    places: PlacesClient,
+    flights: SingleFlight,
+    references: List[str],
+    max_width: int
+) -> None:
+    async def warm_one(photo_reference: str) -> None:
+        try:
+            await _stored_photo(store, places, flights, photo_reference, max_width)
+        except (httpx.HTTPError, UpstreamUnavailable) as e:
+            logger.warning(f"Error prefetching photo: {str(e)}")
+
+    await asyncio.gather(*(warm_one(reference) for reference in references))
+
+@router.post("/batch", response_model=Dict[str, str])
+async def resolve_photos(
+    batch: PhotoBatch,
+    background_tasks: BackgroundTasks,
+    store: PhotoStore = Depends(get_photo_store),
+    places: PlacesClient = Depends(get_places_client),
+    flights: SingleFlight = Depends(get_single_flight)
+):
+    """
+    Image URLs for many photo references at once, keyed by reference. With
+    `warm`, photos not cached yet are downloaded after the response is sent,
+    so the client's image requests that follow are served locally.
+    """
+    references = list(dict.fromkeys(batch.references))
+    if batch.warm:
+        background_tasks.add_task(_warm, store, places, flights, references, batch.max_width)
+    return {reference: photo_proxy_url(reference, batch.max_width) for reference in references}
+
+@router.get("/{photo_reference}")
+async def get_photo(
+    request: Request,
+    photo_reference: str,
+    max_width: int = Query(DEFAULT_PHOTO_WIDTH, ge=1, le=1600),
+    store: PhotoStore = Depends(get_photo_store),
+    places: PlacesClient = Depends(get_places_client),
+    flights: SingleFlight = Depends(get_single_flight)
+):
+    """
+    Serve a Places photo from the local cache. Responses carry a strong
+    ETag (the content hash), answer If-None-Match with 304 and support
+    Range requests.
+    """
+    try:
+        photo = await _stored_photo(store, places, flights, photo_reference, max_width)
+    except httpx.HTTPStatusError as e:
+        status_code = 404 if e.response.status_code in (400, 404) else 502
+        raise HTTPException(status_code=status_code, detail="Photo not available")
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Error fetching photo: {str(e)}")
+
+    headers = {"ETag": photo.etag, "Cache-Control": CACHE_CONTROL}
+    if photo.etag in (tag.strip() for tag in request.headers.get("if-none-match", "").split(",")):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(photo.path, media_type=photo.content_type, headers=headers)
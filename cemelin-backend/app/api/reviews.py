@@ -1,33 +1,100 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import tuple_, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from typing import List
-from app.deps import get_db, get_current_user
+from typing import List, Optional
+from datetime import datetime
+from app.deps import get_db, get_current_principal
+from app.models.destination import DestinationRating
 from app.models.review import Review
-from app.models.user import User
-from app.schemas.review import ReviewCreate, Review as ReviewSchema
+from app.schemas.user import Principal
+from app.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
+from app.schemas.review import ReviewCreate, Review as ReviewSchema, RatingStats
 
 router = APIRouter()
 
+def _record_rating(db: Session, destination_id: int, rating: int):
+    """Add one rating to the destination's aggregate inside the caller's transaction"""
+    stars = getattr(DestinationRating, f"stars_{rating}")
+    increment = update(DestinationRating).where(
+        DestinationRating.destination_id == destination_id
+    ).values({
+        DestinationRating.ratings_count: DestinationRating.ratings_count + 1,
+        DestinationRating.ratings_sum: DestinationRating.ratings_sum + rating,
+        stars: stars + 1,
+    })
+    if db.execute(increment).rowcount:
+        return
+
+    # First review for this destination
+    try:
+        with db.begin_nested():
+            db.add(DestinationRating(
+                destination_id=destination_id,
+                ratings_count=1,
+                ratings_sum=rating,
+                **{f"stars_{rating}": 1}
+            ))
+    except IntegrityError:
+        # A concurrent review created the row first
+        db.execute(increment)
+
 @router.get("/destination/{destination_id}", response_model=List[ReviewSchema])
 def get_destination_reviews(
     destination_id: int,
-    db: Session = Depends(get_db)
+    response: Response,
+    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
 ):
-    reviews = db.query(Review).filter(Review.destination_id == destination_id).all()
+    """
+    Get a destination's reviews, newest first.
+    Pass the X-Next-Cursor response header back as `cursor` for the next page.
+    """
+    query = db.query(Review).filter(Review.destination_id == destination_id)
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor, datetime, int)
+        query = query.filter(tuple_(Review.created_at, Review.id) < (cursor_created_at, cursor_id))
+
+    reviews = query.order_by(Review.created_at.desc(), Review.id.desc()).limit(limit + 1).all()
+    if len(reviews) > limit:
+        reviews = reviews[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(reviews[-1].created_at, reviews[-1].id)
     return reviews
 
+@router.get("/destination/{destination_id}/stats", response_model=RatingStats)
+def get_destination_rating_stats(
+    destination_id: int,
+    db: Session = Depends(get_db)
+):
+    """Live rating summary for a destination, read from its aggregate row"""
+    stats = db.query(DestinationRating).filter(
+        DestinationRating.destination_id == destination_id
+    ).first()
+    if not stats:
+        return RatingStats(destination_id=destination_id, histogram={n: 0 for n in range(1, 6)})
+
+    return RatingStats(
+        destination_id=destination_id,
+        count=stats.ratings_count,
+        average=round(stats.ratings_sum / stats.ratings_count, 2) if stats.ratings_count else None,
+        histogram={n: getattr(stats, f"stars_{n}") for n in range(1, 6)}
+    )
+
 @router.post("/", response_model=ReviewSchema)
 def create_review(
     *,
     db: Session = Depends(get_db),
     review_in: ReviewCreate,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     review = Review(
         **review_in.model_dump(),
         user_id=current_user.id
     )
     db.add(review)
+    db.flush()
+    _record_rating(db, review.destination_id, review.rating)
     db.commit()
     db.refresh(review)
     return review
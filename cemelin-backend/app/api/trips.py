@@ -1,108 +1,340 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import delete, insert, tuple_, update
+from sqlalchemy.orm import Session, selectinload
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
 from datetime import date
-from app.deps import get_db, get_current_user
+import json
+from pydantic import ValidationError
+from app.database import SessionLocal
+from app.deps import get_db, get_current_principal
 from app.models.trip import Trip, TripDestination
 from app.models.destination import Destination
-from app.models.user import User
+from app.schemas.user import Principal
+from app.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, decode_cursor, encode_cursor
 from app.schemas.trip import (
     TripCreate,
     TripUpdate,
     Trip as TripSchema,
     TripDestinationCreate,
+    TripDestinationMove,
     TripReorder
 )
 
 router = APIRouter()
 
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+IMPORT_BATCH_SIZE = 500
+EXPORT_BATCH_SIZE = 200
+
+def _trip_query(db: Session):
+    """Trips with their stops and each stop's destination loaded up front"""
+    return db.query(Trip).options(
+        selectinload(Trip.destinations).selectinload(TripDestination.destination)
+    )
+
+def _get_user_trip(db: Session, trip_id: int, user_id: int) -> Trip:
+    trip = _trip_query(db).filter(
+        Trip.id == trip_id,
+        Trip.user_id == user_id
+    ).first()
+    if not trip:
+        raise HTTPException(status_code=404, detail="Trip not found")
+    return trip
+
+def _missing_destinations(db: Session, destination_ids) -> List[int]:
+    """Ids among `destination_ids` with no Destination row, in one query"""
+    wanted = set(destination_ids)
+    if not wanted:
+        return []
+    found = {
+        row[0] for row in db.query(Destination.id).filter(Destination.id.in_(wanted))
+    }
+    return sorted(wanted - found)
+
+def _check_days(start_date: date, end_date: date, day_numbers: Iterable[int]):
+    """Raise if a stop falls on a day outside the trip"""
+    days = (end_date - start_date).days + 1
+    outside = sorted(day for day in set(day_numbers) if not 1 <= day <= days)
+    if outside:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Day {outside[0]} is outside the trip's {days} days"
+        )
+
+def _check_trip(trip_in: TripCreate, missing_destinations: Set[int]):
+    """Raise if the trip cannot be stored, given destination ids known to be missing"""
+    if trip_in.end_date < trip_in.start_date:
+        raise HTTPException(
+            status_code=400,
+            detail="End date cannot be before start date"
+        )
+    missing = sorted({dest.destination_id for dest in trip_in.destinations} & missing_destinations)
+    if missing:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Destination {missing[0]} not found"
+        )
+    _check_days(trip_in.start_date, trip_in.end_date, (dest.day_number for dest in trip_in.destinations))
+
+def _validate_trip(db: Session, trip_in: TripCreate):
+    """Reject a trip before anything is written for it"""
+    missing = _missing_destinations(db, (dest.destination_id for dest in trip_in.destinations))
+    _check_trip(trip_in, set(missing))
+
+def _insert_trips(db: Session, user_id: int, trips_in: List[TripCreate]) -> List[Trip]:
+    """Add validated trips and bulk insert all their stops; the caller commits"""
+    trips = [
+        Trip(
+            user_id=user_id,
+            title=trip_in.title,
+            description=trip_in.description,
+            start_date=trip_in.start_date,
+            end_date=trip_in.end_date,
+            is_public=trip_in.is_public
+        )
+        for trip_in in trips_in
+    ]
+    db.add_all(trips)
+    db.flush()
+    stops = [
+        {"trip_id": trip.id, **dest.model_dump()}
+        for trip, trip_in in zip(trips, trips_in)
+        for dest in trip_in.destinations
+    ]
+    if stops:
+        db.execute(insert(TripDestination), stops)
+    return trips
+
+def _insert_trip(db: Session, user_id: int, trip_in: TripCreate) -> Trip:
+    return _insert_trips(db, user_id, [trip_in])[0]
+
+def _import_batch(user_id: int, batch: List[Tuple[int, TripCreate]]) -> List[dict]:
+    """
+    Store one batch of imported trips: one destination lookup, one flush
+    for the trips, one bulk insert for their stops and one commit. Trips
+    that fail validation are reported and skipped.
+    """
+    results = []
+    valid = []
+    with SessionLocal() as db:
+        missing = set(_missing_destinations(
+            db, (dest.destination_id for _, trip_in in batch for dest in trip_in.destinations)
+        ))
+        for line, trip_in in batch:
+            try:
+                _check_trip(trip_in, missing)
+            except HTTPException as e:
+                results.append({"line": line, "status": "error", "detail": e.detail})
+            else:
+                valid.append((line, trip_in))
+        if valid:
+            trips = _insert_trips(db, user_id, [trip_in for _, trip_in in valid])
+            db.commit()
+            results.extend(
+                {"line": line, "status": "created", "id": trip.id}
+                for (line, _), trip in zip(valid, trips)
+            )
+    return sorted(results, key=lambda result: result["line"])
+
+def _ndjson(results: Iterable[dict]) -> Iterator[str]:
+    for result in results:
+        yield json.dumps(result) + "\n"
+
+STOP_FIELDS = ("destination_id", "day_number", "order", "notes", "start_time", "duration")
+
+def _apply_stop_diff(db: Session, trip: Trip, desired: List[dict]):
+    """
+    Bring a trip's stops to `desired` with as few writes as possible.
+
+    Desired stops carrying an `id` keep that row; others reuse an unclaimed
+    row for the same destination. Rows whose fields changed are updated,
+    unmatched desired stops are inserted and leftover rows are deleted,
+    each as a single bulk statement. Inserted and changed stops are checked
+    like those of a new trip first.
+    """
+    trip_id = trip.id
+    existing = db.query(TripDestination).filter(TripDestination.trip_id == trip_id).all()
+    by_id = {stop.id: stop for stop in existing}
+
+    claimed = {}
+    for index, stop in enumerate(desired):
+        stop_id = stop.get("id")
+        if stop_id is None:
+            continue
+        if stop_id not in by_id:
+            raise HTTPException(status_code=400, detail=f"Stop {stop_id} is not part of this trip")
+        if stop_id in claimed.values():
+            raise HTTPException(status_code=400, detail=f"Stop {stop_id} appears more than once")
+        claimed[index] = stop_id
+
+    unclaimed = [stop for stop in existing if stop.id not in claimed.values()]
+    for index, stop in enumerate(desired):
+        if index in claimed:
+            continue
+        match = next((row for row in unclaimed if row.destination_id == stop["destination_id"]), None)
+        if match is not None:
+            unclaimed.remove(match)
+            claimed[index] = match.id
+
+    updates = []
+    inserts = []
+    for index, stop in enumerate(desired):
+        values = {field: stop.get(field) for field in STOP_FIELDS}
+        if index not in claimed:
+            inserts.append({"trip_id": trip_id, **values})
+            continue
+        row = by_id[claimed[index]]
+        if any(getattr(row, field) != value for field, value in values.items()):
+            updates.append({"id": row.id, **values})
+    removed = [row.id for row in unclaimed]
+
+    # Unchanged destinations and days were accepted when they were stored
+    changed = inserts + [
+        values for values in updates
+        if (by_id[values["id"]].destination_id, by_id[values["id"]].day_number)
+        != (values["destination_id"], values["day_number"])
+    ]
+    missing = _missing_destinations(db, (values["destination_id"] for values in changed))
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Destination {missing[0]} not found")
+    _check_days(trip.start_date, trip.end_date, (values["day_number"] for values in changed))
+
+    # Bulk statements bypass the identity map, so drop the rows loaded above
+    for row in existing:
+        db.expunge(row)
+    if removed:
+        db.execute(delete(TripDestination).where(TripDestination.id.in_(removed)))
+    if updates:
+        db.execute(update(TripDestination), updates)
+    if inserts:
+        db.execute(insert(TripDestination), inserts)
+
 @router.get("/", response_model=List[TripSchema])
 def get_user_trips(
+    response: Response,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_principal),
     start_date: Optional[date] = None,
-    end_date: Optional[date] = None
+    end_date: Optional[date] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
 ):
-    """Get all trips for the current user with optional date filtering"""
-    query = db.query(Trip).filter(Trip.user_id == current_user.id)
+    """
+    Get the current user's trips with optional date filtering, newest first.
+    Pass the X-Next-Cursor response header back as `cursor` for the next page.
+    """
+    query = _trip_query(db).filter(Trip.user_id == current_user.id)
     
     if start_date:
         query = query.filter(Trip.start_date >= start_date)
     if end_date:
         query = query.filter(Trip.end_date <= end_date)
+    if cursor:
+        cursor_start_date, cursor_id = decode_cursor(cursor, date, int)
+        query = query.filter(tuple_(Trip.start_date, Trip.id) < (cursor_start_date, cursor_id))
     
-    return query.order_by(Trip.start_date.desc()).all()
+    trips = query.order_by(Trip.start_date.desc(), Trip.id.desc()).limit(limit + 1).all()
+    if len(trips) > limit:
+        trips = trips[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(trips[-1].start_date, trips[-1].id)
+    return trips
 
 @router.post("/", response_model=TripSchema)
 def create_trip(
     *,
     db: Session = Depends(get_db),
     trip_in: TripCreate,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Create a new trip with destinations"""
-    # Validate dates
-    if trip_in.end_date < trip_in.start_date:
-        raise HTTPException(
-            status_code=400,
-            detail="End date cannot be before start date"
-        )
-
-    # Create trip
-    trip = Trip(
-        user_id=current_user.id,
-        title=trip_in.title,
-        description=trip_in.description,
-        start_date=trip_in.start_date,
-        end_date=trip_in.end_date,
-        is_public=trip_in.is_public
-    )
-    db.add(trip)
+    _validate_trip(db, trip_in)
+    trip = _insert_trip(db, current_user.id, trip_in)
     db.commit()
-    db.refresh(trip)
-
-    # Add destinations
-    for dest in trip_in.destinations:
-        # Verify destination exists
-        destination = db.query(Destination).filter(
-            Destination.id == dest.destination_id
-        ).first()
-        if not destination:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Destination {dest.destination_id} not found"
-            )
-        
-        trip_dest = TripDestination(
-            trip_id=trip.id,
-            destination_id=dest.destination_id,
-            day_number=dest.day_number,
-            order=dest.order,
-            notes=dest.notes,
-            start_time=dest.start_time,
-            duration=dest.duration
-        )
-        db.add(trip_dest)
-    
-    db.commit()
-    db.refresh(trip)
-    return trip
+    return _get_user_trip(db, trip.id, current_user.id)
+
+@router.post("/import")
+async def import_trips(
+    request: Request,
+    current_user: Principal = Depends(get_current_principal)
+):
+    """
+    Bulk import trips from NDJSON, one TripCreate object per line.
+
+    The body is read incrementally and stored in batches. The response is
+    NDJSON with one result per non-empty input line, either
+    {"line", "status": "created", "id"} or {"line", "status": "error", "detail"}.
+    """
+    results = []
+    batch = []
+    buffer = b""
+    line_number = 0
+
+    def take(raw: bytes):
+        nonlocal line_number
+        line_number += 1
+        if not raw.strip():
+            return
+        try:
+            batch.append((line_number, TripCreate.model_validate_json(raw)))
+        except ValidationError as e:
+            results.append({
+                "line": line_number,
+                "status": "error",
+                "detail": e.errors(include_url=False, include_context=False, include_input=False)
+            })
+
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for raw in lines:
+            take(raw)
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            results.extend(await run_in_threadpool(_import_batch, current_user.id, batch))
+            batch = []
+    take(buffer)
+    if batch:
+        results.extend(await run_in_threadpool(_import_batch, current_user.id, batch))
+
+    results.sort(key=lambda result: result["line"])
+    return StreamingResponse(_ndjson(results), media_type=NDJSON_MEDIA_TYPE)
+
+@router.get("/export")
+def export_trips(current_user: Principal = Depends(get_current_principal)):
+    """
+    Stream the user's trips as NDJSON, one Trip object per line. Each line
+    can be fed back to /trips/import unchanged.
+    """
+    user_id = current_user.id
+
+    def lines() -> Iterator[str]:
+        # The request's session is gone once streaming starts, so use our own
+        with SessionLocal() as db:
+            last_id = 0
+            while True:
+                trips = _trip_query(db).filter(
+                    Trip.user_id == user_id,
+                    Trip.id > last_id
+                ).order_by(Trip.id).limit(EXPORT_BATCH_SIZE).all()
+                for trip in trips:
+                    yield TripSchema.model_validate(trip).model_dump_json() + "\n"
+                if len(trips) < EXPORT_BATCH_SIZE:
+                    return
+                last_id = trips[-1].id
+                db.expunge_all()
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE)
 
 @router.get("/{trip_id}", response_model=TripSchema)
 def get_trip(
     *,
     db: Session = Depends(get_db),
     trip_id: int,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Get a specific trip"""
-    trip = db.query(Trip).filter(
-        Trip.id == trip_id,
-        Trip.user_id == current_user.id
-    ).first()
-    if not trip:
-        raise HTTPException(status_code=404, detail="Trip not found")
-    return trip
+    return _get_user_trip(db, trip_id, current_user.id)
 
 @router.put("/{trip_id}", response_model=TripSchema)
 def update_trip(
@@ -110,15 +342,10 @@ def update_trip(
     db: Session = Depends(get_db),
     trip_id: int,
     trip_in: TripUpdate,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Update trip details"""
-    trip = db.query(Trip).filter(
-        Trip.id == trip_id,
-        Trip.user_id == current_user.id
-    ).first()
-    if not trip:
-        raise HTTPException(status_code=404, detail="Trip not found")
+    trip = _get_user_trip(db, trip_id, current_user.id)
     
     # Validate dates if both are provided
     if trip_in.start_date and trip_in.end_date: 
@@ -134,15 +361,15 @@ def update_trip(
     
     db.add(trip)
     db.commit()
-    db.refresh(trip)
-    return trip
+    # Commit expires the loaded graph; reload it eagerly for the response
+    return _get_user_trip(db, trip_id, current_user.id)
 
 @router.delete("/{trip_id}")
 def delete_trip(
     *,
     db: Session = Depends(get_db),
     trip_id: int,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Delete a trip"""
     trip = db.query(Trip).filter(
@@ -162,7 +389,7 @@ def reorder_trip_destinations(
     db: Session = Depends(get_db),
     trip_id: int,
     reorder_data: TripReorder,
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_principal)
 ):
     """Reorder destinations within a trip"""
     trip = db.query(Trip).filter(
@@ -172,22 +399,55 @@ def reorder_trip_destinations(
     if not trip:
         raise HTTPException(status_code=404, detail="Trip not found")
     
-    # Delete existing destinations
-    db.query(TripDestination).filter(TripDestination.trip_id == trip_id).delete()
-    
-    # Add destinations in new order
-    for dest in reorder_data.destinations:
-        trip_dest = TripDestination(
-            trip_id=trip_id,
-            destination_id=dest.destination_id,
-            day_number=dest.day_number,
-            order=dest.order,
-            notes=dest.notes,
-            start_time=dest.start_time,
-            duration=dest.duration
-        )
-        db.add(trip_dest)
-    
+    # Only stops that moved, changed, appeared or disappeared are written
+    _apply_stop_diff(
+        db,
+        trip,
+        [dest.model_dump() for dest in reorder_data.destinations]
+    )
     db.commit()
-    db.refresh(trip)
-    return trip
+    return _get_user_trip(db, trip_id, current_user.id)
+
+@router.patch("/{trip_id}/destinations/{stop_id}/move", response_model=TripSchema)
+def move_trip_destination(
+    *,
+    db: Session = Depends(get_db),
+    trip_id: int,
+    stop_id: int,
+    move: TripDestinationMove,
+    current_user: Principal = Depends(get_current_principal)
+):
+    """Move one stop to a day and position, shifting the stops around it"""
+    trip = db.query(Trip).filter(
+        Trip.id == trip_id,
+        Trip.user_id == current_user.id
+    ).first()
+    if not trip:
+        raise HTTPException(status_code=404, detail="Trip not found")
+
+    stops = db.query(TripDestination).filter(
+        TripDestination.trip_id == trip_id
+    ).order_by(TripDestination.day_number, TripDestination.order).all()
+    stop = next((s for s in stops if s.id == stop_id), None)
+    if not stop:
+        raise HTTPException(status_code=404, detail="Stop not found")
+
+    # Rebuild the itinerary as data, then let the diff write only what changed
+    first_order = min(s.order for s in stops)
+    desired = [{"id": s.id, **{field: getattr(s, field) for field in STOP_FIELDS}} for s in stops]
+    moved = next(d for d in desired if d["id"] == stop_id)
+    desired.remove(moved)
+    moved["day_number"] = move.day_number
+
+    days = {}
+    for d in desired:
+        days.setdefault(d["day_number"], []).append(d)
+    target = days.setdefault(move.day_number, [])
+    target.insert(min(move.position, len(target)), moved)
+    for day_stops in (days[move.day_number], days.get(stop.day_number, [])):
+        for position, d in enumerate(day_stops):
+            d["order"] = first_order + position
+
+    _apply_stop_diff(db, trip, [d for day_stops in days.values() for d in day_stops])
+    db.commit()
+    return _get_user_trip(db, trip_id, current_user.id)
@@ -9,13 +9,129 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int
     ALLOWED_ORIGINS: str
     DATABASE_URL: str
+
+    # Connection pool (ignored for SQLite)
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: int = 30  # Seconds to wait for a free connection
+    db_pool_recycle: int = 1800  # Seconds before a connection is replaced
+    db_pool_pre_ping: bool = True
+
+    # Create missing tables when a worker starts. Disable for fast startup and
+    # run `python -m app.tools.migrate` once per deploy instead.
+    run_migrations_on_startup: bool = True
+    
+    # Password hashing runs on its own thread pool; calls beyond
+    # password_hash_max_pending are rejected with 503 and Retry-After
+    password_hash_workers: int = 2
+    password_hash_max_pending: int = 32
+    password_hash_retry_after: int = 1  # Seconds
+    # Comma separated passlib schemes. The first hashes new passwords; the
+    # others are still accepted and rehashed on the next login, as are hashes
+    # whose cost differs from the settings below. argon2 needs argon2-cffi.
+    # Size these with `python -m app.tools.hash_bench`.
+    password_hash_schemes: str = "bcrypt"
+    password_bcrypt_rounds: int = 12
+    password_argon2_time_cost: int = 3
+    password_argon2_memory_cost: int = 65536  # KiB
+    password_argon2_parallelism: int = 4
+
+    # Authenticated requests resolve the caller from a per-worker cache
+    # instead of querying users. A password change evicts the entry on the
+    # worker that handled it; everything else (other workers, deactivation)
+    # catches up within principal_cache_ttl
+    principal_cache_size: int = 10000
+    principal_cache_ttl: int = 60  # Seconds
     
     # Google Places API configuration
     GOOGLE_PLACES_API_KEY: str
+    places_max_concurrency: int = 10  # Max in-flight Places requests per search fan-out
+
+    # Shared upstream HTTP client (connection pool for maps.googleapis.com)
+    upstream_max_connections: int = 100
+    upstream_max_keepalive_connections: int = 20
+    upstream_keepalive_expiry: float = 30.0  # Seconds an idle connection is kept open
+    upstream_http2: bool = False  # Requires the h2 package
+    upstream_timeout: float = 10.0  # Seconds
+    upstream_connect_timeout: float = 5.0  # Seconds
+
+    # Upstream governor, one per Google API and worker: a request budget and
+    # concurrency cap, retries with jittered backoff for transient failures,
+    # and a circuit breaker that fails fast (503) while Google is failing
+    upstream_places_rps: float = 20.0
+    upstream_places_burst: int = 40
+    upstream_places_max_concurrency: int = 50
+    upstream_photos_rps: float = 20.0
+    upstream_photos_burst: int = 40
+    upstream_photos_max_concurrency: int = 20
+    upstream_queue_timeout: float = 2.0  # Seconds a call may wait for budget or a slot
+    upstream_call_timeout: float = 15.0  # Overall deadline per attempt, in seconds
+    upstream_retries: int = 2
+    upstream_backoff_base: float = 0.2  # Seconds
+    upstream_backoff_max: float = 2.0  # Seconds
+    upstream_breaker_failures: int = 5  # Consecutive failures that open the breaker
+    upstream_breaker_reset: float = 30.0  # Seconds before a trial call is let through
+
+    # Place Details cache: in-process LRU plus an optional shared tier
+    place_cache_size: int = 2048  # Entries kept in each worker
+    place_cache_ttl: int = 21600  # Seconds
+    place_cache_backend: str = "none"  # none, memory, sqlite or redis
+    place_cache_url: Optional[str] = None  # SQLite file path or Redis URL
+    place_cache_shared_max_entries: int = 50000
+    place_coordinates_ttl: int = 604800  # Seconds; coordinates seen in any Places response
+
+    # Background refresh of stored destinations from Place Details
+    destination_refresh_enabled: bool = False
+    destination_refresh_rps: float = 1.0  # Upstream calls per second at most
+    destination_refresh_batch: int = 50
+    destination_refresh_interval: int = 60  # Seconds between passes once caught up
+    destination_refresh_retry_delay: int = 900  # Seconds before retrying a row after a transient failure
+    destination_refresh_ttl_ratings: int = 86400  # Seconds per field group
+    destination_refresh_ttl_hours: int = 604800
+    destination_refresh_ttl_photos: int = 2592000
+    destination_refresh_ttl_contact: int = 2592000
+
+    # Photo proxy: Places photos are downloaded once and served from disk
+    photo_cache_dir: str = "photo_cache"
+    photo_cache_max_bytes: int = 1_073_741_824  # 1 GiB
+    # Origin for photo URLs in responses, e.g. https://api.example.com; the request's origin when unset
+    public_base_url: Optional[str] = None
+
+    # Autocomplete predictions cache for /locations/search
+    autocomplete_cache_size: int = 4096
+    autocomplete_cache_ttl: int = 3600  # Seconds
+    
+    # Map markers are served from stored destinations when at least this
+    # many fall inside the requested area; otherwise Nearby Search is used
+    markers_local_min_results: int = 5
+    markers_local_limit: int = 200
+
+    # Nearby Search results cached per map tile for /maps/markers
+    marker_tile_cache_size: int = 4096  # Tiles kept in each worker
+    marker_tile_cache_ttl: int = 3600  # Seconds
+    marker_tile_max_tiles: int = 9  # Tiles fetched for one request at most
+    marker_cluster_index_ttl: int = 300  # Seconds between rebuilds of the destination cluster index
     
-    # Rate limiting settings
+    # Rate limiting settings, per user id (client IP when anonymous)
+    rate_limit_enabled: bool = True
     rate_limit_requests: int = 100  # Number of requests
     rate_limit_period: int = 60  # Time period in seconds
+    # Routes that call Google APIs on a cache miss, and those that hash passwords
+    rate_limit_upstream_requests: int = 30
+    rate_limit_upstream_period: int = 60  # Seconds
+    rate_limit_auth_requests: int = 10
+    rate_limit_auth_period: int = 60  # Seconds
+    # Location typeahead and photos also reach Google, but come many to a page
+    rate_limit_typeahead_requests: int = 120
+    rate_limit_typeahead_period: int = 60  # Seconds
+    rate_limit_photos_requests: int = 300
+    rate_limit_photos_period: int = 60  # Seconds
+    # memory keeps budgets per worker; sqlite and redis share them between workers
+    rate_limit_backend: str = "memory"
+    rate_limit_url: Optional[str] = None  # SQLite file path or Redis URL
+    rate_limit_trust_forwarded_for: bool = False  # Only behind a proxy that sets X-Forwarded-For
+    # Header carrying the client IP from the proxy; set to Fly-Client-IP in production on Fly
+    rate_limit_client_ip_header: Optional[str] = None
 
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -1,17 +1,132 @@
-from sqlalchemy import create_engine
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, AsyncIterator, Optional
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from sqlalchemy.schema import CreateColumn
+from app.config import settings
 
-# SQLite URL for in-memory database
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+def _database_url(url: str) -> URL:
+    database_url = make_url(url)
+    # Fly and Heroku style URLs; psycopg (v3) is the installed Postgres driver
+    if database_url.drivername in ("postgres", "postgresql"):
+        database_url = database_url.set(drivername="postgresql+psycopg")
+    if database_url.get_backend_name() == "sqlite" and database_url.database in (None, "", ":memory:"):
+        # A plain :memory: database is private to one connection, so the sync and
+        # async engines would each get an empty one; a named shared-cache one is
+        # seen by every connection in this process
+        database_url = database_url.set(
+            database="file:cemelin?mode=memory&cache=shared",
+            query={**database_url.query, "uri": "true"},
+        )
+    return database_url
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+def _is_memory_database(database_url: URL) -> bool:
+    return "mode=memory" in (database_url.database or "")
+
+def _async_database_url(database_url: URL) -> URL:
+    if database_url.get_backend_name() == "sqlite":
+        return database_url.set(drivername="sqlite+aiosqlite")
+    # psycopg (v3) supports asyncio natively
+    return database_url
+
+def _engine_options(database_url: URL) -> dict:
+    if database_url.get_backend_name() == "sqlite":
+        options = {"connect_args": {"check_same_thread": False}}
+        if _is_memory_database(database_url) and not database_url.get_dialect().is_async:
+            # The database lasts while a connection to it is open; the sync engine keeps one for good
+            options["poolclass"] = StaticPool
+        return options
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+
+SQLALCHEMY_DATABASE_URL = _database_url(settings.DATABASE_URL)
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_engine_options(SQLALCHEMY_DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# The async engine is built on first use, so the async driver (aiosqlite for
+# SQLite, psycopg for Postgres) is only required by code paths that need it
+AsyncSessionLocal = async_sessionmaker(class_=AsyncSession, autoflush=False, expire_on_commit=False)
+_async_engine: Optional[AsyncEngine] = None
+
+def get_async_engine() -> AsyncEngine:
+    global _async_engine
+    if _async_engine is None:
+        async_url = _async_database_url(SQLALCHEMY_DATABASE_URL)
+        try:
+            _async_engine = create_async_engine(async_url, **_engine_options(async_url))
+        except ImportError as e:
+            raise RuntimeError(f"Async database driver for {async_url.drivername} is not installed: {e}")
+        AsyncSessionLocal.configure(bind=_async_engine)
+    return _async_engine
+
+async def dispose_async_engine() -> None:
+    if _async_engine is not None:
+        await _async_engine.dispose()
+
+def async_session() -> AsyncSession:
+    get_async_engine()
+    return AsyncSessionLocal()
+
+@asynccontextmanager
+async def try_advisory_lock(lock_id: int) -> AsyncIterator[bool]:
+    """
+    Try to take a Postgres advisory lock for the duration of the block,
+    without waiting; yields whether it was taken. Other databases have no
+    advisory locks, so there it is always taken.
+    """
+    async with get_async_engine().connect() as connection:
+        if connection.dialect.name != "postgresql":
+            yield True
+            return
+        locked = await connection.scalar(text("SELECT pg_try_advisory_lock(:id)"), {"id": lock_id})
+        # A session lock outlives the transaction; don't sit idle in one
+        await connection.commit()
+        try:
+            yield bool(locked)
+        finally:
+            if locked:
+                await connection.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": lock_id})
+                await connection.commit()
+
 Base = declarative_base()
 
+# Arbitrary key shared by every worker taking the schema lock
+SCHEMA_LOCK_ID = 7_260_417
+
+def init_db() -> None:
+    """
+    Create any missing tables. On Postgres, workers serialise on an advisory
+    lock so only the first one runs DDL and the rest find nothing to do.
+    """
+    # Register every model on Base.metadata
+    import app.models.destination, app.models.review, app.models.trip, app.models.user  # noqa: F401
+
+    with engine.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": SCHEMA_LOCK_ID})
+        Base.metadata.create_all(bind=connection)
+        # create_all only builds columns and indexes with new tables; add
+        # nullable columns and indexes introduced later
+        inspector = inspect(connection)
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    ddl = CreateColumn(column).compile(dialect=connection.dialect)
+                    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+            for index in table.indexes:
+                index.create(bind=connection, checkfirst=True)
+
 # Dependency
 def get_db():
     db = SessionLocal()
@@ -19,3 +134,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with async_session() as db:
+        yield db
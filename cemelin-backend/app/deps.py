@@ -1,13 +1,26 @@
-from typing import Generator, Optional
-from fastapi import Depends, HTTPException, status
+from typing import Dict, Generator, Optional
+import httpx
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
-from app.database import SessionLocal
+from datetime import datetime, timedelta, timezone
+from app.database import SessionLocal, async_session, get_async_db
 from app.config import settings
 from app.models.user import User
-from app.schemas.user import TokenPayload
+from app.schemas.user import Principal, TokenPayload
+from app.services.autocomplete import AutocompleteCache
+from app.services.cache import LRUCache, TwoTierCache
+from app.services.clustering import ClusterIndexCache
+from app.services.governor import UpstreamGovernor
+from app.services.http import create_upstream_client
+from app.services.passwords import PasswordHasher
+from app.services.photos import PhotoStore
+from app.services.refresh import ReadCounter
+from app.services.places import PlacesClient
+from app.services.singleflight import SingleFlight
+from app.services.tiles import MarkerTileCache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
 
@@ -18,16 +31,105 @@ def get_db() -> Generator:
     finally:
         db.close()
 
+def get_settings():
+    return settings
+
+def shared_http_client(state) -> httpx.AsyncClient:
+    """Shared upstream client, built on first use and closed in the app lifespan"""
+    if getattr(state, "http_client", None) is None:
+        state.http_client = create_upstream_client()
+    return state.http_client
+
+async def get_http_client(request: Request) -> httpx.AsyncClient:
+    return shared_http_client(request.app.state)
+
+async def get_place_cache(request: Request) -> TwoTierCache:
+    return request.app.state.place_cache
+
+async def get_autocomplete_cache(request: Request) -> AutocompleteCache:
+    return request.app.state.autocomplete_cache
+
+async def get_marker_tile_cache(request: Request) -> MarkerTileCache:
+    return request.app.state.marker_tile_cache
+
+async def get_cluster_index(request: Request) -> ClusterIndexCache:
+    return request.app.state.cluster_index
+
+async def get_photo_store(request: Request) -> PhotoStore:
+    return request.app.state.photo_store
+
+async def get_read_counter(request: Request) -> ReadCounter:
+    return request.app.state.destination_reads
+
+async def get_password_hasher(request: Request) -> PasswordHasher:
+    return request.app.state.password_hasher
+
+async def get_principal_cache(request: Request) -> LRUCache:
+    return request.app.state.principal_cache
+
+async def get_upstream_governors(request: Request) -> Dict[str, UpstreamGovernor]:
+    return request.app.state.upstream_governors
+
+async def get_single_flight(request: Request) -> SingleFlight:
+    return request.app.state.single_flight
+
+def create_places_client(
+    client: httpx.AsyncClient,
+    cache: TwoTierCache,
+    flights: SingleFlight,
+    governors: Optional[Dict[str, UpstreamGovernor]] = None
+) -> PlacesClient:
+    return PlacesClient(
+        client,
+        settings.GOOGLE_PLACES_API_KEY,
+        max_concurrency=settings.places_max_concurrency,
+        cache=cache,
+        flights=flights,
+        coordinates_ttl=settings.place_coordinates_ttl,
+        governors=governors
+    )
+
+async def get_places_client(
+    client: httpx.AsyncClient = Depends(get_http_client),
+    cache: TwoTierCache = Depends(get_place_cache),
+    flights: SingleFlight = Depends(get_single_flight),
+    governors: Dict[str, UpstreamGovernor] = Depends(get_upstream_governors)
+) -> PlacesClient:
+    return create_places_client(client, cache, flights, governors)
+
 def create_access_token(subject: int) -> str:
-    expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode = {"exp": expire, "sub": str(subject)}
+    now = datetime.now(timezone.utc)
+    expire = now + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    to_encode = {"exp": expire, "iat": int(now.timestamp()), "sub": str(subject)}
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm="HS256")
     return encoded_jwt
 
-async def get_current_user(
-    db: Session = Depends(get_db),
-    token: str = Depends(oauth2_scheme)
-) -> User:
+async def _load_principal(user_id: int) -> Optional[Principal]:
+    async with async_session() as db:
+        row = (await db.execute(
+            select(User.id, User.is_active, User.is_superuser, User.password_changed_at)
+            .where(User.id == user_id)
+        )).first()
+    if row is None:
+        return None
+    return Principal(
+        id=row.id,
+        is_active=bool(row.is_active),
+        is_superuser=bool(row.is_superuser),
+        password_changed_at=row.password_changed_at,
+    )
+
+async def get_current_principal(
+    token: str = Depends(oauth2_scheme),
+    principals: LRUCache = Depends(get_principal_cache)
+) -> Principal:
+    """
+    The authenticated caller, without a database query on the hot path.
+
+    Principals are cached per user id for principal_cache_ttl seconds and
+    dropped from the cache when the password changes. Tokens issued before
+    the last password change are rejected.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -40,10 +142,33 @@ async def get_current_user(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    
-    user = db.query(User).filter(User.id == token_data.sub).first()
-    if not user:
-        raise credentials_exception
-    if not user.is_active:
+
+    principal = principals.get(token_data.sub)
+    if principal is None:
+        principal = await _load_principal(token_data.sub)
+        if principal is None:
+            raise credentials_exception
+        principals.set(token_data.sub, principal)
+
+    if principal.password_changed_at is not None:
+        # password_changed_at is stored as naive UTC
+        changed_at = int(principal.password_changed_at.replace(tzinfo=timezone.utc).timestamp())
+        if (token_data.iat or 0) < changed_at:
+            raise credentials_exception
+    if not principal.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
+    return principal
+
+async def get_current_user(
+    db: Session = Depends(get_db),
+    principal: Principal = Depends(get_current_principal)
+) -> User:
+    """The caller's full User row, for endpoints that need more than the principal"""
+    user = db.get(User, principal.id)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
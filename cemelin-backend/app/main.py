@@ -1,17 +1,87 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from app.api import auth, destinations, reviews, trips, contact, i18n, locations, maps
+from fastapi.responses import JSONResponse
+from app.api import auth, destinations, reviews, trips, contact, i18n, locations, maps, photos
 from app.config import settings
-from app.database import Base, engine
+from app.database import dispose_async_engine
+from app.deps import create_places_client, shared_http_client
+from app.pagination import NEXT_CURSOR_HEADER
+from app.services.autocomplete import create_autocomplete_cache
+from app.services.cache import LRUCache, create_place_cache
+from app.services.clustering import ClusterIndexCache
+from app.services.governor import UpstreamUnavailable, create_upstream_governors
+from app.services.passwords import create_password_hasher
+from app.services.photos import PhotoBaseURLMiddleware, create_photo_store
+from app.services.ratelimit import RATE_LIMIT_HEADERS, RateLimitMiddleware, create_rate_limiter
+from app.services.refresh import DestinationRefresher, ReadCounter
+from app.services.singleflight import SingleFlight
+from app.services.throttle import TokenBucket
+from app.services.tiles import create_marker_tile_cache
+from app.tools.migrate import migrate
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create database tables and backfill derived columns, unless the deploy runs app.tools.migrate instead
+    if settings.run_migrations_on_startup:
+        await run_in_threadpool(migrate)
+
+    # The pooled Google Maps / Places client is built on the first upstream call
+    app.state.http_client = None
+    app.state.place_cache = create_place_cache()
+    app.state.autocomplete_cache = create_autocomplete_cache()
+    app.state.marker_tile_cache = create_marker_tile_cache()
+    app.state.cluster_index = ClusterIndexCache(ttl=settings.marker_cluster_index_ttl)
+    app.state.single_flight = SingleFlight()
+    app.state.upstream_governors = create_upstream_governors()
+    app.state.photo_store = await run_in_threadpool(create_photo_store)
+    app.state.destination_reads = ReadCounter()
+    app.state.password_hasher = create_password_hasher()
+    app.state.rate_limiter = create_rate_limiter()
+    app.state.principal_cache = LRUCache(maxsize=settings.principal_cache_size, ttl=settings.principal_cache_ttl)
+
+    refresh_task = None
+    if settings.destination_refresh_enabled:
+        refresher = DestinationRefresher(
+            lambda: create_places_client(
+                shared_http_client(app.state),
+                app.state.place_cache,
+                app.state.single_flight,
+                app.state.upstream_governors
+            ),
+            app.state.destination_reads,
+            TokenBucket(settings.destination_refresh_rps),
+            batch_size=settings.destination_refresh_batch,
+            interval=settings.destination_refresh_interval,
+        )
+        refresh_task = asyncio.create_task(refresher.run())
+    try:
+        yield
+    finally:
+        if refresh_task is not None:
+            refresh_task.cancel()
+        if app.state.http_client is not None:
+            await app.state.http_client.aclose()
+        app.state.password_hasher.shutdown()
+        await app.state.place_cache.close()
+        if app.state.rate_limiter is not None:
+            await app.state.rate_limiter.close()
+        await dispose_async_engine()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.VERSION,
+    lifespan=lifespan,
 )
 
+# Photo URLs in responses are made absolute against the request's origin
+app.add_middleware(PhotoBaseURLMiddleware)
+
+# Added before CORS so that 429 responses still carry CORS headers
+app.add_middleware(RateLimitMiddleware)
+
 # Disable CORS. Do not remove this for full-stack development.
 app.add_middleware(
     CORSMiddleware,
@@ -19,6 +89,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
+    # Cross-origin clients can only read response headers listed here
+    expose_headers=[NEXT_CURSOR_HEADER, *RATE_LIMIT_HEADERS],
 )
 
 # Include routers
@@ -30,6 +102,16 @@ app.include_router(contact.router, prefix=f"{settings.API_V1_STR}/contact", tags
 app.include_router(i18n.router, prefix=f"{settings.API_V1_STR}/i18n", tags=["i18n"])
 app.include_router(locations.router, prefix=f"{settings.API_V1_STR}/locations", tags=["locations"])
 app.include_router(maps.router, prefix=f"{settings.API_V1_STR}/maps", tags=["maps"])
+app.include_router(photos.router, prefix=f"{settings.API_V1_STR}/photos", tags=["photos"])
+
+@app.exception_handler(UpstreamUnavailable)
+async def upstream_unavailable_handler(request: Request, exc: UpstreamUnavailable):
+    # Google is failing or our budget for it is spent; tell clients when to come back
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Location service is temporarily unavailable, please retry shortly"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 @app.get("/healthz")
 async def healthz():
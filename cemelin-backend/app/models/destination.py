@@ -1,6 +1,7 @@
-from sqlalchemy import Column, String, Text, Float, Integer, ForeignKey, JSON
+from sqlalchemy import Column, String, Text, Float, Integer, ForeignKey, JSON, event
 from sqlalchemy.orm import relationship
 from app.models.base import BaseModel
+from app.services.geo import encode_geohash
 
 class Destination(BaseModel):
     __tablename__ = "destinations"
@@ -12,6 +13,7 @@ class Destination(BaseModel):
     images = Column(JSON, default=list)
     latitude = Column(Float)
     longitude = Column(Float)
+    geohash = Column(String(12), index=True)  # Derived from latitude/longitude for area queries
     country = Column(String, index=True)
     city = Column(String, index=True)
     place_id = Column(String, unique=True, index=True)
@@ -23,6 +25,34 @@ class Destination(BaseModel):
     website = Column(String)
     phone_number = Column(String)
     opening_hours = Column(JSON)
+    # Epoch seconds each field group was last fetched, see app.services.refresh
+    refreshed_at = Column(JSON)
+    next_refresh_at = Column(Float, index=True)  # Epoch seconds the first field group is due
+    read_count = Column(Integer, default=0)  # Reads since the last refresh
     
     reviews = relationship("Review", back_populates="destination")
     trips = relationship("TripDestination", back_populates="destination")
+    rating_stats = relationship("DestinationRating", back_populates="destination", uselist=False)
+
+@event.listens_for(Destination, "before_insert")
+@event.listens_for(Destination, "before_update")
+def _set_geohash(mapper, connection, target):
+    if target.latitude is None or target.longitude is None:
+        target.geohash = None
+    else:
+        target.geohash = encode_geohash(target.latitude, target.longitude)
+
+class DestinationRating(BaseModel):
+    """Running totals of a destination's reviews, updated with every review insert"""
+    __tablename__ = "destination_ratings"
+
+    destination_id = Column(Integer, ForeignKey("destinations.id", ondelete="CASCADE"), unique=True, nullable=False)
+    ratings_count = Column(Integer, nullable=False, default=0)
+    ratings_sum = Column(Integer, nullable=False, default=0)
+    stars_1 = Column(Integer, nullable=False, default=0)
+    stars_2 = Column(Integer, nullable=False, default=0)
+    stars_3 = Column(Integer, nullable=False, default=0)
+    stars_4 = Column(Integer, nullable=False, default=0)
+    stars_5 = Column(Integer, nullable=False, default=0)
+
+    destination = relationship("Destination", back_populates="rating_stats")
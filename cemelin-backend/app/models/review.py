@@ -1,9 +1,13 @@
-from sqlalchemy import Column, String, Integer, Text, ForeignKey
+from sqlalchemy import Column, String, Integer, Text, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from app.models.base import BaseModel
 
 class Review(BaseModel):
     __tablename__ = "reviews"
+    __table_args__ = (
+        # Keyset pagination of a destination's reviews by (created_at, id)
+        Index("ix_reviews_destination_id_created_at_id", "destination_id", "created_at", "id"),
+    )
 
     rating = Column(Integer, nullable=False)
     comment = Column(Text)
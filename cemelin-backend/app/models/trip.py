@@ -1,9 +1,13 @@
-from sqlalchemy import Column, String, Integer, ForeignKey, Table, Date, Text, Boolean
+from sqlalchemy import Column, String, Integer, ForeignKey, Table, Date, Text, Boolean, Index
 from sqlalchemy.orm import relationship
 from app.models.base import BaseModel
 
 class Trip(BaseModel):
     __tablename__ = "trips"
+    __table_args__ = (
+        # Keyset pagination of a user's trips by (start_date, id)
+        Index("ix_trips_user_id_start_date_id", "user_id", "start_date", "id"),
+    )
 
     title = Column(String, nullable=False)
     description = Column(Text)
@@ -1,4 +1,5 @@
 from sqlalchemy import Column, String, Boolean, DateTime
+from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.models.base import BaseModel
 
@@ -23,3 +24,5 @@ class User(BaseModel):
     # Timestamps
     last_login = Column(DateTime, nullable=True)
     password_changed_at = Column(DateTime, nullable=True)
+
+    trips = relationship("Trip", back_populates="user")
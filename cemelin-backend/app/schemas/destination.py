@@ -1,5 +1,7 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_serializer
 from typing import Optional, List, Dict
+from app.schemas.photo import PhotoRef
+from app.services.photos import absolute_photo_url
 
 class Activity(BaseModel):
     name: str
@@ -31,6 +33,15 @@ class DestinationBase(BaseModel):
     phone_number: Optional[str] = None
     opening_hours: Optional[OpeningHours] = None
 
+    # Photos are stored as /photos paths, which other origins can't load as they are
+    @field_serializer("image_url")
+    def _absolute_image_url(self, image_url: Optional[str]) -> Optional[str]:
+        return absolute_photo_url(image_url) if image_url else image_url
+
+    @field_serializer("images")
+    def _absolute_images(self, images: List[str]) -> List[str]:
+        return [absolute_photo_url(image) for image in images]
+
 class DestinationCreate(DestinationBase):
     pass
 
@@ -40,6 +51,9 @@ class Destination(DestinationBase):
     class Config:
         from_attributes = True
 
+class DestinationNearby(Destination):
+    distance: float  # Meters from the query point
+
 class DestinationSearch(BaseModel):
     query: str
     latitude: Optional[float] = None
@@ -54,6 +68,7 @@ class PlaceDetails(BaseModel):
     geometry: Dict[str, Dict[str, float]]
     rating: Optional[float] = None
     photos: List[str] = Field(default_factory=list)
+    photo_refs: List[PhotoRef] = Field(default_factory=list)  # Resolve lazily through /photos or /photos/batch
     opening_hours: Optional[OpeningHours] = None
     price_level: Optional[int] = None
     website: Optional[str] = None
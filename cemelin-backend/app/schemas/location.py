@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field
 from typing import List, Optional
 from datetime import datetime
+from app.schemas.photo import PhotoRef
 
 class Coordinates(BaseModel):
     lat: float
@@ -9,6 +10,8 @@ class Coordinates(BaseModel):
 class MapBounds(BaseModel):
     center: Coordinates
     radius: float = Field(..., description="Search radius in meters")
+    zoom: Optional[int] = Field(None, ge=0, le=22, description="Map zoom level; derived from radius if omitted")
+    cluster: bool = Field(False, description="Group nearby markers into clusters")
 
 class MapMarker(BaseModel):
     lat: float
@@ -18,6 +21,19 @@ class MapMarker(BaseModel):
     rating: Optional[float] = None
     icon: Optional[str] = None
 
+class MarkerCluster(BaseModel):
+    lat: float  # Centroid of the clustered markers
+    lng: float
+    count: int
+    zoom: int
+    expansion_zoom: int  # Zoom at which the cluster splits up
+
+class StaticMapBatch(BaseModel):
+    place_ids: List[str] = Field(..., min_length=1, max_length=50)
+    width: int = 600
+    height: int = 400
+    zoom: int = 15
+
 class LocationBase(BaseModel):
     place_id: str
     name: str
@@ -38,6 +54,7 @@ class LocationSearchResult(LocationBase):
 class LocationDetails(LocationBase):
     description: Optional[str] = None
     photos: List[str] = []
+    photo_refs: List[PhotoRef] = []  # Resolve lazily through /photos or /photos/batch
     rating: Optional[float] = None
     user_ratings_total: Optional[int] = None
     website: Optional[str] = None
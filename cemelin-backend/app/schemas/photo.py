@@ -0,0 +1,13 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+class PhotoRef(BaseModel):
+    reference: str
+    width: Optional[int] = None  # Size of the original image in pixels
+    height: Optional[int] = None
+    url: str  # /photos URL for the image at the default width
+
+class PhotoBatch(BaseModel):
+    references: List[str] = Field(..., min_length=1, max_length=50)
+    max_width: int = Field(800, ge=1, le=1600)
+    warm: bool = False  # Download uncached photos in the background after responding
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, conint
-from typing import Optional
+from typing import Dict, Optional
 from datetime import datetime
 
 class ReviewBase(BaseModel):
@@ -17,3 +17,9 @@ class Review(ReviewBase):
     
     class Config:
         from_attributes = True
+
+class RatingStats(BaseModel):
+    destination_id: int
+    count: int = 0
+    average: Optional[float] = None
+    histogram: Dict[int, int]  # Number of reviews per star rating, 1 to 5
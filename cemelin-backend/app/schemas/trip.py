@@ -43,11 +43,18 @@ class Trip(TripBase):
     id: int
     user_id: int
     created_at: datetime
-    updated_at: datetime
+    updated_at: Optional[datetime] = None
     destinations: List[TripDestination] = Field(default_factory=list)
 
     class Config:
         from_attributes = True
 
+class TripDestinationReorder(TripDestinationBase):
+    id: Optional[int] = None  # Existing stop to keep; omit for new stops
+
 class TripReorder(BaseModel):
-    destinations: List[TripDestinationCreate]
+    destinations: List[TripDestinationReorder]
+
+class TripDestinationMove(BaseModel):
+    day_number: int = Field(..., ge=1)
+    position: int = Field(..., ge=0)  # Index within the day, 0 is first
@@ -31,6 +31,14 @@ class Token(BaseModel):
 
 class TokenPayload(BaseModel):
     sub: Optional[int] = None
+    iat: Optional[int] = None  # Issued at, epoch seconds
+
+class Principal(BaseModel):
+    """What authenticated endpoints need to know about the caller, cached per user id"""
+    id: int
+    is_active: bool
+    is_superuser: bool
+    password_changed_at: Optional[datetime] = None
 
 class PasswordReset(BaseModel):
     email: EmailStr
@@ -0,0 +1,67 @@
+import re
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+from app.services.cache import LRUCache
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.casefold().split())
+
+
+def _matches(prediction: Dict[str, Any], query: str) -> bool:
+    """True when every query token is a prefix of a word in the prediction."""
+    words = re.findall(r"\w+", prediction.get("description", "").casefold())
+    return all(any(word.startswith(token) for word in words) for token in re.findall(r"\w+", query))
+
+
+class AutocompleteCache:
+    """
+    Autocomplete predictions keyed by normalized query and language.
+
+    When a query misses, the longest cached prefix of at least min_prefix
+    characters is consulted. Its predictions are reused for the longer
+    query only if every one of them still matches it ("bal" -> "bali" when
+    all the "bal" suggestions are about Bali). Google's matching is fuzzy
+    and the list is capped at a page, so a list we would have to filter
+    may be missing better matches; that case goes upstream.
+    """
+
+    def __init__(self, maxsize: int = 4096, ttl: float = 3600, min_prefix: int = 2):
+        self.min_prefix = min_prefix
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    @staticmethod
+    def _key(query: str, language: str, types: Optional[str]) -> str:
+        return f"{language}:{types or ''}:{query}"
+
+    def get(self, query: str, language: str, types: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        query = normalize_query(query)
+        predictions = self._cache.get(self._key(query, language, types))
+        if predictions is not None:
+            return predictions
+
+        for end in range(len(query) - 1, self.min_prefix - 1, -1):
+            prefix_predictions = self._cache.get(self._key(query[:end], language, types))
+            if prefix_predictions is None:
+                continue
+            if not prefix_predictions or not all(_matches(p, query) for p in prefix_predictions):
+                # Narrowing would drop suggestions Google might replace with others
+                return None
+            self._cache.set(self._key(query, language, types), prefix_predictions)
+            return prefix_predictions
+        return None
+
+    def get_stale(self, query: str, language: str, types: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        """An expired entry for exactly this query, for use while Google is unavailable"""
+        return self._cache.get(self._key(normalize_query(query), language, types), allow_stale=True)
+
+    def set(self, query: str, language: str, predictions: List[Dict[str, Any]], types: Optional[str] = None) -> None:
+        self._cache.set(self._key(normalize_query(query), language, types), predictions)
+
+
+def create_autocomplete_cache() -> AutocompleteCache:
+    return AutocompleteCache(
+        maxsize=settings.autocomplete_cache_size,
+        ttl=settings.autocomplete_cache_ttl,
+    )
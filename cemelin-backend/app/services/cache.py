@@ -0,0 +1,304 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Iterable, Optional, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """
+    In-process cache with a per-entry TTL and least-recently-used eviction
+    once maxsize entries are stored.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str, default: Any = None, allow_stale: bool = False) -> Any:
+        """
+        The value for `key` unless it has expired. Expired entries are kept
+        until evicted, so `allow_stale` can still return them while the
+        upstream they came from is unavailable.
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic() and not allow_stale:
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def expires_in(self, key: str) -> Optional[float]:
+        """Seconds until `key` expires, or None when it is not stored"""
+        entry = self._data.get(key)
+        return None if entry is None else entry[0] - time.monotonic()
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class CacheBackend:
+    """Interface for the optional shared cache tier. Values must be JSON-serialisable."""
+
+    async def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    async def get_with_ttl(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        """The value and the seconds it has left, or None for the TTL when the backend can't tell"""
+        value = await self.get(key)
+        return None if value is None else (value, None)
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryBackend(CacheBackend):
+    """Local stand-in for a shared tier, used in tests and single-process setups."""
+
+    def __init__(self, max_entries: int = 10000):
+        self._cache = LRUCache(maxsize=max_entries)
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = self._cache.get(key)
+        # Round-trip through JSON so callers see the same types as with a real shared tier
+        return None if value is None else json.loads(value)
+
+    async def get_with_ttl(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        value = await self.get(key)
+        return None if value is None else (value, self._cache.expires_in(key))
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        self._cache.set(key, json.dumps(value), ttl)
+
+    async def delete(self, key: str) -> None:
+        self._cache.delete(key)
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    Shared tier stored in a SQLite file, so every worker on a machine sees
+    the same entries. Calls run in a thread to keep the event loop free.
+    """
+
+    PRUNE_EVERY = 100
+
+    def __init__(self, path: str, max_entries: int = 50000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_cache_entries_accessed_at ON cache_entries (accessed_at)"
+        )
+
+    def _get(self, key: str) -> Optional[Tuple[Any, float]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache_entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+                return None
+            self._conn.execute(
+                "UPDATE cache_entries SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+        return json.loads(row[0]), row[1] - now
+
+    def _set(self, key: str, value: Any, ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + ttl, now),
+            )
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                self._prune(now)
+
+    def _prune(self, now: float) -> None:
+        self._conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM cache_entries").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM cache_entries WHERE key IN ("
+                "SELECT key FROM cache_entries ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def _delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = await asyncio.to_thread(self._get, key)
+        return None if entry is None else entry[0]
+
+    async def get_with_ttl(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        await asyncio.to_thread(self._set, key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._delete, key)
+
+    async def close(self) -> None:
+        self._conn.close()
+
+
+class RedisBackend(CacheBackend):
+    """
+    Shared tier on any Redis-compatible server. Size-bounded eviction is
+    left to the server's maxmemory policy (allkeys-lru).
+    """
+
+    def __init__(self, url: str, prefix: str = "cemelin:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("The redis package is required for the redis cache backend")
+        self.prefix = prefix
+        self._client = redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = await self._client.get(self.prefix + key)
+        return None if value is None else json.loads(value)
+
+    async def get_with_ttl(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        async with self._client.pipeline(transaction=False) as pipe:
+            value, ttl_ms = await pipe.get(self.prefix + key).pttl(self.prefix + key).execute()
+        if value is None:
+            return None
+        # PTTL is negative for keys without an expiry
+        return json.loads(value), ttl_ms / 1000 if ttl_ms >= 0 else None
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        await self._client.set(self.prefix + key, json.dumps(value), ex=max(1, int(ttl)))
+
+    async def delete(self, key: str) -> None:
+        await self._client.delete(self.prefix + key)
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+class TwoTierCache:
+    """
+    In-process LRU in front of an optional shared backend. Hits on the
+    shared tier are promoted into the local tier.
+    """
+
+    def __init__(self, local: LRUCache, shared: Optional[CacheBackend] = None):
+        self.local = local
+        self.shared = shared
+
+    async def get(self, key: str, allow_stale: bool = False) -> Optional[Any]:
+        # Only the local tier keeps expired entries around for allow_stale
+        value = self.local.get(key, allow_stale=allow_stale)
+        if value is not None or self.shared is None:
+            return value
+        try:
+            entry = await self.shared.get_with_ttl(key)
+        except Exception as e:
+            logger.warning(f"Shared cache read failed: {str(e)}")
+            return None
+        if entry is None:
+            return None
+        value, remaining = entry
+        # Never keep the local copy past the shared entry's own expiry
+        ttl = self.local.ttl if remaining is None else min(self.local.ttl, remaining)
+        if ttl > 0:
+            self.local.set(key, value, ttl)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.local.ttl if ttl is None else ttl
+        self.local.set(key, value, ttl)
+        if self.shared is None:
+            return
+        try:
+            await self.shared.set(key, value, ttl)
+        except Exception as e:
+            logger.warning(f"Shared cache write failed: {str(e)}")
+
+    async def delete(self, key: str) -> None:
+        self.local.delete(key)
+        if self.shared is not None:
+            await self.shared.delete(key)
+
+    async def close(self) -> None:
+        if self.shared is not None:
+            await self.shared.close()
+
+
+def create_shared_backend(backend: str, url: Optional[str], max_entries: int) -> Optional[CacheBackend]:
+    if not backend or backend == "none":
+        return None
+    if backend == "memory":
+        return MemoryBackend(max_entries=max_entries)
+    if backend == "sqlite":
+        return SQLiteBackend(url or "place_cache.db", max_entries=max_entries)
+    if backend == "redis":
+        return RedisBackend(url or "redis://localhost:6379/0")
+    raise ValueError(f"Unknown cache backend: {backend}")
+
+
+def create_place_cache() -> TwoTierCache:
+    return TwoTierCache(
+        LRUCache(maxsize=settings.place_cache_size, ttl=settings.place_cache_ttl),
+        create_shared_backend(
+            settings.place_cache_backend,
+            settings.place_cache_url,
+            settings.place_cache_shared_max_entries,
+        ),
+    )
+
+
+def place_details_key(place_id: str, fields: Iterable[str], language: Optional[str]) -> str:
+    return f"details:{place_id}:{','.join(sorted(set(fields)))}:{language or ''}"
+
+
+def place_coordinates_key(place_id: str) -> str:
+    return f"coords:{place_id}"
@@ -0,0 +1,151 @@
+"""
+Server-side marker clustering on a per-zoom grid.
+
+At every zoom level the map is divided into square cells of CELL_PX screen
+pixels, and the markers in a cell are reported as one cluster at their
+centroid. A view therefore never returns more items than it has cells,
+however many markers are underneath. Grids for all zoom levels are built
+once per index, so a query is a filter over precomputed cells.
+"""
+import asyncio
+import math
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from app.schemas.location import MapMarker, MarkerCluster
+from app.services.geo import BBox, in_bbox
+from app.services.tiles import MAX_LATITUDE
+
+CELL_PX = 64
+TILE_PX = 256
+MAX_CLUSTER_ZOOM = 16  # Above this every marker is returned on its own
+
+Cell = Tuple[int, int]
+
+
+@dataclass
+class _Cluster:
+    count: int = 0
+    lat_sum: float = 0.0
+    lng_sum: float = 0.0
+    marker: Optional[MapMarker] = None  # Set while the cluster holds a single marker
+    expansion_zoom: int = 0
+
+    def add(self, marker: MapMarker) -> None:
+        self.count += 1
+        self.lat_sum += marker.lat
+        self.lng_sum += marker.lng
+        self.marker = marker if self.count == 1 else None
+
+    def item(self, zoom: int) -> Union[MapMarker, MarkerCluster]:
+        if self.marker is not None:
+            return self.marker
+        return MarkerCluster(
+            lat=self.lat_sum / self.count,
+            lng=self.lng_sum / self.count,
+            count=self.count,
+            zoom=zoom,
+            expansion_zoom=self.expansion_zoom,
+        )
+
+
+def _mercator(lat: float, lng: float) -> Tuple[float, float]:
+    """Position in the web mercator world square, both in [0, 1)"""
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    x = (lng + 180.0) / 360.0
+    y = (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0
+    return min(x, 1 - 1e-12), min(y, 1 - 1e-12)
+
+
+def _cells_per_side(zoom: int) -> int:
+    return 2 ** zoom * TILE_PX // CELL_PX
+
+
+class GridClusterIndex:
+    """Markers grouped into grid cells for every zoom in [min_zoom, max_zoom]"""
+
+    def __init__(self, markers: List[MapMarker], min_zoom: int = 0, max_zoom: int = MAX_CLUSTER_ZOOM):
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.markers = markers
+        self._levels: Dict[int, Dict[Cell, _Cluster]] = {}
+
+        positions = [_mercator(marker.lat, marker.lng) for marker in markers]
+        for zoom in range(min_zoom, max_zoom + 1):
+            side = _cells_per_side(zoom)
+            level: Dict[Cell, _Cluster] = {}
+            for marker, (x, y) in zip(markers, positions):
+                level.setdefault((int(x * side), int(y * side)), _Cluster()).add(marker)
+            self._levels[zoom] = level
+
+        # A cell splits at the first finer zoom where its markers land in more
+        # than one child cell; cells are halved at every zoom step
+        for zoom in range(max_zoom, min_zoom - 1, -1):
+            finer = self._levels.get(zoom + 1)
+            for (cx, cy), cluster in self._levels[zoom].items():
+                if finer is None:
+                    cluster.expansion_zoom = zoom + 1
+                    continue
+                children = [
+                    finer[child] for child in
+                    ((2 * cx, 2 * cy), (2 * cx + 1, 2 * cy), (2 * cx, 2 * cy + 1), (2 * cx + 1, 2 * cy + 1))
+                    if child in finer
+                ]
+                cluster.expansion_zoom = zoom + 1 if len(children) > 1 else children[0].expansion_zoom
+
+    def query(self, bbox: BBox, zoom: int) -> List[Union[MapMarker, MarkerCluster]]:
+        """Clusters and single markers whose position falls inside `bbox`"""
+        if zoom > self.max_zoom:
+            return [marker for marker in self.markers if in_bbox(marker.lat, marker.lng, bbox)]
+        zoom = max(zoom, self.min_zoom)
+        items = [cluster.item(zoom) for cluster in self._levels[zoom].values()]
+        return [item for item in items if in_bbox(item.lat, item.lng, bbox)]
+
+
+def cluster_markers(markers: List[MapMarker], bbox: BBox, zoom: int) -> List[Union[MapMarker, MarkerCluster]]:
+    """Cluster an ad hoc set of markers, e.g. upstream results, at one zoom"""
+    zoom = min(zoom, MAX_CLUSTER_ZOOM)
+    return GridClusterIndex(markers, min_zoom=zoom, max_zoom=zoom).query(bbox, zoom)
+
+
+class ClusterIndexCache:
+    """
+    Holds the index over all stored destinations and rebuilds it in a
+    worker thread once it is older than `ttl` seconds, or on the next
+    request after invalidate(). Concurrent requests wait for the same
+    rebuild. Each worker has its own index, so a destination stored by
+    another worker shows up within `ttl` seconds.
+    """
+
+    def __init__(self, ttl: float = 300):
+        self.ttl = ttl
+        self._index: Optional[GridClusterIndex] = None
+        self._built_at = 0.0
+        # Bumped by invalidate(), so a rebuild that loaded before the change doesn't count as fresh
+        self._generation = 0
+        self._built_generation = 0
+        self._lock = asyncio.Lock()
+
+    def _fresh(self) -> bool:
+        return (
+            self._index is not None
+            and self._built_generation == self._generation
+            and time.monotonic() - self._built_at < self.ttl
+        )
+
+    async def get(self, load: Callable[[], Awaitable[List[MapMarker]]]) -> GridClusterIndex:
+        if self._fresh():
+            return self._index
+        async with self._lock:
+            if not self._fresh():
+                generation = self._generation
+                markers = await load()
+                self._index = await asyncio.to_thread(GridClusterIndex, markers)
+                self._built_at = time.monotonic()
+                self._built_generation = generation
+        return self._index
+
+    def invalidate(self) -> None:
+        """Rebuild on the next request, e.g. after a destination was stored"""
+        self._generation += 1
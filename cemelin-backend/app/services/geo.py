@@ -0,0 +1,160 @@
+"""
+Geohash indexing and distance helpers for stored destinations.
+
+A geohash turns a coordinate into a string whose prefixes are nested
+rectangular cells, so a plain B-tree index on the string answers
+"everything in this cell" as a range scan on SQLite and Postgres alike,
+whatever the column's collation.
+Area queries cover the area with a handful of cells, scan those ranges,
+and then filter the candidates exactly in Python.
+"""
+import math
+from typing import Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import ColumnElement, and_, or_
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9  # About 5 m cells, stored on every destination
+MAX_QUERY_CELLS = 16  # Cells used to cover one query area
+EARTH_RADIUS_M = 6_371_008.8
+
+# (south, west, north, east) in degrees
+BBox = Tuple[float, float, float, float]
+
+
+def encode_geohash(lat: float, lng: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True  # Bits alternate, starting with longitude
+    while len(chars) < precision:
+        interval, coordinate = (lng_range, lng) if even else (lat_range, lat)
+        mid = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= mid:
+            value |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """Height and width in degrees of a geohash cell"""
+    lng_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def _steps(start: float, end: float, step: float) -> Iterable[float]:
+    value = start
+    while value < end:
+        yield value
+        value += step
+    yield end
+
+
+def covering_cells(bbox: BBox, max_cells: int = MAX_QUERY_CELLS) -> Set[str]:
+    """The finest set of at most `max_cells` geohash prefixes that covers `bbox`"""
+    south, west, north, east = bbox
+    if west > east:
+        # Crosses the antimeridian
+        return covering_cells((south, west, north, 180.0), max_cells) | \
+            covering_cells((south, -180.0, north, east), max_cells)
+
+    best = {""}
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        height, width = cell_size(precision)
+        rows = math.floor((north + 90.0) / height) - math.floor((south + 90.0) / height) + 1
+        columns = math.floor((east + 180.0) / width) - math.floor((west + 180.0) / width) + 1
+        if rows * columns > max_cells:
+            break
+        best = {
+            encode_geohash(lat, lng, precision)
+            for lat in _steps(south, north, height)
+            for lng in _steps(west, east, width)
+        }
+    return best
+
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bbox_around(lat: float, lng: float, radius_m: float) -> BBox:
+    """Bounding box of a circle; longitudes wrap across the antimeridian"""
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    south, north = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    if south <= -90.0 or north >= 90.0:
+        return south, -180.0, north, 180.0
+    dlng = math.degrees(radius_m / (EARTH_RADIUS_M * math.cos(math.radians(lat))))
+    if dlng >= 180.0:
+        return south, -180.0, north, 180.0
+    west = (lng - dlng + 540.0) % 360.0 - 180.0
+    east = (lng + dlng + 540.0) % 360.0 - 180.0
+    return south, west, north, east
+
+
+def in_bbox(lat: float, lng: float, bbox: BBox) -> bool:
+    south, west, north, east = bbox
+    if not south <= lat <= north:
+        return False
+    if west <= east:
+        return west <= lng <= east
+    return lng >= west or lng <= east
+
+
+def next_cell(cell: str) -> Optional[str]:
+    """
+    The smallest geohash that sorts after every geohash starting with
+    `cell`, or None when there is none ("u4pz" -> "u4q", "zz" -> None)
+    """
+    while cell:
+        position = GEOHASH_ALPHABET.index(cell[-1]) + 1
+        if position < len(GEOHASH_ALPHABET):
+            return cell[:-1] + GEOHASH_ALPHABET[position]
+        cell = cell[:-1]
+    return None
+
+
+def cells_clause(column, cells: Set[str]) -> ColumnElement:
+    """Rows whose geohash `column` falls in any of `cells`, as index range scans"""
+    if "" in cells:
+        return column.is_not(None)
+    # Both bounds use only geohash characters (lowercase letters and digits),
+    # which sort the same in byte order and in locale collations such as
+    # en_US.UTF-8. Punctuation sentinels do not: "{" sorts before "0" there.
+    ranges = []
+    for cell in sorted(cells):
+        upper = next_cell(cell)
+        ranges.append(column >= cell if upper is None else and_(column >= cell, column < upper))
+    return or_(*ranges)
+
+
+def filter_within(destinations: Iterable, bbox: BBox, limit: int) -> List:
+    return [d for d in destinations if in_bbox(d.latitude, d.longitude, bbox)][:limit]
+
+
+def filter_nearby(
+    destinations: Iterable, lat: float, lng: float, radius_m: float, limit: int
+) -> List[Tuple[object, float]]:
+    """Destinations inside the circle with their distance in meters, nearest first"""
+    hits = []
+    for destination in destinations:
+        distance = haversine_m(lat, lng, destination.latitude, destination.longitude)
+        if distance <= radius_m:
+            hits.append((destination, distance))
+    hits.sort(key=lambda hit: hit[1])
+    return hits[:limit]
@@ -0,0 +1,206 @@
+"""
+Central guard for calls to Google APIs.
+
+Each upstream API (Places web service, Place Photos) gets one
+UpstreamGovernor per worker. Every call first takes a token from the API's
+requests-per-second budget and one of its concurrency slots, waiting at
+most queue_timeout for either, and then runs under an overall deadline.
+Timeouts, connection errors, 5xx/429 answers and transient Places
+statuses are retried with full-jitter exponential backoff when the call is
+idempotent, and counted by a circuit breaker. After enough consecutive
+failures the breaker opens and calls fail fast with UpstreamUnavailable
+(answered with 503 and Retry-After) until a single trial call succeeds.
+Callers holding a cached copy serve it, even if expired, instead of
+failing; see is_degraded().
+"""
+import asyncio
+import logging
+import math
+import random
+import time
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+
+from app.config import settings
+from app.services.throttle import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+PLACES_API = "places"
+PHOTOS_API = "photos"
+
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling an API whose breaker is open or whose budget is exhausted."""
+
+    def __init__(self, api: str, retry_after: float):
+        super().__init__(f"Upstream {api} API is temporarily unavailable")
+        self.api = api
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Failures worth retrying and counting against the upstream's health"""
+    if isinstance(exc, (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError, asyncio.TimeoutError)):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500 or exc.response.status_code == 429
+    # e.g. PlacesError with UNKNOWN_ERROR
+    return getattr(exc, "transient", False)
+
+
+def is_degraded(exc: BaseException) -> bool:
+    """Whether a failed call may be answered from stale cache instead"""
+    return isinstance(exc, UpstreamUnavailable) or is_transient(exc)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures. Once
+    `reset_timeout` seconds have passed, one trial call is let through:
+    success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        now = time.monotonic()
+        # A trial that never reported back (e.g. cancelled) is given up on after reset_timeout
+        if state == "half_open" and (self._trial_at is None or now - self._trial_at >= self.reset_timeout):
+            self._trial_at = now
+            return True
+        return False
+
+    def retry_after(self) -> float:
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._opened_at = None
+        self._trial_at = None
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._trial_at is not None or self._failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(f"Opening upstream circuit after {self._failures} consecutive failures")
+            self._opened_at = time.monotonic()
+        self._trial_at = None
+
+
+class UpstreamGovernor:
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: int,
+        max_concurrency: int,
+        timeout: float = 15.0,
+        queue_timeout: float = 2.0,
+        retries: int = 2,
+        backoff_base: float = 0.2,
+        backoff_max: float = 2.0,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.name = name
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.bucket = TokenBucket(rate, burst)
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter, so retries from many requests do not arrive together
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def _attempt(self, fn: Callable[[], Awaitable[T]]) -> T:
+        try:
+            await asyncio.wait_for(self.bucket.acquire(), self.queue_timeout)
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise UpstreamUnavailable(self.name, self.queue_timeout)
+        try:
+            return await asyncio.wait_for(fn(), self.timeout)
+        finally:
+            self._slots.release()
+
+    async def call(self, fn: Callable[[], Awaitable[T]], idempotent: bool = True) -> T:
+        """Run `fn` within this API's budget; only idempotent calls are retried"""
+        attempts = self.retries + 1 if idempotent else 1
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise UpstreamUnavailable(self.name, self.breaker.retry_after())
+            try:
+                result = await self._attempt(fn)
+            except UpstreamUnavailable:
+                raise
+            except Exception as e:
+                if not is_transient(e):
+                    # The API answered; the request itself was rejected
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                attempt += 1
+                if attempt >= attempts:
+                    raise
+                logger.warning(f"Retrying {self.name} call after {type(e).__name__}: {str(e)}")
+                await asyncio.sleep(self._backoff(attempt - 1))
+            else:
+                self.breaker.record_success()
+                return result
+
+
+def create_upstream_governors() -> Dict[str, UpstreamGovernor]:
+    def governor(name: str, rate: float, burst: int, max_concurrency: int) -> UpstreamGovernor:
+        return UpstreamGovernor(
+            name,
+            rate=rate,
+            burst=burst,
+            max_concurrency=max_concurrency,
+            timeout=settings.upstream_call_timeout,
+            queue_timeout=settings.upstream_queue_timeout,
+            retries=settings.upstream_retries,
+            backoff_base=settings.upstream_backoff_base,
+            backoff_max=settings.upstream_backoff_max,
+            breaker=CircuitBreaker(settings.upstream_breaker_failures, settings.upstream_breaker_reset),
+        )
+
+    return {
+        PLACES_API: governor(
+            PLACES_API,
+            settings.upstream_places_rps,
+            settings.upstream_places_burst,
+            settings.upstream_places_max_concurrency,
+        ),
+        PHOTOS_API: governor(
+            PHOTOS_API,
+            settings.upstream_photos_rps,
+            settings.upstream_photos_burst,
+            settings.upstream_photos_max_concurrency,
+        ),
+    }
@@ -0,0 +1,35 @@
+import importlib.util
+import logging
+
+import httpx
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def create_upstream_client() -> httpx.AsyncClient:
+    """
+    Build the application-wide HTTP client for Google Maps / Places calls.
+
+    The client keeps a pool of keep-alive connections, so requests reuse
+    an open TLS connection instead of paying a handshake every time. It is
+    created once in the app lifespan and closed on shutdown.
+    """
+    http2 = settings.upstream_http2
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("upstream_http2 is enabled but the h2 package is not installed; using HTTP/1.1")
+        http2 = False
+
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=settings.upstream_max_connections,
+            max_keepalive_connections=settings.upstream_max_keepalive_connections,
+            keepalive_expiry=settings.upstream_keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(
+            settings.upstream_timeout,
+            connect=settings.upstream_connect_timeout,
+        ),
+    )
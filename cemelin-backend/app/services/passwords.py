@@ -0,0 +1,106 @@
+"""
+Password hashing off the request path.
+
+bcrypt costs a few hundred milliseconds of CPU per call. Run inline, a
+burst of logins fills the shared threadpool and stalls every other sync
+endpoint. Hashing and verification run instead on a dedicated, fixed-size
+thread pool (bcrypt releases the GIL while it works). The number of calls
+waiting for that pool is capped: once the cap is reached, new calls fail
+fast with PasswordHasherBusy, and the API answers 503 with Retry-After
+instead of queueing without bound.
+
+The schemes and their cost come from settings. A stored hash made with a
+deprecated scheme or a different cost is replaced on the next successful
+login, so changing the settings migrates users as they sign in.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Tuple
+
+from passlib.context import CryptContext
+
+from app.config import settings
+
+
+
+def create_crypt_context(
+    schemes: Optional[List[str]] = None,
+    bcrypt_rounds: Optional[int] = None,
+    argon2_time_cost: Optional[int] = None,
+    argon2_memory_cost: Optional[int] = None,
+    argon2_parallelism: Optional[int] = None,
+) -> CryptContext:
+    """CryptContext for the configured schemes; arguments override settings"""
+    if schemes is None:
+        schemes = [scheme.strip() for scheme in settings.password_hash_schemes.split(",") if scheme.strip()]
+    options = {}
+    if "bcrypt" in schemes:
+        options["bcrypt__rounds"] = bcrypt_rounds or settings.password_bcrypt_rounds
+    if "argon2" in schemes:
+        options["argon2__time_cost"] = argon2_time_cost or settings.password_argon2_time_cost
+        options["argon2__memory_cost"] = argon2_memory_cost or settings.password_argon2_memory_cost
+        options["argon2__parallelism"] = argon2_parallelism or settings.password_argon2_parallelism
+    # deprecated="auto" marks every scheme but the first as needing a rehash
+    return CryptContext(schemes=schemes, deprecated="auto", **options)
+
+
+pwd_context = create_crypt_context()
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many hash operations are already queued."""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Password hashing is at capacity")
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    def __init__(
+        self,
+        context: CryptContext,
+        workers: int = 2,
+        max_pending: int = 32,
+        retry_after: int = 1,
+    ):
+        self.context = context
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        # Only touched from the event loop, so a plain counter is enough
+        self._pending = 0
+
+    async def _run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self._pending >= self.max_pending:
+            raise PasswordHasherBusy(self.retry_after)
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(self.context.verify, password, hashed_password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Verify, and return a replacement hash when the stored one is outdated"""
+        return await self._run(self.context.verify_and_update, password, hashed_password)
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def create_password_hasher() -> PasswordHasher:
+    return PasswordHasher(
+        pwd_context,
+        workers=settings.password_hash_workers,
+        max_pending=settings.password_hash_max_pending,
+        retry_after=settings.password_hash_retry_after,
+    )
@@ -0,0 +1,187 @@
+"""
+On-disk cache for Places photos, served by /photos.
+
+Image bytes are stored once per content hash under blobs/, so the same
+image reached through different photo references is kept once, and the
+hash doubles as a strong ETag. refs/ maps a (photo_reference, max_width)
+pair to the blob it resolved to. Blobs are evicted least recently used
+first once their total size exceeds max_bytes; reads refresh a blob's
+mtime, which is the recency the eviction goes by.
+
+Destinations store photo proxy paths relative to the API origin, never
+full URLs, so a changed origin needs no data migration. Responses carry
+absolute URLs, built from public_base_url or, when that is unset, the
+origin of the request being served (see PhotoBaseURLMiddleware).
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from contextvars import ContextVar
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from starlette.requests import Request
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.config import settings
+
+DEFAULT_PHOTO_WIDTH = 800
+PHOTO_LIMIT = 5  # Photos listed per place
+
+
+@dataclass
+class StoredPhoto:
+    path: Path
+    digest: str
+    content_type: str
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.digest}"'
+
+
+class PhotoStore:
+    def __init__(self, root: str, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._blobs = self.root / "blobs"
+        self._refs = self.root / "refs"
+        self._blobs.mkdir(parents=True, exist_ok=True)
+        self._refs.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._size = sum(path.stat().st_size for path in self._blobs.glob("*/*"))
+
+    def _blob_path(self, digest: str) -> Path:
+        return self._blobs / digest[:2] / digest
+
+    def _ref_path(self, photo_reference: str, max_width: int) -> Path:
+        name = hashlib.sha256(f"{photo_reference}:{max_width}".encode()).hexdigest()
+        return self._refs / name[:2] / name
+
+    def get(self, photo_reference: str, max_width: int) -> Optional[StoredPhoto]:
+        try:
+            digest, content_type = self._ref_path(photo_reference, max_width).read_text().split(" ", 1)
+            path = self._blob_path(digest)
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            return None
+        return StoredPhoto(path, digest, content_type)
+
+    def put(self, photo_reference: str, max_width: int, content: bytes, content_type: str) -> StoredPhoto:
+        digest = hashlib.sha256(content).hexdigest()
+        path = self._blob_path(digest)
+        with self._lock:
+            if not path.exists():
+                self._write(path, content)
+                self._size += len(content)
+            self._write(self._ref_path(photo_reference, max_width), f"{digest} {content_type}".encode())
+            if self._size > self.max_bytes:
+                self._evict(keep=path)
+        return StoredPhoto(path, digest, content_type)
+
+    def _write(self, path: Path, data: bytes) -> None:
+        # Write then rename, so readers never see a partial file
+        path.parent.mkdir(exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _evict(self, keep: Path) -> None:
+        # Evict down to 90% so a full cache does not scan on every write
+        target = self.max_bytes * 0.9
+        blobs = []
+        for path in self._blobs.glob("*/*"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                # Removed by another worker sharing the directory
+                continue
+            blobs.append((stat.st_mtime, stat.st_size, path))
+        for _, size, path in sorted(blobs):
+            if self._size <= target:
+                break
+            if path == keep:
+                continue
+            path.unlink(missing_ok=True)
+            self._size -= size
+        # refs/ entries whose blob is gone read as misses and are rewritten on the next fetch
+
+
+# Origin of the request being served, set by PhotoBaseURLMiddleware
+_request_base_url: ContextVar[Optional[str]] = ContextVar("request_base_url", default=None)
+
+
+def photo_proxy_path(photo_reference: str, max_width: int = DEFAULT_PHOTO_WIDTH) -> str:
+    """The /photos path for a reference, as stored with destinations"""
+    return f"{settings.API_V1_STR}/photos/{photo_reference}?max_width={max_width}"
+
+
+def absolute_photo_url(url: str) -> str:
+    """`url` with the API origin in front if it is a stored proxy path; other URLs are left alone"""
+    if not url.startswith(f"{settings.API_V1_STR}/photos/"):
+        return url
+    base = settings.public_base_url or _request_base_url.get()
+    return f"{base.rstrip('/')}{url}" if base else url
+
+
+def photo_proxy_url(photo_reference: str, max_width: int = DEFAULT_PHOTO_WIDTH) -> str:
+    return absolute_photo_url(photo_proxy_path(photo_reference, max_width))
+
+
+def photo_proxy_paths(
+    photos: List[Dict[str, Any]],
+    limit: int = PHOTO_LIMIT,
+    max_width: int = DEFAULT_PHOTO_WIDTH,
+) -> List[str]:
+    """Proxy paths for the first `limit` photos of a Places result, for storing; nothing is fetched"""
+    return [photo_proxy_path(photo["photo_reference"], max_width) for photo in photos[:limit]]
+
+
+def photo_proxy_urls(
+    photos: List[Dict[str, Any]],
+    limit: int = PHOTO_LIMIT,
+    max_width: int = DEFAULT_PHOTO_WIDTH,
+) -> List[str]:
+    """Proxy URLs for the first `limit` photos of a Places result; nothing is fetched"""
+    return [absolute_photo_url(path) for path in photo_proxy_paths(photos, limit, max_width)]
+
+
+class PhotoBaseURLMiddleware:
+    """Makes the request's origin available to absolute_photo_url while the request is served"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _request_base_url.set(str(Request(scope).base_url))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_base_url.reset(token)
+
+
+def create_photo_store() -> PhotoStore:
+    return PhotoStore(settings.photo_cache_dir, settings.photo_cache_max_bytes)
+
+
+def photo_refs(
+    photos: List[Dict[str, Any]],
+    limit: int = PHOTO_LIMIT,
+    max_width: int = DEFAULT_PHOTO_WIDTH,
+) -> List[Dict[str, Any]]:
+    """References and original dimensions of the first `limit` photos, for PhotoRef"""
+    return [
+        {
+            "reference": photo["photo_reference"],
+            "width": photo.get("width"),
+            "height": photo.get("height"),
+            "url": photo_proxy_url(photo["photo_reference"], max_width),
+        }
+        for photo in photos[:limit]
+    ]
@@ -0,0 +1,228 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+import httpx
+
+from app.services.cache import TwoTierCache, place_coordinates_key, place_details_key
+from app.services.governor import PHOTOS_API, PLACES_API, UpstreamGovernor, is_degraded
+from app.services.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+PLACES_API_URL = "https://maps.googleapis.com/maps/api/place"
+
+# Statuses Google documents as worth retrying
+TRANSIENT_STATUSES = ("UNKNOWN_ERROR", "OVER_QUERY_LIMIT")
+
+T = TypeVar("T")
+
+
+class PlacesError(Exception):
+    """Raised when the Places API answers with a non-OK status."""
+
+    def __init__(self, status: str):
+        super().__init__(f"Google Places API error: {status}")
+        self.status = status
+
+    @property
+    def transient(self) -> bool:
+        return self.status in TRANSIENT_STATUSES
+
+
+class PlacesClient:
+    """
+    Async client for the Google Places web service.
+
+    Every upstream call goes through one semaphore, so callers can fan out
+    details and photo lookups with asyncio.gather while the number of
+    requests in flight stays capped at max_concurrency. Place Details
+    responses are served from `cache` when one is given, and identical
+    lookups already in flight are coalesced through `flights`.
+
+    The coordinates of every place seen in a search or details response are
+    also kept in `cache`, so callers that only need a location can usually
+    skip the upstream call.
+
+    With `governors`, calls also go through the worker-wide UpstreamGovernor
+    of their API, and Place Details falls back to an expired cache entry
+    while Google is unavailable.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        api_key: str,
+        max_concurrency: int = 10,
+        cache: Optional[TwoTierCache] = None,
+        flights: Optional[SingleFlight] = None,
+        coordinates_ttl: Optional[float] = None,
+        governors: Optional[Dict[str, UpstreamGovernor]] = None,
+    ):
+        self.client = client
+        self.api_key = api_key
+        self.cache = cache
+        self.flights = flights or SingleFlight()
+        self.coordinates_ttl = coordinates_ttl
+        self.governors = governors or {}
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _call(self, api: str, fn: Callable[[], Awaitable[T]]) -> T:
+        async with self._semaphore:
+            governor = self.governors.get(api)
+            return await (governor.call(fn) if governor is not None else fn())
+
+    async def _get_json(self, endpoint: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        async def fetch() -> Dict[str, Any]:
+            response = await self.client.get(
+                f"{PLACES_API_URL}/{endpoint}/json",
+                params={**params, "key": self.api_key},
+            )
+            response.raise_for_status()
+            data = response.json()
+            if data.get("status") not in ("OK", "ZERO_RESULTS"):
+                logger.error(f"Google Places API error on {endpoint}: {data.get('status')}")
+                raise PlacesError(data.get("status"))
+            return data
+
+        return await self._call(PLACES_API, fetch)
+
+    async def text_search(
+        self,
+        query: str,
+        location: Optional[Dict[str, float]] = None,
+        radius: Optional[int] = None,
+        language: str = "en",
+        type: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        params: Dict[str, Any] = {"query": query, "language": language}
+        if location:
+            params["location"] = f"{location['lat']},{location['lng']}"
+        if radius:
+            params["radius"] = radius
+        if type:
+            params["type"] = type
+        data = await self._get_json("textsearch", params)
+        await self._remember_coordinates(data.get("results", []))
+        return data.get("results", [])
+
+    async def autocomplete(
+        self,
+        input: str,
+        language: str = "en",
+        types: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        params: Dict[str, Any] = {"input": input, "language": language}
+        if types:
+            params["types"] = types
+        data = await self._get_json("autocomplete", params)
+        return data.get("predictions", [])
+
+    async def nearby_search(
+        self,
+        lat: float,
+        lng: float,
+        radius: float,
+        type: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        params: Dict[str, Any] = {"location": f"{lat},{lng}", "radius": radius}
+        if type:
+            params["type"] = type
+        data = await self._get_json("nearbysearch", params)
+        await self._remember_coordinates(data.get("results", []))
+        return data.get("results", [])
+
+    async def place_details(
+        self,
+        place_id: str,
+        fields: Iterable[str],
+        language: Optional[str] = None,
+        fresh: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Place Details for `fields`; with `fresh` the cache is skipped but
+        still updated. If Google is unavailable an expired cache entry is
+        returned instead, unless `fresh` is set.
+        """
+        fields = list(fields)
+        key = place_details_key(place_id, fields, language)
+        if self.cache is not None and not fresh:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                return cached
+        try:
+            return await self.flights.do(key, lambda: self._fetch_details(key, place_id, fields, language))
+        except Exception as e:
+            if fresh or self.cache is None or not is_degraded(e):
+                raise
+            stale = await self.cache.get(key, allow_stale=True)
+            if stale is None:
+                raise
+            logger.warning(f"Serving stale Place Details for {place_id}: {str(e)}")
+            return stale
+
+    async def _fetch_details(
+        self,
+        key: str,
+        place_id: str,
+        fields: List[str],
+        language: Optional[str],
+    ) -> Dict[str, Any]:
+        params: Dict[str, Any] = {"place_id": place_id, "fields": ",".join(fields)}
+        if language:
+            params["language"] = language
+        data = await self._get_json("details", params)
+        if data["status"] == "ZERO_RESULTS":
+            raise PlacesError(data["status"])
+
+        if self.cache is not None:
+            await self.cache.set(key, data["result"])
+        await self._remember_coordinates([{"place_id": place_id, **data["result"]}])
+        return data["result"]
+
+    async def _remember_coordinates(self, places: List[Dict[str, Any]]) -> None:
+        if self.cache is None:
+            return
+        writes = []
+        for place in places:
+            location = place.get("geometry", {}).get("location")
+            if place.get("place_id") and location:
+                writes.append(self.cache.set(
+                    place_coordinates_key(place["place_id"]),
+                    [location["lat"], location["lng"]],
+                    self.coordinates_ttl,
+                ))
+        await asyncio.gather(*writes)
+
+    async def cached_coordinates(self, place_id: str) -> Optional[Tuple[float, float]]:
+        """Coordinates from any earlier response for this place, without calling Google"""
+        if self.cache is None:
+            return None
+        cached = await self.cache.get(place_coordinates_key(place_id))
+        return tuple(cached) if cached is not None else None
+
+    async def place_coordinates(self, place_id: str) -> Optional[Tuple[float, float]]:
+        """Coordinates of a place, calling Place Details only when none are cached"""
+        cached = await self.cached_coordinates(place_id)
+        if cached is not None:
+            return cached
+        result = await self.place_details(place_id, fields=["geometry"])
+        location = result.get("geometry", {}).get("location")
+        return (location["lat"], location["lng"]) if location else None
+
+    async def photo(self, photo_reference: str, max_width: int = 800) -> Tuple[bytes, str]:
+        """Download a photo, returning its bytes and content type."""
+        async def fetch() -> Tuple[bytes, str]:
+            response = await self.client.get(
+                f"{PLACES_API_URL}/photo",
+                params={
+                    "maxwidth": max_width,
+                    "photo_reference": photo_reference,
+                    "key": self.api_key,
+                },
+                follow_redirects=True,
+            )
+            response.raise_for_status()
+            return response.content, response.headers.get("content-type", "image/jpeg")
+
+        return await self._call(PHOTOS_API, fetch)
@@ -0,0 +1,379 @@
+"""
+Per-caller request budgets, enforced by RateLimitMiddleware.
+
+Every request is charged to a token bucket keyed by the route group it
+hits and the caller: the user id of a valid bearer token, otherwise the
+client IP. Behind a proxy the client IP has to come from a header the
+proxy sets (rate_limit_client_ip_header, e.g. Fly-Client-IP on Fly),
+or every anonymous caller shares the proxy's bucket. Routes that spend Google quota or bcrypt time get smaller
+budgets than the rest of the API. Buckets live in a RateLimitStore; the
+in-memory store is per worker, the SQLite and Redis stores are shared by
+every worker pointed at them. If the store fails, requests are let
+through rather than turning an outage of the store into an API outage.
+"""
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+from jose import JWTError, jwt
+from starlette.datastructures import MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """`requests` per `period` seconds on average, in bursts of up to `requests`"""
+    requests: int
+    period: float
+
+    @property
+    def rate(self) -> float:
+        return self.requests / self.period
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    name: str
+    prefixes: Tuple[str, ...]
+    limit: RateLimit
+    methods: Optional[Tuple[str, ...]] = None
+    exclude: Tuple[str, ...] = ()  # Exact paths under `prefixes` the rule does not cover
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.methods is not None and method not in self.methods:
+            return False
+        return path.startswith(self.prefixes) and path.rstrip("/") not in self.exclude
+
+
+# Everything RateLimitResult.headers() may send, for CORS expose_headers
+RATE_LIMIT_HEADERS = ("X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Reset", "Retry-After")
+
+
+@dataclass(frozen=True)
+class RateLimitResult:
+    allowed: bool
+    limit: int
+    remaining: int
+    reset: float  # Seconds until the bucket is full again
+    retry_after: float  # Seconds until the next request is allowed; 0 when allowed
+
+    def headers(self) -> List[Tuple[str, str]]:
+        headers = [
+            ("X-RateLimit-Limit", str(self.limit)),
+            ("X-RateLimit-Remaining", str(self.remaining)),
+            ("X-RateLimit-Reset", str(max(0, round(self.reset)))),
+        ]
+        if not self.allowed:
+            headers.append(("Retry-After", str(max(1, round(self.retry_after + 0.5)))))
+        return headers
+
+
+def take_token(tokens: Optional[float], updated: float, now: float, limit: RateLimit) -> Tuple[float, bool]:
+    """Refill a bucket up to `now` and take one token; returns the new level and whether it was taken"""
+    if tokens is None:
+        tokens = float(limit.requests)
+    tokens = min(float(limit.requests), tokens + max(0.0, now - updated) * limit.rate)
+    if tokens >= 1:
+        return tokens - 1, True
+    return tokens, False
+
+
+def bucket_result(limit: RateLimit, tokens: float, allowed: bool) -> RateLimitResult:
+    return RateLimitResult(
+        allowed=allowed,
+        limit=limit.requests,
+        remaining=int(tokens),
+        reset=(limit.requests - tokens) / limit.rate,
+        retry_after=0.0 if allowed else (1 - tokens) / limit.rate,
+    )
+
+
+class RateLimitStore:
+    """Interface for bucket storage. hit() must take the token atomically."""
+
+    async def hit(self, key: str, limit: RateLimit) -> RateLimitResult:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryRateLimitStore(RateLimitStore):
+    """Buckets in this worker's memory; the least recently used are dropped beyond max_keys"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def hit(self, key: str, limit: RateLimit) -> RateLimitResult:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (None, now))
+        tokens, allowed = take_token(tokens, updated, now, limit)
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            # A dropped bucket comes back full, which only errs on the lenient side
+            self._buckets.popitem(last=False)
+        return bucket_result(limit, tokens, allowed)
+
+
+class SQLiteRateLimitStore(RateLimitStore):
+    """
+    Buckets in a SQLite file shared by the workers on one machine. Each hit
+    is a write transaction, so this suits a handful of workers; use Redis
+    beyond that.
+    """
+
+    PRUNE_EVERY = 1000
+    PRUNE_IDLE = 3600  # Seconds; idle buckets are full again long before this
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limits ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def _hit(self, key: str, limit: RateLimit) -> RateLimitResult:
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so workers cannot interleave
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT tokens, updated_at FROM rate_limits WHERE key = ?", (key,)
+                ).fetchone()
+                tokens, allowed = take_token(row[0] if row else None, row[1] if row else now, now, limit)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO rate_limits (key, tokens, updated_at) VALUES (?, ?, ?)",
+                    (key, tokens, now),
+                )
+                self._writes += 1
+                if self._writes % self.PRUNE_EVERY == 0:
+                    self._conn.execute("DELETE FROM rate_limits WHERE updated_at < ?", (now - self.PRUNE_IDLE,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return bucket_result(limit, tokens, allowed)
+
+    async def hit(self, key: str, limit: RateLimit) -> RateLimitResult:
+        return await asyncio.to_thread(self._hit, key, limit)
+
+    async def close(self) -> None:
+        self._conn.close()
+
+
+# Same refill-and-take as take_token, run atomically on the server
+_REDIS_HIT = """
+local limit = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or limit
+local updated = tonumber(state[2]) or now
+tokens = math.min(limit, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisRateLimitStore(RateLimitStore):
+    """Buckets on a Redis-compatible server, shared by every worker and host"""
+
+    def __init__(self, url: str, prefix: str = "cemelin:ratelimit:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("The redis package is required for the redis rate limit backend")
+        self.prefix = prefix
+        self._client = redis.from_url(url)
+        self._script = self._client.register_script(_REDIS_HIT)
+
+    async def hit(self, key: str, limit: RateLimit) -> RateLimitResult:
+        allowed, tokens = await self._script(
+            keys=[self.prefix + key],
+            args=[limit.requests, limit.rate, time.time(), max(1, int(limit.period))],
+        )
+        return bucket_result(limit, float(tokens), bool(allowed))
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+class RateLimiter:
+    """Picks the budget for a request and charges it to the caller's bucket"""
+
+    def __init__(self, store: RateLimitStore, rules: Sequence[RateLimitRule], default: RateLimit):
+        self.store = store
+        self.rules = list(rules)
+        self.default = default
+
+    def rule_for(self, method: str, path: str) -> Tuple[str, RateLimit]:
+        for rule in self.rules:
+            if rule.matches(method, path):
+                return rule.name, rule.limit
+        return "default", self.default
+
+    async def hit(self, method: str, path: str, caller: str) -> RateLimitResult:
+        name, limit = self.rule_for(method, path)
+        return await self.store.hit(f"{name}:{caller}", limit)
+
+    async def close(self) -> None:
+        await self.store.close()
+
+
+def default_rules(prefix: str = settings.API_V1_STR) -> List[RateLimitRule]:
+    upstream = RateLimit(settings.rate_limit_upstream_requests, settings.rate_limit_upstream_period)
+    # Rules sharing a name share a bucket; the first matching rule wins
+    return [
+        # bcrypt runs on every one of these
+        RateLimitRule(
+            "auth",
+            tuple(f"{prefix}/auth/{name}" for name in
+                  ("login", "register", "reset-password", "change-password", "forgot-password")),
+            RateLimit(settings.rate_limit_auth_requests, settings.rate_limit_auth_period),
+            methods=("POST",),
+        ),
+        # Autocomplete fires on every few keystrokes, so it gets a larger budget of its own
+        RateLimitRule(
+            "typeahead",
+            (f"{prefix}/locations/search",),
+            RateLimit(settings.rate_limit_typeahead_requests, settings.rate_limit_typeahead_period),
+        ),
+        # One page shows many photos; they are only downloaded from Google once
+        RateLimitRule(
+            "photos",
+            (f"{prefix}/photos/",),
+            RateLimit(settings.rate_limit_photos_requests, settings.rate_limit_photos_period),
+        ),
+        # Backed by Places / Maps calls on a cache miss
+        RateLimitRule(
+            "upstream",
+            (f"{prefix}/destinations/search", f"{prefix}/locations/", f"{prefix}/maps/"),
+            upstream,
+        ),
+        # Destination details by place id, fetched from Google when not stored yet
+        RateLimitRule(
+            "upstream",
+            (f"{prefix}/destinations/",),
+            upstream,
+            methods=("GET",),
+            exclude=tuple(f"{prefix}/destinations{path}" for path in ("", "/nearby", "/within")),
+        ),
+    ]
+
+
+def create_rate_limit_store(backend: str, url: Optional[str]) -> RateLimitStore:
+    if backend == "memory":
+        return MemoryRateLimitStore()
+    if backend == "sqlite":
+        return SQLiteRateLimitStore(url or "rate_limits.db")
+    if backend == "redis":
+        return RedisRateLimitStore(url or "redis://localhost:6379/0")
+    raise ValueError(f"Unknown rate limit backend: {backend}")
+
+
+def create_rate_limiter() -> Optional[RateLimiter]:
+    if not settings.rate_limit_enabled:
+        return None
+    return RateLimiter(
+        create_rate_limit_store(settings.rate_limit_backend, settings.rate_limit_url),
+        default_rules(),
+        RateLimit(settings.rate_limit_requests, settings.rate_limit_period),
+    )
+
+
+def _header(scope: Scope, name: bytes) -> Optional[str]:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def request_caller(scope: Scope) -> str:
+    """user:<id> for a valid bearer token, ip:<address> otherwise"""
+    authorization = _header(scope, b"authorization")
+    if authorization and authorization[:7].lower() == "bearer ":
+        try:
+            subject = jwt.decode(authorization[7:], settings.SECRET_KEY, algorithms=["HS256"]).get("sub")
+        except JWTError:
+            subject = None
+        if subject:
+            return f"user:{subject}"
+    if settings.rate_limit_client_ip_header:
+        # Set by the proxy in front of us, which overwrites any value sent by the client
+        client_ip = _header(scope, settings.rate_limit_client_ip_header.lower().encode("latin-1"))
+        if client_ip:
+            return f"ip:{client_ip.strip()}"
+    forwarded = _header(scope, b"x-forwarded-for") if settings.rate_limit_trust_forwarded_for else None
+    if forwarded:
+        return f"ip:{forwarded.split(',')[0].strip()}"
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+class RateLimitMiddleware:
+    """
+    Answers 429 with Retry-After once the caller's budget for the route is
+    spent, and adds X-RateLimit-* headers to every limited response. The
+    limiter is read from app.state.rate_limiter, set up in the lifespan.
+    """
+
+    def __init__(self, app: ASGIApp, exempt: Sequence[str] = ("/healthz",)):
+        self.app = app
+        self.exempt = tuple(exempt)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # OPTIONS is left alone so CORS preflights never count against the budget
+        if scope["type"] != "http" or scope["method"] == "OPTIONS" or scope["path"] in self.exempt:
+            await self.app(scope, receive, send)
+            return
+        limiter: Optional[RateLimiter] = getattr(scope["app"].state, "rate_limiter", None)
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            result = await limiter.hit(scope["method"], scope["path"], request_caller(scope))
+        except Exception as e:
+            logger.warning(f"Rate limit store failed, allowing request: {str(e)}")
+            await self.app(scope, receive, send)
+            return
+
+        if not result.allowed:
+            response = JSONResponse(
+                {"detail": "Too many requests, please retry later"},
+                status_code=429,
+                headers=dict(result.headers()),
+            )
+            await response(scope, receive, send)
+            return
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                for name, value in result.headers():
+                    headers.append(name, value)
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
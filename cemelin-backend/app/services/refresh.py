@@ -0,0 +1,245 @@
+"""
+Background refresh of stored destinations.
+
+Reads always come from the database. A worker task re-fetches the parts
+of a destination that have gone stale, each field group on its own TTL
+(ratings change daily, a phone number hardly ever), and only requests the
+Place Details fields for the groups that are due. Frequently read
+destinations are refreshed first, and upstream calls are paced by a
+token bucket so the worker stays within our Places quota. Every worker
+counts reads, but on Postgres only the one holding an advisory lock runs
+a refresh pass, so several workers don't spend the quota on the same rows.
+"""
+import asyncio
+import logging
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import and_, func, or_, select, update
+
+from app.config import settings
+from app.database import async_session, try_advisory_lock
+from app.models.destination import Destination
+from app.services.photos import photo_proxy_paths
+from app.services.governor import UpstreamUnavailable, is_transient
+from app.services.places import PlacesClient
+from app.services.throttle import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key shared by every worker taking the refresh lock
+REFRESH_LOCK_ID = 7_260_418
+
+
+def _apply_ratings(place: Dict[str, Any]) -> Dict[str, Any]:
+    return {"rating": place.get("rating")}
+
+
+def _apply_hours(place: Dict[str, Any]) -> Dict[str, Any]:
+    return {"opening_hours": place.get("opening_hours")}
+
+
+def _apply_photos(place: Dict[str, Any]) -> Dict[str, Any]:
+    photos = photo_proxy_paths(place.get("photos", []))
+    return {"images": photos, "image_url": photos[0] if photos else None}
+
+
+def _apply_contact(place: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "website": place.get("website"),
+        "phone_number": place.get("formatted_phone_number"),
+        "price_level": place.get("price_level"),
+    }
+
+
+# Field group -> (Place Details fields, column values from the response)
+FIELD_GROUPS: Dict[str, tuple] = {
+    "ratings": (["rating"], _apply_ratings),
+    "hours": (["opening_hours"], _apply_hours),
+    "photos": (["photos"], _apply_photos),
+    "contact": (["website", "formatted_phone_number", "price_level"], _apply_contact),
+}
+
+
+def field_group_ttls() -> Dict[str, int]:
+    return {
+        "ratings": settings.destination_refresh_ttl_ratings,
+        "hours": settings.destination_refresh_ttl_hours,
+        "photos": settings.destination_refresh_ttl_photos,
+        "contact": settings.destination_refresh_ttl_contact,
+    }
+
+
+def all_groups_refreshed(now: Optional[float] = None) -> Dict[str, float]:
+    """refreshed_at for a destination just fetched in full"""
+    now = time.time() if now is None else now
+    return {group: now for group in FIELD_GROUPS}
+
+
+def refreshed_at(destination: Destination) -> Dict[str, float]:
+    """When each field group was last fetched"""
+    # Rows stored before refreshed_at existed count from their last write
+    fallback = destination.updated_at or destination.created_at
+    if fallback is None:
+        fallback = 0.0
+    else:
+        # SQLite hands back naive datetimes; the database clock is UTC
+        fallback = (fallback if fallback.tzinfo else fallback.replace(tzinfo=timezone.utc)).timestamp()
+    stored = destination.refreshed_at or {}
+    return {group: stored.get(group, fallback) for group in FIELD_GROUPS}
+
+
+def next_refresh_time(last: Dict[str, float], ttls: Optional[Dict[str, int]] = None) -> float:
+    """When the first field group falls due, given when each was last fetched"""
+    ttls = field_group_ttls() if ttls is None else ttls
+    return min(last[group] + ttl for group, ttl in ttls.items())
+
+
+def due_groups(destination: Destination, ttls: Dict[str, int], now: float) -> List[str]:
+    last = refreshed_at(destination)
+    return [group for group, ttl in ttls.items() if last[group] + ttl <= now]
+
+
+class ReadCounter:
+    """Destination reads counted in memory and flushed to read_count by the worker"""
+
+    def __init__(self):
+        self._counts: Counter = Counter()
+
+    def hit(self, destination_id: int) -> None:
+        self._counts[destination_id] += 1
+
+    def drain(self) -> Dict[int, int]:
+        counts, self._counts = self._counts, Counter()
+        return dict(counts)
+
+
+class DestinationRefresher:
+    def __init__(
+        self,
+        places: Callable[[], PlacesClient],
+        reads: ReadCounter,
+        bucket: TokenBucket,
+        batch_size: int = 50,
+        interval: float = 60,
+    ):
+        self.places = places
+        self.reads = reads
+        self.bucket = bucket
+        self.batch_size = batch_size
+        self.interval = interval
+
+    async def flush_reads(self) -> None:
+        counts = self.reads.drain()
+        if not counts:
+            return
+        async with async_session() as db:
+            for destination_id, count in counts.items():
+                await db.execute(
+                    update(Destination)
+                    .where(Destination.id == destination_id)
+                    .values(
+                        read_count=func.coalesce(Destination.read_count, 0) + count,
+                        # Counting reads is not a content change, so keep updated_at
+                        updated_at=Destination.updated_at
+                    )
+                )
+            await db.commit()
+
+    async def refresh_batch(self, now: Optional[float] = None) -> int:
+        """Refresh the most read stale destinations; returns how many were tried"""
+        now = time.time() if now is None else now
+        ttls = field_group_ttls()
+        # Rows without next_refresh_at can't be due before the shortest TTL has passed since the last write
+        cutoff = datetime.fromtimestamp(now - min(ttls.values()), tz=timezone.utc)
+        async with async_session() as db:
+            candidates = (await db.scalars(
+                select(Destination)
+                .where(
+                    Destination.place_id.is_not(None),
+                    or_(
+                        Destination.next_refresh_at <= now,
+                        and_(
+                            Destination.next_refresh_at.is_(None),
+                            func.coalesce(Destination.updated_at, Destination.created_at) <= cutoff
+                        )
+                    )
+                )
+                .order_by(func.coalesce(Destination.read_count, 0).desc(), Destination.id)
+                .limit(self.batch_size)
+            )).all()
+            # Rows stored before next_refresh_at existed may turn out not to be due yet
+            for destination in candidates:
+                if not due_groups(destination, ttls, now):
+                    await db.execute(
+                        update(Destination)
+                        .where(Destination.id == destination.id)
+                        .values(
+                            next_refresh_at=next_refresh_time(refreshed_at(destination), ttls),
+                            updated_at=Destination.updated_at
+                        )
+                    )
+            await db.commit()
+        refreshed = 0
+        for destination in candidates:
+            groups = due_groups(destination, ttls, now)
+            if not groups:
+                continue
+            try:
+                await self.refresh(destination, groups, now)
+            except UpstreamUnavailable as e:
+                # The breaker is open or the budget is spent; every other row would fail too
+                logger.warning(f"Pausing destination refresh: {str(e)}")
+                break
+            refreshed += 1
+        return refreshed
+
+    async def refresh(self, destination: Destination, groups: List[str], now: float) -> None:
+        fields = sorted({field for group in groups for field in FIELD_GROUPS[group][0]})
+        ttls = field_group_ttls()
+        await self.bucket.acquire()
+        values: Dict[str, Any] = {}
+        stamp = {group: now for group in groups}
+        try:
+            place = await self.places().place_details(destination.place_id, fields=fields, fresh=True)
+        except UpstreamUnavailable:
+            raise
+        except Exception as e:
+            # Keep the stored values. Rejected requests are tried again once the
+            # groups are due next time, transient failures after a short delay.
+            logger.warning(f"Could not refresh destination {destination.id}: {type(e).__name__}: {str(e)}")
+            if is_transient(e):
+                retry_at = now + settings.destination_refresh_retry_delay
+                stamp = {group: min(now, retry_at - ttls[group]) for group in groups}
+        else:
+            for group in groups:
+                values.update(FIELD_GROUPS[group][1](place))
+        if not values:
+            # Nothing changed
+            values["updated_at"] = Destination.updated_at
+        # next_refresh_at moves on either way, so a failing row leaves the candidates until it is due again
+        last = {**refreshed_at(destination), **stamp}
+        async with async_session() as db:
+            await db.execute(
+                update(Destination)
+                .where(Destination.id == destination.id)
+                .values(**values, refreshed_at=last, next_refresh_at=next_refresh_time(last, ttls), read_count=0)
+            )
+            await db.commit()
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.flush_reads()
+                async with try_advisory_lock(REFRESH_LOCK_ID) as leader:
+                    refreshed = await self.refresh_batch() if leader else 0
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Destination refresh failed")
+                refreshed = 0
+            # Keep going while there is a backlog, otherwise wait for more to go stale
+            if refreshed < self.batch_size:
+                await asyncio.sleep(self.interval)
@@ -0,0 +1,170 @@
+"""
+Map marker lookups on a fixed tile grid.
+
+Map clients ask for markers around arbitrary centers, so two users panning
+over the same area almost never send the same request. Requests are
+snapped to the standard web map (slippy) tile grid instead: each tile is
+fetched with one Nearby Search and cached, and a request is answered by
+merging the tiles under it and clipping to the requested circle.
+"""
+import asyncio
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.services.cache import LRUCache
+from app.services.governor import is_degraded
+from app.services.geo import BBox, bbox_around, haversine_m, in_bbox
+from app.services.places import PlacesClient
+from app.services.singleflight import SingleFlight
+
+MAX_ZOOM = 18
+MAX_LATITUDE = 85.0511287798  # Edge of the web mercator projection
+MARKER_PLACE_TYPE = "tourist_attraction"
+NEARBY_MAX_RADIUS = 50_000  # Meters; Nearby Search rejects larger radii
+
+Tile = Tuple[int, int]
+
+
+def tile_xy(lat: float, lng: float, zoom: int) -> Tile:
+    n = 2 ** zoom
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    x = int((lng + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(x, n - 1), min(y, n - 1)
+
+
+def tile_bbox(x: int, y: int, zoom: int) -> BBox:
+    n = 2 ** zoom
+
+    def lat(row: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return lat(y + 1), x / n * 360.0 - 180.0, lat(y), (x + 1) / n * 360.0 - 180.0
+
+
+def _tile_span(bbox: BBox, zoom: int) -> Tuple[List[int], List[int]]:
+    south, west, north, east = bbox
+    n = 2 ** zoom
+    if west > east and tile_xy(0.0, west, zoom)[0] == tile_xy(0.0, east, zoom)[0]:
+        # Wraps almost all the way around the globe
+        west, east = -180.0, 180.0
+    west_x, north_y = tile_xy(north, west, zoom)
+    east_x, south_y = tile_xy(south, east, zoom)
+    # A box crossing the antimeridian wraps around to column 0
+    columns = (east_x - west_x) % n + 1
+    return [(west_x + i) % n for i in range(columns)], list(range(north_y, south_y + 1))
+
+
+def tiles_covering(bbox: BBox, zoom: int) -> List[Tile]:
+    columns, rows = _tile_span(bbox, zoom)
+    return [(x, y) for x in columns for y in rows]
+
+
+def zoom_for_bbox(bbox: BBox, max_tiles: int) -> int:
+    """The most detailed zoom at which at most `max_tiles` tiles cover `bbox`"""
+    for zoom in range(MAX_ZOOM, 0, -1):
+        columns, rows = _tile_span(bbox, zoom)
+        if len(columns) * len(rows) <= max_tiles:
+            return zoom
+    return 0
+
+
+def tile_circle(bbox: BBox) -> Tuple[float, float, float]:
+    """Center and radius in meters of the smallest circle containing a tile"""
+    south, west, north, east = bbox
+    lat, lng = (south + north) / 2, (west + east) / 2
+    return lat, lng, max(haversine_m(lat, lng, north, east), haversine_m(lat, lng, south, east))
+
+
+def zoom_for_nearby(bbox: BBox, zoom: int) -> int:
+    """`zoom`, raised until every tile over `bbox` fits in one Nearby Search"""
+    while zoom < MAX_ZOOM and any(
+        tile_circle(tile_bbox(x, y, zoom))[2] > NEARBY_MAX_RADIUS for x, y in tiles_covering(bbox, zoom)
+    ):
+        zoom += 1
+    return zoom
+
+
+class MarkerTileCache:
+    """
+    Nearby Search results per tile, with a TTL. A tile keeps only the places
+    that fall inside it, so neighbouring tiles never overlap. Concurrent
+    requests for an uncached tile share one upstream call.
+    """
+
+    def __init__(self, maxsize: int = 4096, ttl: float = 3600, max_tiles: int = 9):
+        self.max_tiles = max_tiles
+        self._tiles = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._flights = SingleFlight()
+
+    async def _fetch_tile(self, places: PlacesClient, key: str, bbox: BBox) -> List[Dict[str, Any]]:
+        lat, lng, radius = tile_circle(bbox)
+        results = await places.nearby_search(lat, lng, radius, type=MARKER_PLACE_TYPE)
+        inside = [
+            result for result in results
+            if in_bbox(*_location(result), bbox)
+        ]
+        self._tiles.set(key, inside)
+        return inside
+
+    async def _tile(self, places: PlacesClient, zoom: int, x: int, y: int) -> List[Dict[str, Any]]:
+        key = f"{zoom}/{x}/{y}"
+        cached = self._tiles.get(key)
+        if cached is not None:
+            return cached
+        try:
+            return await self._flights.do(key, lambda: self._fetch_tile(places, key, tile_bbox(x, y, zoom)))
+        except Exception as e:
+            # An expired tile beats no markers while Google is unavailable
+            stale = self._tiles.get(key, allow_stale=True) if is_degraded(e) else None
+            if stale is None:
+                raise
+            return stale
+
+    async def search(
+        self,
+        places: PlacesClient,
+        lat: float,
+        lng: float,
+        radius: float,
+        zoom: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Places within `radius` meters of a point, assembled from cached
+        tiles. Like Nearby Search itself, the radius is capped at 50 km.
+        """
+        radius = min(radius, NEARBY_MAX_RADIUS)
+        bbox = bbox_around(lat, lng, radius)
+        # Never use more tiles than allowed, even if the caller asks for a finer zoom
+        fitted = zoom_for_bbox(bbox, self.max_tiles)
+        zoom = fitted if zoom is None else min(zoom, fitted)
+        # Except where low zoom tiles are too large for one Nearby Search; a
+        # 50 km request then takes up to 16 tiles instead of max_tiles
+        zoom = zoom_for_nearby(bbox, zoom)
+
+        tiles = await asyncio.gather(*(
+            self._tile(places, zoom, x, y) for x, y in tiles_covering(bbox, zoom)
+        ))
+        merged = {}
+        for results in tiles:
+            for result in results:
+                if haversine_m(lat, lng, *_location(result)) <= radius:
+                    merged.setdefault(result.get("place_id"), result)
+        return list(merged.values())
+
+    def clear(self) -> None:
+        self._tiles.clear()
+
+
+def _location(result: Dict[str, Any]) -> Tuple[float, float]:
+    location = result.get("geometry", {}).get("location", {})
+    return location.get("lat", 0.0), location.get("lng", 0.0)
+
+
+def create_marker_tile_cache() -> MarkerTileCache:
+    return MarkerTileCache(
+        maxsize=settings.marker_tile_cache_size,
+        ttl=settings.marker_tile_cache_ttl,
+        max_tiles=settings.marker_tile_max_tiles,
+    )
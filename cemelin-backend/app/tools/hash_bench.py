@@ -0,0 +1,103 @@
+"""
+Measure password hashing cost on this machine, to size login capacity.
+
+    python -m app.tools.hash_bench
+    python -m app.tools.hash_bench --bcrypt-rounds 10 11 12 13
+    python -m app.tools.hash_bench --argon2-time-cost 2 3 --argon2-memory-cost 19456 65536
+
+Without options the configured settings are measured. Each setting is
+timed on one thread, so p50 verify time is the CPU one login costs and
+1000 / p50 is the logins per second a single core can sustain.
+"""
+import argparse
+import itertools
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from passlib.exc import MissingBackendError
+
+from app.config import settings
+from app.services.passwords import create_crypt_context
+
+PASSWORD = "correct-horse-battery-staple"
+
+
+def percentiles(samples: List[float]) -> Tuple[float, float]:
+    """p50 and p99 of `samples`"""
+    if len(samples) < 2:
+        return samples[0], samples[0]
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return statistics.median(samples), cuts[98]
+
+
+def timed(fn: Callable[[], object], iterations: int) -> List[float]:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def settings_to_run(args: argparse.Namespace) -> List[Tuple[str, Dict[str, int]]]:
+    runs: List[Tuple[str, Dict[str, int]]] = []
+    for rounds in args.bcrypt_rounds or []:
+        runs.append(("bcrypt", {"bcrypt_rounds": rounds}))
+    if args.argon2_time_cost or args.argon2_memory_cost:
+        for time_cost, memory_cost in itertools.product(
+            args.argon2_time_cost or [settings.password_argon2_time_cost],
+            args.argon2_memory_cost or [settings.password_argon2_memory_cost],
+        ):
+            runs.append(("argon2", {"argon2_time_cost": time_cost, "argon2_memory_cost": memory_cost}))
+    if not runs:
+        # The configured default scheme and cost
+        scheme = settings.password_hash_schemes.split(",")[0].strip()
+        runs.append((scheme, {}))
+    return runs
+
+
+def describe(scheme: str, options: Dict[str, int]) -> str:
+    if scheme == "bcrypt":
+        return f"bcrypt rounds={options.get('bcrypt_rounds', settings.password_bcrypt_rounds)}"
+    if scheme == "argon2":
+        return (
+            f"argon2 t={options.get('argon2_time_cost', settings.password_argon2_time_cost)}"
+            f" m={options.get('argon2_memory_cost', settings.password_argon2_memory_cost)}KiB"
+            f" p={settings.password_argon2_parallelism}"
+        )
+    return scheme
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bcrypt-rounds", type=int, nargs="+")
+    parser.add_argument("--argon2-time-cost", type=int, nargs="+")
+    parser.add_argument("--argon2-memory-cost", type=int, nargs="+", help="KiB")
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    print(f"{'setting':<32} {'hash p50':>9} {'hash p99':>9} {'verify p50':>11} {'verify p99':>11} {'logins/s/core':>14}")
+    status = 0
+    for scheme, options in settings_to_run(args):
+        context = create_crypt_context(schemes=[scheme], **options)
+        name = describe(scheme, options)
+        try:
+            # The first call loads the backend and is not counted
+            hashed = context.hash(PASSWORD)
+        except MissingBackendError as e:
+            print(f"{name:<32} skipped: {e}")
+            status = 1
+            continue
+        hash_p50, hash_p99 = percentiles(timed(lambda: context.hash(PASSWORD), args.iterations))
+        verify_p50, verify_p99 = percentiles(timed(lambda: context.verify(PASSWORD, hashed), args.iterations))
+        print(
+            f"{name:<32} {hash_p50:7.1f}ms {hash_p99:7.1f}ms {verify_p50:9.1f}ms {verify_p99:9.1f}ms"
+            f" {1000 / verify_p50:14.1f}"
+        )
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
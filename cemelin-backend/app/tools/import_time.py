@@ -0,0 +1,68 @@
+"""
+Measure how long `import app.main` takes in a fresh interpreter.
+
+    python -m app.tools.import_time --budget-ms 1500
+
+Each run imports the app with `python -X importtime`. The command prints
+the median cumulative import time and the slowest modules, and exits
+with status 1 when the median exceeds the budget.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_BUDGET_MS = 1500
+
+
+def measure(module: str) -> Tuple[float, Dict[str, float]]:
+    """Return the cumulative import time of `module` and each module's self time, in ms."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total = 0.0
+    self_times: Dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        self_times[name] = int(self_us) / 1000
+        if name == module:
+            total = int(cumulative_us) / 1000
+    return total, self_times
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args(argv)
+
+    # The first run warms the bytecode cache and is not counted
+    measure(args.module)
+    totals = []
+    for _ in range(args.runs):
+        total, self_times = measure(args.module)
+        totals.append(total)
+
+    median = statistics.median(totals)
+    print(f"{args.module}: median {median:.1f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    print("Slowest modules (self time, last run):")
+    for name, ms in sorted(self_times.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {ms:8.1f} ms  {name}")
+
+    if median > args.budget_ms:
+        print(f"Import time budget exceeded by {median - args.budget_ms:.1f} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+Create the database schema once per deploy.
+
+    python -m app.tools.migrate
+
+Run it as the release command and start the app workers with
+run_migrations_on_startup=false, so no worker pays for DDL on boot.
+Otherwise every worker runs migrate() on startup, before it serves any
+request; each step is idempotent.
+"""
+import logging
+
+from sqlalchemy import case, func, insert, select, text, update
+
+from app.database import SCHEMA_LOCK_ID, SessionLocal, init_db
+from app.models.destination import Destination, DestinationRating
+from app.models.review import Review
+from app.services.geo import encode_geohash
+
+logger = logging.getLogger(__name__)
+
+
+AGGREGATE_COLUMNS = ("ratings_count", "ratings_sum", "stars_1", "stars_2", "stars_3", "stars_4", "stars_5")
+
+
+def backfill_destination_ratings() -> int:
+    """
+    Recompute rating aggregates from reviews wherever they disagree, e.g.
+    for reviews that predate the aggregates. Returns how many were fixed.
+    """
+    stars = [func.sum(case((Review.rating == n, 1), else_=0)) for n in range(1, 6)]
+    totals_query = select(
+        Review.destination_id,
+        func.count(Review.id),
+        func.sum(Review.rating),
+        *stars,
+    ).group_by(Review.destination_id)
+    stored_query = select(
+        DestinationRating.destination_id,
+        DestinationRating.id,
+        *(getattr(DestinationRating, column) for column in AGGREGATE_COLUMNS),
+    )
+
+    with SessionLocal() as db:
+        if db.get_bind().dialect.name == "postgresql":
+            # One worker at a time, and no review is written until the aggregates match again
+            db.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": SCHEMA_LOCK_ID})
+            db.execute(text("LOCK TABLE reviews IN SHARE MODE"))
+        totals = {row[0]: tuple(row[1:]) for row in db.execute(totals_query)}
+        stored = {row[0]: (row[1], tuple(row[2:])) for row in db.execute(stored_query)}
+
+        inserts, updates = [], []
+        for destination_id in totals.keys() | stored.keys():
+            expected = totals.get(destination_id, (0,) * len(AGGREGATE_COLUMNS))
+            values = dict(zip(AGGREGATE_COLUMNS, expected))
+            if destination_id not in stored:
+                inserts.append({"destination_id": destination_id, **values})
+            elif stored[destination_id][1] != expected:
+                updates.append({"id": stored[destination_id][0], **values})
+        if inserts:
+            db.execute(insert(DestinationRating), inserts)
+        if updates:
+            db.execute(update(DestinationRating), updates)
+        db.commit()
+        return len(inserts) + len(updates)
+
+
+def backfill_destination_geohashes(batch_size: int = 1000) -> int:
+    """Index destinations stored before the geohash column existed."""
+    updated = 0
+    with SessionLocal() as db:
+        while True:
+            rows = db.execute(
+                select(Destination.id, Destination.latitude, Destination.longitude).where(
+                    Destination.geohash.is_(None),
+                    Destination.latitude.is_not(None),
+                    Destination.longitude.is_not(None),
+                ).limit(batch_size)
+            ).all()
+            if not rows:
+                return updated
+            db.execute(update(Destination), [
+                {"id": row.id, "geohash": encode_geohash(row.latitude, row.longitude)}
+                for row in rows
+            ])
+            db.commit()
+            updated += len(rows)
+
+
+def migrate() -> None:
+    """Create missing tables and columns, then fill in the data they derive from"""
+    init_db()
+    logger.info("Database schema is up to date")
+    logger.info(f"Backfilled rating aggregates for {backfill_destination_ratings()} destinations")
+    logger.info(f"Backfilled geohashes for {backfill_destination_geohashes()} destinations")
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    migrate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import os
+import tempfile
+
+# Settings are read at import time, so point the app at a throwaway database
+# first. A file rather than :memory:, so the sync and async engines share it.
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='cemelin-test-')}/test.db"
+os.environ.setdefault("PROJECT_NAME", "Cemelin Travel API")
+os.environ.setdefault("VERSION", "test")
+os.environ.setdefault("API_V1_STR", "/api/v1")
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "60")
+os.environ.setdefault("ALLOWED_ORIGINS", "http://localhost:5173")
+os.environ.setdefault("GOOGLE_PLACES_API_KEY", "test-key")
+os.environ["photo_cache_dir"] = tempfile.mkdtemp(prefix="photo-cache-")
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.database import Base, SessionLocal, engine, init_db
+from app.deps import get_current_principal, get_current_user
+from app.main import app
+from app.models.user import User
+from app.schemas.user import Principal
+
+
+@pytest.fixture
+def db():
+    init_db()
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def user(db):
+    user = User(
+        email="traveller@example.com",
+        username="traveller",
+        hashed_password="not-a-real-hash",
+        is_active=True,
+    )
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    # Detach so later commits in the test don't expire it under the app's session
+    db.expunge(user)
+    return user
+
+
+@pytest.fixture
+def client(db, user):
+    principal = Principal(id=user.id, is_active=user.is_active, is_superuser=bool(user.is_superuser))
+    app.dependency_overrides[get_current_principal] = lambda: principal
+    app.dependency_overrides[get_current_user] = lambda: user
+    with TestClient(app) as client:
+        yield client
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def count_queries():
+    """Context manager factory that records the SQL statements run inside it."""
+    from contextlib import contextmanager
+    from sqlalchemy import event
+
+    @contextmanager
+    def counter():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    return counter
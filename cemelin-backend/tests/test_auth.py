@@ -0,0 +1,102 @@
+from fastapi.testclient import TestClient
+from jose import jwt
+
+from app.config import settings
+from app.main import app
+from app.models.user import User
+from app.services.passwords import PasswordHasher, create_crypt_context, pwd_context
+
+
+def register_and_verify(client, db):
+    response = client.post("/api/v1/auth/register", json={
+        "email": "new@example.com", "username": "new", "password": "correct-horse",
+    })
+    assert response.status_code == 200
+    token = db.query(User.verification_token).filter(User.email == "new@example.com").scalar()
+    assert client.post("/api/v1/auth/verify-email",
+                       json={"email": "new@example.com", "token": token}).status_code == 200
+
+
+def test_register_verify_and_login(db):
+    with TestClient(app) as client:
+        register_and_verify(client, db)
+
+        bad = client.post("/api/v1/auth/login", data={"username": "new@example.com", "password": "wrong-pass"})
+        good = client.post("/api/v1/auth/login", data={"username": "new@example.com", "password": "correct-horse"})
+
+    assert bad.status_code == 401
+    assert good.status_code == 200
+    assert good.json()["token_type"] == "bearer"
+
+
+def test_login_is_rejected_with_retry_after_when_hashing_is_saturated(db):
+    with TestClient(app) as client:
+        register_and_verify(client, db)
+        app.state.password_hasher = PasswordHasher(pwd_context, max_pending=0, retry_after=3)
+
+        response = client.post("/api/v1/auth/login",
+                               data={"username": "new@example.com", "password": "correct-horse"})
+
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "3"
+
+
+def login(client, password="correct-horse"):
+    response = client.post("/api/v1/auth/login", data={"username": "new@example.com", "password": password})
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def test_authenticated_requests_reuse_the_cached_principal(db, monkeypatch):
+    from app import deps
+
+    loads = []
+    load_principal = deps._load_principal
+
+    async def counting_load(user_id):
+        loads.append(user_id)
+        return await load_principal(user_id)
+
+    monkeypatch.setattr(deps, "_load_principal", counting_load)
+    with TestClient(app) as client:
+        register_and_verify(client, db)
+        headers = login(client)
+        for _ in range(3):
+            assert client.get("/api/v1/trips/", headers=headers).status_code == 200
+
+    assert len(loads) == 1
+
+
+def test_tokens_issued_before_a_password_change_are_rejected(db):
+    with TestClient(app) as client:
+        register_and_verify(client, db)
+        old = login(client)
+        # Back-date the token so it predates the change by more than the iat resolution
+        payload = jwt.decode(old["Authorization"].split()[1], settings.SECRET_KEY, algorithms=["HS256"])
+        payload["iat"] -= 10
+        old = {"Authorization": f"Bearer {jwt.encode(payload, settings.SECRET_KEY, algorithm='HS256')}"}
+        assert client.get("/api/v1/trips/", headers=old).status_code == 200
+
+        changed = client.post("/api/v1/auth/change-password", headers=old,
+                              json={"current_password": "correct-horse", "new_password": "battery-staple"})
+        assert changed.status_code == 200
+
+        assert client.get("/api/v1/trips/", headers=old).status_code == 401
+        assert client.get("/api/v1/trips/", headers=login(client, "battery-staple")).status_code == 200
+
+
+def test_login_rehashes_passwords_stored_with_an_outdated_cost(db):
+    with TestClient(app) as client:
+        register_and_verify(client, db)
+        weak = create_crypt_context(schemes=["bcrypt"], bcrypt_rounds=4)
+        db.query(User).filter(User.email == "new@example.com").update(
+            {"hashed_password": weak.hash("correct-horse")})
+        db.commit()
+        app.state.password_hasher = PasswordHasher(create_crypt_context(schemes=["bcrypt"], bcrypt_rounds=5))
+
+        login(client)
+
+    db.expire_all()
+    stored = db.query(User.hashed_password).filter(User.email == "new@example.com").scalar()
+    assert stored.startswith("$2b$05$")
+    assert create_crypt_context(schemes=["bcrypt"], bcrypt_rounds=5).verify("correct-horse", stored)
@@ -0,0 +1,36 @@
+from app.services.autocomplete import AutocompleteCache
+
+
+def predictions(*descriptions):
+    return [{"description": description} for description in descriptions]
+
+
+def test_exact_queries_hit_after_normalization():
+    cache = AutocompleteCache()
+    cache.set("Bali ", "en", predictions("Bali, Indonesia"))
+
+    assert cache.get("  bali", "en") == predictions("Bali, Indonesia")
+    assert cache.get("bali", "id") is None
+
+
+def test_prefix_is_reused_when_every_prediction_still_matches():
+    cache = AutocompleteCache()
+    cache.set("bal", "en", predictions("Bali, Indonesia", "Bali Barat, Jembrana, Indonesia"))
+
+    assert cache.get("bali", "en") == predictions("Bali, Indonesia", "Bali Barat, Jembrana, Indonesia")
+
+
+def test_prefix_is_not_narrowed_when_predictions_would_be_dropped():
+    cache = AutocompleteCache()
+    cache.set("bal", "en", predictions("Bali, Indonesia", "Balikpapan, Indonesia", "Baltimore, MD, USA"))
+
+    assert cache.get("bali", "en") is None
+
+
+def test_prefixes_shorter_than_the_minimum_are_ignored():
+    cache = AutocompleteCache(min_prefix=2)
+    cache.set("b", "en", predictions("Bali, Indonesia"))
+
+    assert cache.get("ba", "en") is None
+    cache.set("ba", "en", predictions("Bali, Indonesia"))
+    assert cache.get("bal", "en") == predictions("Bali, Indonesia")
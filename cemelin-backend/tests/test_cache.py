@@ -0,0 +1,84 @@
+import asyncio
+import tempfile
+
+import pytest
+
+from app.services import cache as cache_module
+from app.services.cache import LRUCache, MemoryBackend, SQLiteBackend, TwoTierCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    monkeypatch.setattr(cache_module.time, "time", clock)
+    return clock
+
+
+def test_entries_expire_after_their_ttl(clock):
+    cache = LRUCache(ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=60)
+
+    clock.now += 11
+    assert cache.get("a") is None
+    assert cache.get("a", allow_stale=True) == 1
+    assert cache.get("b") == 2
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+
+def test_shared_hits_keep_the_shared_expiry_in_the_local_tier(clock):
+    shared = MemoryBackend()
+    cache = TwoTierCache(LRUCache(ttl=3600), shared)
+
+    async def run():
+        await shared.set("k", {"v": 1}, ttl=30)
+        promoted = await cache.get("k")
+        clock.now += 31
+        return promoted, await cache.get("k")
+
+    promoted, after_expiry = asyncio.run(run())
+    assert promoted == {"v": 1}
+    assert after_expiry is None
+
+
+def test_sqlite_backend_prunes_expired_then_least_recently_used(clock):
+    backend = SQLiteBackend(f"{tempfile.mkdtemp(prefix='cache-')}/cache.db", max_entries=2)
+    backend.PRUNE_EVERY = 4
+
+    async def run():
+        await backend.set("expired", 1, ttl=5)
+        clock.now += 10
+        await backend.set("old", 2, ttl=60)
+        clock.now += 1
+        await backend.set("newer", 3, ttl=60)
+        clock.now += 1
+        # The fourth write prunes: "expired" is gone, then "old" is over max_entries
+        await backend.set("newest", 4, ttl=60)
+        rows = backend._conn.execute("SELECT key FROM cache_entries ORDER BY key").fetchall()
+        remaining = await backend.get_with_ttl("newest")
+        await backend.close()
+        return [row[0] for row in rows], remaining
+
+    keys, remaining = asyncio.run(run())
+    assert keys == ["newer", "newest"]
+    assert remaining == (4, 60)
@@ -0,0 +1,67 @@
+import asyncio
+
+from app.schemas.location import MapMarker, MarkerCluster
+from app.services.clustering import ClusterIndexCache, GridClusterIndex, cluster_markers
+
+WORLD = (-85.0, -180.0, 85.0, 180.0)
+
+
+def markers(points):
+    return [MapMarker(lat=lat, lng=lng, title=f"m{i}", place_id=f"p{i}") for i, (lat, lng) in enumerate(points)]
+
+
+def test_dense_markers_collapse_into_bounded_clusters():
+    # A 40 x 40 grid of markers across Bali
+    points = [(-8.8 + i * 0.01, 114.9 + j * 0.02) for i in range(40) for j in range(40)]
+    index = GridClusterIndex(markers(points))
+
+    # The area may straddle a cell boundary, but never more than four cells
+    zoomed_out = index.query(WORLD, 5)
+    assert 1 <= len(zoomed_out) <= 4
+    assert all(isinstance(item, MarkerCluster) and item.expansion_zoom > 5 for item in zoomed_out)
+
+    # Counts are preserved at every zoom, and items never exceed the markers
+    for zoom in range(0, 17):
+        items = index.query(WORLD, zoom)
+        assert sum(getattr(item, "count", 1) for item in items) == 1600
+        assert len(items) <= 1600
+
+
+def test_isolated_marker_is_returned_as_is():
+    index = GridClusterIndex(markers([(-8.5, 115.2), (-6.2, 106.8)]))
+
+    items = index.query(WORLD, 10)
+
+    assert sorted(item.place_id for item in items) == ["p0", "p1"]
+
+
+def test_cluster_markers_clips_to_bbox():
+    items = cluster_markers(markers([(-8.5, 115.2), (-8.5001, 115.2001), (-6.2, 106.8)]),
+                            (-9.0, 114.0, -8.0, 116.0), 8)
+
+    assert len(items) == 1
+    assert items[0].count == 2
+
+
+def test_invalidated_index_is_rebuilt_even_mid_rebuild():
+    cache = ClusterIndexCache(ttl=300)
+    stored = [MapMarker(lat=-8.5, lng=115.26, title="Ubud", place_id="ubud")]
+    loads = []
+
+    async def load():
+        loads.append(len(stored))
+        if len(loads) == 1:
+            # A destination is stored while the first build is loading
+            stored.append(MapMarker(lat=-8.43, lng=115.28, title="Tegallalang", place_id="tegallalang"))
+            cache.invalidate()
+        return list(stored)
+
+    async def run():
+        await cache.get(load)
+        index = await cache.get(load)
+        await cache.get(load)
+        return index
+
+    index = asyncio.run(run())
+    assert loads == [1, 2]
+    assert len(index.markers) == 2
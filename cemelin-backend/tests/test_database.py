@@ -0,0 +1,27 @@
+import asyncio
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.database import _async_database_url, _database_url, _engine_options
+
+
+def test_sync_and_async_engines_share_one_in_memory_database():
+    url = _database_url("sqlite:///:memory:")
+    async_url = _async_database_url(url)
+    engine = create_engine(url, **_engine_options(url))
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE users (name TEXT)"))
+        connection.execute(text("INSERT INTO users VALUES ('traveller')"))
+
+    async def read():
+        async_engine = create_async_engine(async_url, **_engine_options(async_url))
+        async with async_engine.connect() as connection:
+            names = (await connection.execute(text("SELECT name FROM users"))).scalars().all()
+        await async_engine.dispose()
+        return names
+
+    try:
+        assert asyncio.run(read()) == ["traveller"]
+    finally:
+        engine.dispose()
@@ -0,0 +1,133 @@
+import asyncio
+
+import httpx
+from fastapi.testclient import TestClient
+from sqlalchemy import Column, MetaData, String, Table, create_engine, event, select, update
+
+from app.api.destinations import _fetch_and_store_destination
+from app.main import app
+from app.models.destination import Destination
+from app.services.geo import cells_clause, encode_geohash, next_cell
+
+
+def add_destinations(db, points):
+    db.add_all([
+        Destination(name=name, latitude=lat, longitude=lng, country="Indonesia", city="Bali",
+                    place_id=f"place-{name}", formatted_address=name)
+        for name, lat, lng in points
+    ])
+    db.commit()
+
+
+def test_geohash_matches_reference_encoding():
+    assert encode_geohash(57.64911, 10.40744, 11) == "u4pruydqqvj"
+
+
+def test_next_cell_carries_past_the_last_character():
+    assert next_cell("u4pr") == "u4ps"
+    assert next_cell("u4pz") == "u4q"
+    assert next_cell("zz") is None
+
+
+def _locale_order(a, b):
+    # Like en_US.UTF-8: punctuation sorts before digits, digits before letters
+    def key(value):
+        return [(0 if not c.isalnum() else 1 if c.isdigit() else 2, c) for c in value]
+    return (key(a) > key(b)) - (key(a) < key(b))
+
+
+def test_cell_ranges_hold_under_a_locale_collation():
+    engine = create_engine("sqlite://")
+    event.listen(engine, "connect", lambda conn, _: conn.create_collation("locale", _locale_order))
+    table = Table("points", MetaData(), Column("geohash", String(12, collation="locale")))
+    table.create(engine)
+    hashes = ["u4pr0", "u4przzz", "u4ps0", "u4pz9", "u4q00", "zzzzz"]
+    with engine.begin() as conn:
+        conn.execute(table.insert(), [{"geohash": h} for h in hashes])
+        found = lambda cells: sorted(conn.scalars(select(table.c.geohash).where(cells_clause(table.c.geohash, cells))))
+
+        assert found({"u4pr"}) == ["u4pr0", "u4przzz"]
+        assert found({"u4pz", "zz"}) == ["u4pz9", "zzzzz"]
+
+
+def test_nearby_returns_stored_destinations_nearest_first(db, client):
+    add_destinations(db, [
+        ("Ubud", -8.5069, 115.2625),
+        ("Tegallalang", -8.4312, 115.2791),
+        ("Kuta", -8.7180, 115.1686),
+        ("Taveuni", -16.8, 179.9),
+    ])
+    assert db.query(Destination).filter(Destination.geohash.is_(None)).count() == 0
+
+    response = client.get("/api/v1/destinations/nearby",
+                          params={"lat": -8.5, "lng": 115.26, "radius": 15000})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [d["name"] for d in body] == ["Ubud", "Tegallalang"]
+    assert body[0]["distance"] < body[1]["distance"] < 15000
+
+
+def test_startup_indexes_destinations_stored_before_geohashes(db):
+    add_destinations(db, [("Ubud", -8.5069, 115.2625)])
+    # As stored before the geohash column existed
+    db.execute(update(Destination).values(geohash=None))
+    db.commit()
+
+    with TestClient(app) as client:
+        response = client.get("/api/v1/destinations/nearby",
+                              params={"lat": -8.5, "lng": 115.26, "radius": 15000})
+
+    assert [d["name"] for d in response.json()] == ["Ubud"]
+
+
+def test_within_handles_antimeridian(db, client):
+    add_destinations(db, [("Taveuni", -16.8, 179.9), ("Ubud", -8.5069, 115.2625)])
+
+    response = client.get("/api/v1/destinations/within",
+                          params={"south": -17, "west": 179, "north": -16, "east": -179})
+
+    assert response.status_code == 200
+    assert [d["name"] for d in response.json()] == ["Taveuni"]
+
+
+def test_concurrent_lookups_of_a_new_place_fetch_and_insert_once(db):
+    calls = []
+
+    async def handler(request):
+        calls.append(request.url.params["place_id"])
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"status": "OK", "result": {
+            "name": "Ubud", "formatted_address": "Ubud, Bali",
+            "geometry": {"location": {"lat": -8.5069, "lng": 115.2625}},
+            "address_components": [{"long_name": "Indonesia", "types": ["country"]}],
+        }})
+
+    async def run():
+        async with app.router.lifespan_context(app):
+            app.state.http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                return await asyncio.gather(*(
+                    client.get("/api/v1/destinations/place-ubud") for _ in range(5)
+                ))
+
+    responses = asyncio.run(run())
+
+    assert [response.status_code for response in responses] == [200] * 5
+    assert len({response.json()["id"] for response in responses}) == 1
+    assert calls == ["place-ubud"]
+    assert db.query(Destination).filter(Destination.place_id == "place-ubud").count() == 1
+
+
+def test_insert_race_falls_back_to_the_existing_row(db):
+    add_destinations(db, [("Ubud", -8.5069, 115.2625)])
+    existing = db.query(Destination.id).filter(Destination.place_id == "place-Ubud").scalar()
+
+    class Places:
+        async def place_details(self, place_id, fields):
+            return {"name": "Ubud", "formatted_address": "Ubud",
+                    "geometry": {"location": {"lat": -8.5069, "lng": 115.2625}}}
+
+    # Another worker stored the place between our lookup and our insert
+    assert asyncio.run(_fetch_and_store_destination(Places(), "place-Ubud")) == existing
+    assert db.query(Destination).filter(Destination.place_id == "place-Ubud").count() == 1
@@ -0,0 +1,115 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.cache import LRUCache, TwoTierCache
+from app.services.governor import CircuitBreaker, UpstreamGovernor, UpstreamUnavailable
+from app.services.places import PlacesClient
+
+
+class FakePlaces:
+    """A local stand-in for the Places web service that can be made to fail"""
+
+    def __init__(self):
+        self.mode = "ok"
+        self.calls = 0
+        self.app = FastAPI()
+
+        @self.app.get("/maps/api/place/details/json")
+        async def details(place_id: str):
+            return await self.answer({"status": "OK", "result": {"name": place_id}})
+
+        @self.app.get("/maps/api/place/autocomplete/json")
+        async def autocomplete(input: str):
+            return await self.answer({"status": "OK", "predictions": []})
+
+    async def answer(self, body):
+        self.calls += 1
+        if self.mode == "down":
+            return _error()
+        if self.mode == "slow":
+            await asyncio.sleep(1)
+        if self.mode == "flaky":
+            self.mode = "ok"
+            return _error()
+        return body
+
+    def client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=self.app))
+
+
+def _error():
+    return JSONResponse({"error": "backend error"}, status_code=500)
+
+
+def governor(**options) -> UpstreamGovernor:
+    defaults = dict(rate=1000, burst=1000, max_concurrency=10, timeout=5, queue_timeout=1,
+                    retries=2, backoff_base=0, breaker=CircuitBreaker(failure_threshold=3, reset_timeout=60))
+    return UpstreamGovernor("places", **{**defaults, **options})
+
+
+@pytest.fixture
+def fake():
+    return FakePlaces()
+
+
+def test_transient_failures_are_retried(fake):
+    fake.mode = "flaky"
+
+    async def run():
+        places = PlacesClient(fake.client(), "test-key", governors={"places": governor()})
+        return await places.place_details("p1", fields=["name"])
+
+    assert asyncio.run(run()) == {"name": "p1"}
+    assert fake.calls == 2
+
+
+def test_open_breaker_fails_fast_and_serves_stale_details(fake):
+    async def run():
+        # Entries expire at once, so only the allow-stale path can return them
+        places = PlacesClient(fake.client(), "test-key", cache=TwoTierCache(LRUCache(ttl=0)),
+                              governors={"places": governor()})
+        await places.place_details("p1", fields=["name"])
+        fake.mode = "down"
+        stale = await places.place_details("p1", fields=["name"])
+        calls = fake.calls
+        with pytest.raises(UpstreamUnavailable):
+            await places.place_details("p2", fields=["name"])
+        return stale, calls
+
+    stale, calls = asyncio.run(run())
+    assert stale == {"name": "p1"}
+    # One good call, then three failed attempts open the breaker
+    assert calls == 4
+    assert fake.calls == 4
+
+
+def test_slow_upstream_is_cut_off_by_the_deadline(fake):
+    fake.mode = "slow"
+
+    async def run():
+        places = PlacesClient(fake.client(), "test-key", governors={"places": governor(timeout=0.05, retries=0)})
+        await places.place_details("p1", fields=["name"])
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(run())
+
+
+def test_api_answers_503_with_retry_after_while_the_breaker_is_open(db, fake):
+    fake.mode = "down"
+    with TestClient(app) as client:
+        app.state.http_client = fake.client()
+        app.state.upstream_governors["places"] = governor(retries=0, breaker=CircuitBreaker(1, reset_timeout=30))
+
+        first = client.get("/api/v1/locations/search", params={"query": "bali"})
+        second = client.get("/api/v1/locations/search", params={"query": "bali"})
+
+    assert first.status_code == 500
+    assert second.status_code == 503
+    assert 1 <= int(second.headers["retry-after"]) <= 30
+    assert fake.calls == 1
@@ -0,0 +1,95 @@
+import os
+from unittest.mock import patch
+
+import httpx
+
+from app.config import settings
+from app.deps import get_places_client
+from app.main import app
+from app.models.destination import Destination
+from app.services.photos import PhotoStore
+from app.services.refresh import FIELD_GROUPS
+from app.services.places import PlacesClient
+
+JPEG = b"\xff\xd8\xff" + bytes(range(256)) * 4
+
+
+def test_photo_is_fetched_once_and_served_with_etag_and_ranges(client):
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.params["photo_reference"])
+        return httpx.Response(200, content=JPEG, headers={"content-type": "image/jpeg"})
+
+    places = PlacesClient(httpx.AsyncClient(transport=httpx.MockTransport(handler)), "test-key")
+    app.dependency_overrides[get_places_client] = lambda: places
+
+    first = client.get("/api/v1/photos/ref-1")
+    assert first.status_code == 200
+    assert first.content == JPEG
+    assert first.headers["content-type"] == "image/jpeg"
+    etag = first.headers["etag"]
+    assert not etag.startswith("W/")
+
+    assert client.get("/api/v1/photos/ref-1", headers={"If-None-Match": etag}).status_code == 304
+
+    partial = client.get("/api/v1/photos/ref-1", headers={"Range": "bytes=0-9"})
+    assert partial.status_code == 206
+    assert partial.content == JPEG[:10]
+
+    assert calls == ["ref-1"]
+
+
+def test_store_keeps_one_blob_per_content_and_evicts_least_recently_used(tmp_path):
+    store = PhotoStore(str(tmp_path), max_bytes=2500)
+    a = store.put("a", 800, b"a" * 1000, "image/jpeg")
+    assert store.put("a-again", 800, b"a" * 1000, "image/jpeg").path == a.path
+    store.put("b", 800, b"b" * 1000, "image/jpeg")
+    os.utime(a.path, (0, 0))
+    os.utime(store.get("b", 800).path)
+
+    store.put("c", 800, b"c" * 1000, "image/jpeg")
+
+    assert store.get("a", 800) is None
+    assert store.get("b", 800) is not None
+    assert store.get("c", 800) is not None
+
+
+def test_batch_returns_urls_and_warms_the_cache(client):
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.params["photo_reference"])
+        return httpx.Response(200, content=JPEG, headers={"content-type": "image/jpeg"})
+
+    places = PlacesClient(httpx.AsyncClient(transport=httpx.MockTransport(handler)), "test-key")
+    app.dependency_overrides[get_places_client] = lambda: places
+
+    response = client.post("/api/v1/photos/batch",
+                           json={"references": ["r1", "r2", "r1"], "max_width": 400, "warm": True})
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "r1": "http://testserver/api/v1/photos/r1?max_width=400",
+        "r2": "http://testserver/api/v1/photos/r2?max_width=400",
+    }
+    assert sorted(calls) == ["r1", "r2"]
+    assert client.get("/api/v1/photos/r1", params={"max_width": 400}).status_code == 200
+    assert sorted(calls) == ["r1", "r2"]
+
+
+def test_stored_photo_paths_are_served_as_absolute_urls(db, client):
+    stored = FIELD_GROUPS["photos"][1]({"photos": [{"photo_reference": "ref-1"}]})
+    # Kept relative in the database, so a new origin needs no migration
+    assert stored["image_url"] == "/api/v1/photos/ref-1?max_width=800"
+    db.add(Destination(name="Ubud", latitude=-8.5, longitude=115.26, country="Indonesia", city="Bali",
+                       place_id="place-ubud", formatted_address="Ubud", **stored))
+    db.commit()
+
+    served = client.get("/api/v1/destinations/place-ubud").json()
+    assert served["image_url"] == "http://testserver/api/v1/photos/ref-1?max_width=800"
+    assert served["images"] == [served["image_url"]]
+
+    with patch.object(settings, "public_base_url", "https://api.example.com/"):
+        served = client.get("/api/v1/destinations/place-ubud").json()
+    assert served["image_url"] == "https://api.example.com/api/v1/photos/ref-1?max_width=800"
@@ -0,0 +1,48 @@
+import asyncio
+
+import httpx
+
+from app.services.cache import LRUCache, TwoTierCache
+from app.services.places import PlacesClient
+
+
+def places_client(handler):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return PlacesClient(client, "test-key", cache=TwoTierCache(LRUCache()))
+
+
+def test_coordinates_from_search_results_are_reused():
+    requests = []
+
+    def handler(request):
+        requests.append(request.url.path)
+        return httpx.Response(200, json={"status": "OK", "results": [
+            {"place_id": "p1", "name": "Ubud", "geometry": {"location": {"lat": -8.5, "lng": 115.26}}},
+        ]})
+
+    async def run():
+        places = places_client(handler)
+        await places.nearby_search(-8.5, 115.26, 1000)
+        return await places.place_coordinates("p1")
+
+    assert asyncio.run(run()) == (-8.5, 115.26)
+    assert requests == ["/maps/api/place/nearbysearch/json"]
+
+
+def test_unknown_place_coordinates_come_from_details_once():
+    requests = []
+
+    def handler(request):
+        requests.append(request.url.params["fields"])
+        return httpx.Response(200, json={"status": "OK", "result": {
+            "geometry": {"location": {"lat": 1.0, "lng": 2.0}},
+        }})
+
+    async def run():
+        places = places_client(handler)
+        first = await places.place_coordinates("p2")
+        second = await places.place_coordinates("p2")
+        return first, second
+
+    assert asyncio.run(run()) == ((1.0, 2.0), (1.0, 2.0))
+    assert requests == ["geometry"]
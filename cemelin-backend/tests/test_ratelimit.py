@@ -0,0 +1,84 @@
+import asyncio
+import tempfile
+from unittest.mock import patch
+
+from app.config import settings
+from app.deps import create_access_token
+from app.main import app
+from app.services.ratelimit import (
+    MemoryRateLimitStore, RateLimit, RateLimiter, SQLiteRateLimitStore, default_rules, request_caller,
+)
+
+
+def use_limiter(default: RateLimit) -> None:
+    app.state.rate_limiter = RateLimiter(MemoryRateLimitStore(), default_rules(), default)
+
+
+def test_requests_beyond_the_budget_get_429_with_retry_after(client):
+    use_limiter(RateLimit(requests=2, period=60))
+
+    responses = [client.get("/api/v1/trips/") for _ in range(3)]
+
+    assert [r.status_code for r in responses] == [200, 200, 429]
+    assert responses[0].headers["x-ratelimit-limit"] == "2"
+    assert responses[1].headers["x-ratelimit-remaining"] == "0"
+    assert int(responses[2].headers["retry-after"]) >= 30
+    assert client.get("/healthz").status_code == 200
+
+
+def test_budgets_are_kept_per_user_and_per_route_group(client):
+    use_limiter(RateLimit(requests=1, period=60))
+    first = {"Authorization": f"Bearer {create_access_token(1)}"}
+    second = {"Authorization": f"Bearer {create_access_token(2)}"}
+
+    assert client.get("/api/v1/trips/", headers=first).status_code == 200
+    assert client.get("/api/v1/trips/", headers=first).status_code == 429
+    assert client.get("/api/v1/trips/", headers=second).status_code == 200
+    # Login has its own, stricter, budget rather than sharing the default one
+    assert client.post("/api/v1/auth/login", headers=first,
+                       data={"username": "x@example.com", "password": "x"}).status_code == 401
+
+
+def test_sqlite_store_shares_buckets_between_workers():
+    path = f"{tempfile.mkdtemp(prefix='rate-limits-')}/rate_limits.db"
+    limit = RateLimit(requests=2, period=60)
+
+    async def hits():
+        workers = [SQLiteRateLimitStore(path), SQLiteRateLimitStore(path)]
+        results = [await workers[i % 2].hit("default:ip:1.2.3.4", limit) for i in range(3)]
+        for worker in workers:
+            await worker.close()
+        return results
+
+    assert [result.allowed for result in asyncio.run(hits())] == [True, True, False]
+
+
+def test_routes_that_reach_google_get_their_own_budgets():
+    limiter = RateLimiter(MemoryRateLimitStore(), default_rules("/api/v1"), RateLimit(100, 60))
+
+    assert limiter.rule_for("GET", "/api/v1/locations/search")[0] == "typeahead"
+    assert limiter.rule_for("GET", "/api/v1/locations/place-1")[0] == "upstream"
+    assert limiter.rule_for("GET", "/api/v1/photos/ref-1")[0] == "photos"
+    assert limiter.rule_for("GET", "/api/v1/destinations/place-1")[0] == "upstream"
+    # Served from the database only
+    for path in ("/api/v1/destinations/", "/api/v1/destinations/nearby", "/api/v1/destinations/within"):
+        assert limiter.rule_for("GET", path)[0] == "default"
+    assert limiter.rule_for("POST", "/api/v1/destinations/")[0] == "default"
+
+
+def test_client_ip_is_taken_from_the_proxy_header():
+    scope = {"headers": [(b"fly-client-ip", b"203.0.113.7")], "client": ("10.0.0.1", 443)}
+
+    assert request_caller(scope) == "ip:10.0.0.1"
+    with patch.object(settings, "rate_limit_client_ip_header", "Fly-Client-IP"):
+        assert request_caller(scope) == "ip:203.0.113.7"
+
+
+def test_cross_origin_clients_can_read_the_rate_limit_headers(client):
+    use_limiter(RateLimit(requests=10, period=60))
+
+    response = client.get("/api/v1/trips/", headers={"Origin": "http://localhost:5173"})
+
+    exposed = response.headers["Access-Control-Expose-Headers"].lower()
+    for name in ("x-ratelimit-limit", "x-ratelimit-remaining", "x-ratelimit-reset", "retry-after"):
+        assert name in exposed
@@ -0,0 +1,119 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.database import dispose_async_engine
+from app.models.destination import Destination
+from app.services.governor import PLACES_API, CircuitBreaker, UpstreamGovernor
+from app.services.places import PlacesClient
+from app.services.refresh import DestinationRefresher, ReadCounter, due_groups
+from app.services.throttle import TokenBucket
+
+TTLS = {"ratings": 100, "hours": 1000, "photos": 10000, "contact": 10000}
+
+
+def test_each_field_group_goes_stale_on_its_own_ttl():
+    destination = Destination(refreshed_at={"ratings": 0, "hours": 0, "photos": 0, "contact": 0})
+
+    assert due_groups(destination, TTLS, 50) == []
+    assert due_groups(destination, TTLS, 500) == ["ratings"]
+    assert due_groups(destination, TTLS, 5000) == ["ratings", "hours"]
+
+
+def test_rows_without_refresh_times_count_from_their_last_write():
+    written = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    destination = Destination(created_at=written.replace(tzinfo=None))
+
+    assert due_groups(destination, TTLS, written.timestamp() + 500) == ["ratings"]
+
+
+def test_token_bucket_paces_after_the_burst():
+    bucket = TokenBucket(rate=50, burst=2)
+
+    async def take(n):
+        for _ in range(n):
+            await bucket.acquire()
+
+    started = time.monotonic()
+    asyncio.run(take(7))
+    # Two tokens are free, the other five arrive at 50 per second
+    assert time.monotonic() - started >= 0.09
+
+
+def add_stale_destinations(db, now, names):
+    old = datetime.fromtimestamp(now - 4000, tz=timezone.utc).replace(tzinfo=None)
+    for name, reads in names:
+        db.add(Destination(name=name, place_id=f"place-{name}", created_at=old, read_count=reads,
+                           refreshed_at={"ratings": now - 4000, "hours": now, "photos": now, "contact": now}))
+    db.commit()
+
+
+def run_passes(handler, now, passes=1, batch_size=50):
+    """refresh_batch results of successive passes, against a fake Places API"""
+    async def run():
+        http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        governors = {PLACES_API: UpstreamGovernor(PLACES_API, rate=1000, burst=1000, max_concurrency=10,
+                                                  retries=0, breaker=CircuitBreaker(failure_threshold=5))}
+        refresher = DestinationRefresher(
+            lambda: PlacesClient(http_client, "test-key", governors=governors),
+            ReadCounter(),
+            TokenBucket(rate=1000, burst=10),
+            batch_size=batch_size,
+        )
+        with patch.object(settings, "destination_refresh_ttl_ratings", 3600):
+            results = [await refresher.refresh_batch(now) for _ in range(passes)]
+        await http_client.aclose()
+        await dispose_async_engine()
+        return results
+
+    return asyncio.run(run())
+
+
+def test_refresh_batch_survives_failing_rows_and_moves_them_back(db):
+    now = time.time()
+    add_stale_destinations(db, now, (("broken", 10), ("ok", 1)))
+    calls = []
+
+    async def handler(request):
+        place_id = request.url.params["place_id"]
+        calls.append(place_id)
+        if place_id == "place-broken":
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(200, json={"status": "OK", "result": {"rating": 4.5}})
+
+    assert run_passes(handler, now) == [2]
+    assert calls == ["place-broken", "place-ok"]
+
+    db.expire_all()
+    broken, ok = (db.query(Destination).filter(Destination.place_id == f"place-{name}").one()
+                  for name in ("broken", "ok"))
+    assert ok.rating == 4.5 and ok.read_count == 0
+    # The failed row keeps its values, leaves the head of the queue and is retried after the delay
+    assert broken.rating is None and broken.read_count == 0
+    assert broken.updated_at is None
+    retry_at = broken.refreshed_at["ratings"] + 3600
+    assert retry_at == pytest.approx(now + settings.destination_refresh_retry_delay)
+    assert broken.next_refresh_at == pytest.approx(retry_at)
+
+
+def test_rows_google_rejects_do_not_fill_every_batch(db):
+    now = time.time()
+    add_stale_destinations(db, now, (("gone-1", 0), ("gone-2", 0), ("ok", 0)))
+    calls = []
+
+    async def handler(request):
+        place_id = request.url.params["place_id"]
+        calls.append(place_id)
+        if place_id.startswith("place-gone"):
+            return httpx.Response(200, json={"status": "NOT_FOUND"})
+        return httpx.Response(200, json={"status": "OK", "result": {"rating": 4.5}})
+
+    assert run_passes(handler, now, passes=3, batch_size=2) == [2, 1, 0]
+    assert calls == ["place-gone-1", "place-gone-2", "place-ok"]
+    db.expire_all()
+    assert db.query(Destination).filter(Destination.place_id == "place-ok").one().rating == 4.5
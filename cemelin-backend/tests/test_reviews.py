@@ -0,0 +1,96 @@
+from types import SimpleNamespace
+
+from app.api.reviews import _record_rating
+from app.models.destination import Destination, DestinationRating
+from app.models.review import Review
+from app.tools.migrate import backfill_destination_ratings
+
+
+def test_review_pages_do_not_repeat_same_second_rows(db, user, client):
+    destination = Destination(name="Uluwatu", place_id="uluwatu")
+    db.add(destination)
+    db.flush()
+    # Inserted in one statement batch, so they share a created_at second
+    db.add_all([Review(rating=5, user_id=user.id, destination_id=destination.id) for _ in range(5)])
+    db.commit()
+
+    ids = []
+    params = {"limit": 2}
+    for _ in range(5):
+        response = client.get(f"/api/v1/reviews/destination/{destination.id}", params=params)
+        assert response.status_code == 200
+        ids.extend(review["id"] for review in response.json())
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+
+    assert ids == sorted(ids, reverse=True)
+    assert len(ids) == len(set(ids)) == 5
+
+
+def test_rating_stats_follow_review_inserts(db, client):
+    destination = Destination(name="Uluwatu", place_id="uluwatu")
+    db.add(destination)
+    db.commit()
+    stats_url = f"/api/v1/reviews/destination/{destination.id}/stats"
+    assert client.get(stats_url).json() == {
+        "destination_id": destination.id, "count": 0, "average": None,
+        "histogram": {"1": 0, "2": 0, "3": 0, "4": 0, "5": 0},
+    }
+
+    for rating in (5, 4, 4, 2):
+        response = client.post("/api/v1/reviews/", json={"destination_id": destination.id, "rating": rating})
+        assert response.status_code == 200
+
+    stats = client.get(stats_url).json()
+    assert stats["count"] == 4
+    assert stats["average"] == 3.75
+    assert stats["histogram"] == {"1": 0, "2": 1, "3": 0, "4": 2, "5": 1}
+
+
+def test_first_review_falls_back_to_increment_when_the_aggregate_appears_concurrently(db, user):
+    destination = Destination(name="Uluwatu", place_id="uluwatu")
+    db.add(destination)
+    db.flush()
+    # Another transaction created the aggregate after our UPDATE matched nothing
+    db.add(DestinationRating(destination_id=destination.id, ratings_count=1, ratings_sum=5, stars_5=1))
+    db.flush()
+    execute = db.execute
+    calls = []
+
+    def first_update_misses(statement, *args, **kwargs):
+        calls.append(statement)
+        if len(calls) == 1:
+            return SimpleNamespace(rowcount=0)
+        return execute(statement, *args, **kwargs)
+
+    db.execute = first_update_misses
+    _record_rating(db, destination.id, 3)
+    del db.execute
+    db.commit()
+
+    # The insert hit the unique constraint and the increment was retried
+    assert len(calls) == 2
+
+    stats = db.query(DestinationRating).filter(DestinationRating.destination_id == destination.id).one()
+    assert (stats.ratings_count, stats.ratings_sum, stats.stars_3, stats.stars_5) == (2, 8, 1, 1)
+
+
+def test_backfill_recomputes_aggregates_that_disagree_with_reviews(db, user):
+    older, newer = Destination(name="Uluwatu", place_id="uluwatu"), Destination(name="Ubud", place_id="ubud")
+    db.add_all([older, newer])
+    db.flush()
+    db.add_all([Review(rating=rating, user_id=user.id, destination_id=older.id) for rating in (4, 5, 3)])
+    db.add(Review(rating=2, user_id=user.id, destination_id=newer.id))
+    # The 3 was posted before any backfill, so its aggregate counts it alone
+    db.add(DestinationRating(destination_id=older.id, ratings_count=1, ratings_sum=3, stars_3=1))
+    db.commit()
+
+    assert backfill_destination_ratings() == 2
+    assert backfill_destination_ratings() == 0
+
+    db.expire_all()
+    stats = {row.destination_id: row for row in db.query(DestinationRating)}
+    assert (stats[older.id].ratings_count, stats[older.id].ratings_sum) == (3, 12)
+    assert [getattr(stats[older.id], f"stars_{n}") for n in range(1, 6)] == [0, 0, 1, 1, 1]
+    assert (stats[newer.id].ratings_count, stats[newer.id].stars_2) == (1, 1)
@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+from app.services.singleflight import SingleFlight
+
+
+def test_concurrent_calls_with_one_key_share_one_execution():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "done"
+
+    async def run():
+        flights = SingleFlight()
+        results = await asyncio.gather(*(flights.do("k", work) for _ in range(5)))
+        return results, len(flights)
+
+    results, inflight = asyncio.run(run())
+    assert results == ["done"] * 5
+    assert calls == [1]
+    assert inflight == 0
+
+
+def test_cancelled_caller_does_not_cancel_the_shared_work():
+    async def work():
+        await asyncio.sleep(0.01)
+        return "done"
+
+    async def run():
+        flights = SingleFlight()
+        first = asyncio.ensure_future(flights.do("k", work))
+        second = asyncio.ensure_future(flights.do("k", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(run()) == "done"
@@ -0,0 +1,61 @@
+import asyncio
+
+from app.services.geo import haversine_m
+from app.services.tiles import MarkerTileCache
+
+
+class FakePlaces:
+    """Returns a fixed set of places for every Nearby Search, counting calls"""
+
+    def __init__(self, points):
+        self.points = points
+        self.calls = 0
+
+    async def nearby_search(self, lat, lng, radius, type=None):
+        self.calls += 1
+        return [
+            {"place_id": name, "name": name, "geometry": {"location": {"lat": plat, "lng": plng}}}
+            for name, plat, plng in self.points
+            if haversine_m(lat, lng, plat, plng) <= radius
+        ]
+
+
+def test_nearby_requests_share_cached_tiles():
+    places = FakePlaces([("a", -8.500, 115.260), ("b", -8.505, 115.265), ("far", -8.9, 115.6)])
+    tiles = MarkerTileCache(max_tiles=9)
+
+    first = asyncio.run(tiles.search(places, -8.5, 115.26, 2000))
+    calls = places.calls
+    # Panning slightly lands on the same tiles
+    second = asyncio.run(tiles.search(places, -8.501, 115.261, 2000))
+
+    assert sorted(r["place_id"] for r in first) == ["a", "b"]
+    assert sorted(r["place_id"] for r in second) == ["a", "b"]
+    assert 0 < calls <= 9
+    assert places.calls == calls
+
+
+def test_results_are_clipped_to_the_requested_circle():
+    places = FakePlaces([("a", -8.500, 115.260), ("b", -8.505, 115.265)])
+    tiles = MarkerTileCache(max_tiles=9)
+
+    results = asyncio.run(tiles.search(places, -8.5, 115.26, 300))
+
+    assert [r["place_id"] for r in results] == ["a"]
+
+
+def test_every_tile_fits_in_one_nearby_search():
+    places = FakePlaces([("a", -8.5, 115.26)])
+    radii = []
+    nearby_search = places.nearby_search
+
+    async def recording(lat, lng, radius, type=None):
+        radii.append(radius)
+        return await nearby_search(lat, lng, radius, type)
+
+    places.nearby_search = recording
+    results = asyncio.run(MarkerTileCache(max_tiles=9).search(places, -8.5, 115.26, 50000))
+
+    assert [r["place_id"] for r in results] == ["a"]
+    assert radii and max(radii) <= 50000
+    assert len(radii) <= 16
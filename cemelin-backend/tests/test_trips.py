@@ -0,0 +1,210 @@
+import json
+from datetime import date
+
+import pytest
+
+from app.models.destination import Destination
+from app.models.trip import Trip, TripDestination
+
+
+def make_trips(db, user, trips, stops):
+    destinations = [
+        Destination(name=f"Place {i}", latitude=-8.4, longitude=115.1, country="Indonesia",
+                    city="Denpasar", place_id=f"place-{i}", formatted_address=f"Street {i}")
+        for i in range(stops)
+    ]
+    db.add_all(destinations)
+    db.flush()
+    for t in range(trips):
+        trip = Trip(user_id=user.id, title=f"Trip {t}", start_date=date(2025, 1, t + 1),
+                    end_date=date(2025, 1, t + 2))
+        db.add(trip)
+        db.flush()
+        db.add_all([
+            TripDestination(trip_id=trip.id, destination_id=destination.id,
+                            day_number=1 + i // 3, order=i % 3)
+            for i, destination in enumerate(destinations)
+        ])
+    db.commit()
+    db.expunge_all()
+
+
+@pytest.mark.parametrize("trips,stops", [(2, 2), (20, 10)])
+def test_list_trips_query_count_is_constant(db, user, client, count_queries, trips, stops):
+    make_trips(db, user, trips, stops)
+
+    with count_queries() as statements:
+        response = client.get("/api/v1/trips/")
+
+    assert response.status_code == 200
+    body = response.json()
+    assert len(body) == trips
+    assert all(len(trip["destinations"]) == stops for trip in body)
+    assert body[0]["destinations"][0]["destination"]["name"] == "Place 0"
+    # trips, their stops, and the stops' destinations
+    assert len(statements) == 3
+
+
+def test_get_trip_loads_graph_eagerly(db, user, client, count_queries):
+    make_trips(db, user, 1, 5)
+    trip_id = db.query(Trip.id).scalar()
+
+    with count_queries() as statements:
+        response = client.get(f"/api/v1/trips/{trip_id}")
+
+    assert response.status_code == 200
+    assert len(response.json()["destinations"]) == 5
+    assert len(statements) == 3
+
+
+def test_list_trips_cursor_pagination(db, user, client):
+    make_trips(db, user, 5, 1)
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/api/v1/trips/", params=params)
+        assert response.status_code == 200
+        seen.extend(trip["title"] for trip in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert seen == [f"Trip {t}" for t in reversed(range(5))]
+
+
+def test_next_cursor_is_readable_cross_origin(db, user, client):
+    make_trips(db, user, 3, 1)
+
+    response = client.get("/api/v1/trips/", params={"limit": 2}, headers={"Origin": "http://localhost:5173"})
+
+    assert response.headers["X-Next-Cursor"]
+    assert "x-next-cursor" in response.headers["Access-Control-Expose-Headers"].lower()
+
+
+def test_list_trips_rejects_bad_cursor(client):
+    response = client.get("/api/v1/trips/", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+def test_reorder_keeps_stop_ids_and_writes_only_changes(db, user, client, count_queries):
+    make_trips(db, user, 1, 3)
+    trip = client.get("/api/v1/trips/").json()[0]
+    first, second, third = trip["destinations"]
+
+    payload = {"destinations": [
+        {"id": second["id"], "destination_id": second["destination_id"], "day_number": 1, "order": 0},
+        {"id": first["id"], "destination_id": first["destination_id"], "day_number": 1, "order": 1},
+        {"id": third["id"], "destination_id": third["destination_id"], "day_number": 1, "order": 2},
+    ]}
+    with count_queries() as statements:
+        response = client.put(f"/api/v1/trips/{trip['id']}/reorder", json=payload)
+
+    assert response.status_code == 200
+    stops = sorted(response.json()["destinations"], key=lambda stop: stop["order"])
+    assert [stop["id"] for stop in stops] == [second["id"], first["id"], third["id"]]
+    assert not any(s.lstrip().upper().startswith(("DELETE", "INSERT")) for s in statements)
+
+
+def test_move_stop_to_another_day(db, user, client):
+    make_trips(db, user, 1, 4)
+    trip = client.get("/api/v1/trips/").json()[0]
+    moved = trip["destinations"][0]
+
+    response = client.patch(
+        f"/api/v1/trips/{trip['id']}/destinations/{moved['id']}/move",
+        json={"day_number": 2, "position": 1},
+    )
+
+    assert response.status_code == 200
+    stops = response.json()["destinations"]
+    day_two = sorted((s for s in stops if s["day_number"] == 2), key=lambda s: s["order"])
+    assert [s["id"] for s in day_two][1] == moved["id"]
+    assert len(stops) == 4
+
+
+def test_stops_are_checked_like_a_new_trip_when_moved_or_added(db, user, client):
+    make_trips(db, user, 1, 2)
+    trip = client.get("/api/v1/trips/").json()[0]
+    first, second = trip["destinations"]
+    keep = [{"id": stop["id"], "destination_id": stop["destination_id"], "day_number": 1, "order": stop["order"]}
+            for stop in (first, second)]
+
+    unknown = client.put(f"/api/v1/trips/{trip['id']}/reorder", json={"destinations": keep + [
+        {"destination_id": 9999, "day_number": 1, "order": 2},
+    ]})
+    past_the_end = client.patch(
+        f"/api/v1/trips/{trip['id']}/destinations/{first['id']}/move",
+        json={"day_number": 3, "position": 0},
+    )
+
+    assert unknown.status_code == 404
+    assert past_the_end.status_code == 400
+    assert client.get(f"/api/v1/trips/{trip['id']}").json()["destinations"] == trip["destinations"]
+
+
+def test_create_trip_with_missing_destination_writes_nothing(db, user, client):
+    make_trips(db, user, 0, 2)
+    ids = [row[0] for row in db.query(Destination.id)]
+
+    response = client.post("/api/v1/trips/", json={
+        "title": "Broken", "start_date": "2025-02-01", "end_date": "2025-02-03",
+        "destinations": [{"destination_id": i, "day_number": 1, "order": n}
+                         for n, i in enumerate(ids + [9999])],
+    })
+
+    assert response.status_code == 404
+    assert db.query(Trip).count() == 0
+
+
+def test_create_trip_statement_count_does_not_grow_with_stops(db, user, client, count_queries):
+    make_trips(db, user, 0, 30)
+    ids = [row[0] for row in db.query(Destination.id)]
+
+    with count_queries() as statements:
+        response = client.post("/api/v1/trips/", json={
+            "title": "Long", "start_date": "2025-02-01", "end_date": "2025-02-10",
+            "destinations": [{"destination_id": i, "day_number": 1 + n // 5, "order": n % 5}
+                             for n, i in enumerate(ids)],
+        })
+
+    assert response.status_code == 200
+    assert len(response.json()["destinations"]) == 30
+    assert len(statements) < 10
+
+
+def test_import_and_export_ndjson(db, user, client):
+    make_trips(db, user, 0, 2)
+    ids = [row[0] for row in db.query(Destination.id)]
+    trip = {"title": "Imported", "start_date": "2025-03-01", "end_date": "2025-03-02",
+            "destinations": [{"destination_id": ids[0], "day_number": 1, "order": 0}]}
+    body = "\n".join([
+        json.dumps(trip),
+        json.dumps({**trip, "end_date": "2025-02-01"}),
+        "{not json",
+        json.dumps({**trip, "destinations": [{"destination_id": 9999, "day_number": 1, "order": 0}]}),
+        "",
+        json.dumps({**trip, "title": "Second"}),
+    ])
+
+    response = client.post("/api/v1/trips/import", content=body,
+                           headers={"Content-Type": "application/x-ndjson"})
+
+    assert response.status_code == 200
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [(r["line"], r["status"]) for r in results] == [
+        (1, "created"), (2, "error"), (3, "error"), (4, "error"), (6, "created"),
+    ]
+
+    exported = client.get("/api/v1/trips/export")
+    assert exported.headers["content-type"].startswith("application/x-ndjson")
+    trips = [json.loads(line) for line in exported.text.splitlines()]
+    assert [t["title"] for t in trips] == ["Imported", "Second"]
+    assert trips[0]["destinations"][0]["destination_id"] == ids[0]
+
+    # An export feeds straight back into the import
+    again = client.post("/api/v1/trips/import", content=exported.text)
+    assert all(json.loads(line)["status"] == "created" for line in again.text.splitlines())